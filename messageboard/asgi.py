@@ -8,9 +8,18 @@ https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
 
 import os
+import warnings
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'messageboard.settings')
 
 application = get_asgi_application()
+
+if settings.MESSAGEBOARD_SERVER != 'asgi':
+    warnings.warn(
+        f'Serving ASGI with MESSAGEBOARD_SERVER={settings.MESSAGEBOARD_SERVER!r}: set '
+        'MESSAGEBOARD_SERVER=asgi so database connections are not kept open per thread.',
+        RuntimeWarning,
+    )
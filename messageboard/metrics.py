@@ -0,0 +1,190 @@
+"""In-process request metrics.
+
+``RequestMetricsMiddleware`` records, per URL name, the wall time of each
+request together with the number of SQL queries it ran and the time spent in
+them. The last ``MESSAGEBOARD_METRICS_SAMPLES`` requests of every view are
+kept in a ring buffer for percentiles; totals are kept since process start.
+
+Numbers are per worker process and reset on restart.
+"""
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+DEFAULT_SAMPLES = 1000
+DEFAULT_NPLUSONE_THRESHOLD = 10
+QUANTILES = (0.5, 0.95, 0.99)
+
+_PLACEHOLDER_LIST_RE = re.compile(r'%s(?:\s*,\s*%s)+')
+_current = ContextVar('messageboard_request_queries', default=None)
+
+
+def sql_shape(sql):
+    """``sql`` with ``IN (%s, %s, ...)`` lists collapsed, for grouping repeats."""
+    return _PLACEHOLDER_LIST_RE.sub('%s, ...', sql)
+
+
+class QueryCollector:
+    """Counts and times the queries run while it is the current collector."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[sql_shape(sql)] += 1
+
+    def repeated(self, threshold):
+        """``(shape, count)`` of the most repeated query if it ran more than ``threshold`` times."""
+        if not self.shapes:
+            return None
+        shape, count = self.shapes.most_common(1)[0]
+        return (shape, count) if count > threshold else None
+
+
+@contextmanager
+def collect_queries():
+    """Attribute the queries run inside the block to a new ``QueryCollector``."""
+    collector = QueryCollector()
+    token = _current.set(collector)
+    try:
+        yield collector
+    finally:
+        _current.reset(token)
+
+
+def _record_query(execute, sql, params, many, context):
+    collector = _current.get()
+    if collector is None:
+        return execute(sql, params, many, context)
+    return collector(execute, sql, params, many, context)
+
+
+def _install(connection):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def install_query_hook():
+    """Route the queries of every database connection through the current collector.
+
+    The collector lives in a context variable, so queries run from
+    ``sync_to_async`` threads of an async view are attributed to it as well.
+    """
+    connection_created.connect(
+        lambda sender, connection, **kwargs: _install(connection),
+        weak=False, dispatch_uid='messageboard.metrics',
+    )
+    for connection in connections.all(initialized_only=True):
+        _install(connection)
+
+
+def _percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ViewMetrics:
+    def __init__(self, samples):
+        self.samples = deque(maxlen=samples)
+        self.count = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.db_duration = 0.0
+        self.nplusone = 0
+        self.last_nplusone = None
+
+    def add(self, duration, queries, db_duration, repeated):
+        self.samples.append((duration, queries, db_duration))
+        self.count += 1
+        self.duration += duration
+        self.queries += queries
+        self.db_duration += db_duration
+        if repeated is not None:
+            self.nplusone += 1
+            self.last_nplusone = repeated
+
+    def summary(self):
+        columns = list(zip(*self.samples)) or [(), (), ()]
+        durations, queries, db_durations = (sorted(column) for column in columns)
+        return {
+            'count': self.count,
+            'duration_sum': self.duration,
+            'queries_sum': self.queries,
+            'db_duration_sum': self.db_duration,
+            'duration': {q: _percentile(durations, q) for q in QUANTILES},
+            'queries': {q: _percentile(queries, q) for q in QUANTILES},
+            'db_duration': {q: _percentile(db_durations, q) for q in QUANTILES},
+            'nplusone': self.nplusone,
+            'last_nplusone': self.last_nplusone,
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def record(self, view, duration, queries, db_duration, repeated=None):
+        with self._lock:
+            metrics = self._views.get(view)
+            if metrics is None:
+                samples = getattr(settings, 'MESSAGEBOARD_METRICS_SAMPLES', DEFAULT_SAMPLES)
+                metrics = self._views[view] = ViewMetrics(samples)
+            metrics.add(duration, queries, db_duration, repeated)
+
+    def snapshot(self):
+        """``{view: summary}`` for every view seen so far, sorted by view name."""
+        with self._lock:
+            return {view: self._views[view].summary() for view in sorted(self._views)}
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+registry = MetricsRegistry()
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(snapshot=None):
+    """Render a snapshot in the Prometheus text exposition format."""
+    snapshot = registry.snapshot() if snapshot is None else snapshot
+    lines = []
+    for metric, key, help_text in (
+        ('messageboard_request_duration_seconds', 'duration', 'Wall time of a request.'),
+        ('messageboard_request_queries', 'queries', 'SQL queries run by a request.'),
+        ('messageboard_request_db_duration_seconds', 'db_duration', 'Time a request spent in SQL queries.'),
+    ):
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} summary')
+        for view, summary in snapshot.items():
+            label = f'view="{_label(view)}"'
+            for q, value in summary[key].items():
+                lines.append(f'{metric}{{{label},quantile="{q}"}} {value}')
+            lines.append(f'{metric}_sum{{{label}}} {summary[key + "_sum"]}')
+            lines.append(f'{metric}_count{{{label}}} {summary["count"]}')
+    metric = 'messageboard_nplusone_requests_total'
+    lines.append(f'# HELP {metric} Requests that repeated one SQL statement more than the threshold.')
+    lines.append(f'# TYPE {metric} counter')
+    for view, summary in snapshot.items():
+        lines.append(f'{metric}{{view="{_label(view)}"}} {summary["nplusone"]}')
+    return '\n'.join(lines) + '\n'
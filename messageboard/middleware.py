@@ -0,0 +1,168 @@
+import logging
+import mimetypes
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from .metrics import DEFAULT_NPLUSONE_THRESHOLD, collect_queries, install_query_hook, registry
+
+logger = logging.getLogger('messageboard.metrics')
+
+
+class RequestMetricsMiddleware:
+    """Record wall time, query count and query time per URL name.
+
+    Requests that run the same SQL statement more than
+    ``MESSAGEBOARD_NPLUSONE_THRESHOLD`` times are logged as likely N+1
+    patterns and counted for the view.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        install_query_hook()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with collect_queries() as collector:
+            try:
+                return self.get_response(request)
+            finally:
+                self.record(request, time.perf_counter() - start, collector)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with collect_queries() as collector:
+            try:
+                return await self.get_response(request)
+            finally:
+                self.record(request, time.perf_counter() - start, collector)
+
+    def record(self, request, duration, collector):
+        match = request.resolver_match
+        view = match.view_name if match is not None else '<unresolved>'
+        threshold = getattr(settings, 'MESSAGEBOARD_NPLUSONE_THRESHOLD', DEFAULT_NPLUSONE_THRESHOLD)
+        repeated = collector.repeated(threshold)
+        if repeated is not None:
+            logger.warning('Possible N+1 in %s: %d runs of %s', view, repeated[1], repeated[0])
+        registry.record(view, duration, collector.count, collector.duration, repeated)
+
+
+# Hashed names change with their content, so browsers may keep them for good.
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Unhashed names (e.g. icons the PWA manifest points at) are revalidated.
+REVALIDATE_CACHE_CONTROL = 'public, max-age=300'
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def accepted_codings(header):
+    """``{coding: q}`` from an ``Accept-Encoding`` header, lowercased.
+
+    A coding without a ``q`` parameter gets 1; one with a malformed value
+    is treated as refused.
+    """
+    codings = {}
+    for part in header.split(','):
+        coding, *params = (item.strip() for item in part.split(';'))
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding.lower()] = q
+    return codings
+
+
+def choose_encoding(header, available):
+    """The coding of ``available`` the client prefers, or ``None`` for identity.
+
+    Codings refused with ``q=0`` are never chosen; ``*`` stands for any
+    coding the header does not name. Ties go to the order of ``available``.
+    """
+    codings = accepted_codings(header)
+    best, best_q = None, 0.0
+    for coding in available:
+        q = codings.get(coding, codings.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class StaticFilesMiddleware:
+    """Serve ``STATIC_ROOT`` under ``STATIC_URL`` as ``collectstatic`` left it.
+
+    A precompressed variant is sent when the client accepts its encoding,
+    and content-hashed names get a far-future ``Cache-Control``. Other
+    requests, and static URLs with no collected file, go to the next
+    middleware unchanged. Keep it near the top of ``MIDDLEWARE`` so static
+    requests skip sessions, auth and the request metrics.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.prefix = settings.STATIC_URL
+        self.root = settings.STATIC_ROOT
+        self.hashed_names = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.serve(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        # Small files from the page cache; not worth a thread hop.
+        return self.serve(request) or await self.get_response(request)
+
+    def serve(self, request):
+        if request.method not in ('GET', 'HEAD') or not self.root or not request.path.startswith(self.prefix):
+            return None
+        name = request.path[len(self.prefix):]
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        stat = os.stat(path)
+        if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+            response = HttpResponseNotModified()
+        else:
+            content_type, _ = mimetypes.guess_type(name)
+            variants = {coding: path + suffix for coding, suffix in ENCODINGS if os.path.isfile(path + suffix)}
+            encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), variants)
+            if encoding:
+                path = variants[encoding]
+            with open(path, 'rb') as f:
+                response = HttpResponse(f.read(), content_type=content_type or 'application/octet-stream')
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if name in self.hashed_names else REVALIDATE_CACHE_CONTROL
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
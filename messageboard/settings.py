@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,12 +43,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'messageboard.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'messageboard.middleware.RequestMetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'messageboard.urls'
@@ -55,7 +58,7 @@ ROOT_URLCONF = 'messageboard.urls'
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [],
+        'DIRS': [BASE_DIR / 'messageboard' / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -73,13 +76,130 @@ WSGI_APPLICATION = 'messageboard.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# SQLite is tuned for concurrent requests: WAL lets readers run alongside
+# the single writer, write transactions take the write lock up front
+# (IMMEDIATE) so they queue on the busy timeout instead of failing with
+# "database is locked", and connections are kept open between requests.
+# Under ASGI the ORM runs on whatever thread sync_to_async picks and a
+# persistent connection per thread would pile up, so there connections are
+# closed after each request, as Django recommends. MESSAGEBOARD_SERVER says
+# which kind of server the deployment runs (asgi.py warns when it doesn't say
+# asgi); MESSAGEBOARD_CONN_MAX_AGE overrides either default.
+# WAL is recorded in the database file itself; db.sqlite3 is created by
+# `manage.py migrate` and not tracked.
+
+MESSAGEBOARD_SERVER = os.environ.get('MESSAGEBOARD_SERVER', 'wsgi')
+
+SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', 20))
+CONN_MAX_AGE = int(os.environ.get('MESSAGEBOARD_CONN_MAX_AGE', 0 if MESSAGEBOARD_SERVER == 'asgi' else 600))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': SQLITE_BUSY_TIMEOUT,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA mmap_size=134217728;'
+                'PRAGMA cache_size=-20000;'
+                'PRAGMA temp_store=MEMORY'
+            ),
+        },
     }
 }
 
+# Messages archived by `manage.py archive_messages` go to their own SQLite
+# file when MESSAGEBOARD_ARCHIVE_DB names one (migrate it with
+# `manage.py migrate --database archive`), and to the tables in the default
+# database otherwise. See messaging.routers.
+
+if os.environ.get('MESSAGEBOARD_ARCHIVE_DB'):
+    DATABASES['archive'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['MESSAGEBOARD_ARCHIVE_DB'],
+    }
+
+DATABASE_ROUTERS = ['messaging.routers.ArchiveRouter']
+
+
+# Cache
+# Holds rendered message cards and profiles, version counters and counts.
+# The in-process cache is per worker; set MESSAGEBOARD_CACHE_DIR to share one
+# file-based cache between workers instead.
+
+if os.environ.get('MESSAGEBOARD_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['MESSAGEBOARD_CACHE_DIR'],
+            'TIMEOUT': 60 * 60 * 24,
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        },
+        'sessions': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(os.environ['MESSAGEBOARD_CACHE_DIR'], 'sessions'),
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'messageboard',
+            'TIMEOUT': 60 * 60 * 24,
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        },
+        'sessions': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'messageboard-sessions',
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        },
+    }
+
+# Whether every worker process sees the same cache. Values that a write in
+# one worker invalidates by bumping a version (the feed ETag, for one) are
+# only trusted across requests when it does: with the per-process cache the
+# other workers would never see the bump. See messaging.caching.is_shared.
+MESSAGEBOARD_SHARED_CACHE = 'LocMemCache' not in CACHES['default']['BACKEND']
+
+
+# Sessions
+# MESSAGEBOARD_SESSION_BACKEND picks the engine:
+#   cached_db       reads from the 'sessions' cache and falls back to the
+#                   database, so sessions survive restarts (the default with
+#                   a shared cache);
+#   cache           the 'sessions' cache only, lost on eviction or restart;
+#   signed_cookies  the session data lives in a signed cookie, nothing is
+#                   stored server-side;
+#   db              Django's default, one query per request (the default
+#                   with the per-process cache).
+# The two cache engines need MESSAGEBOARD_CACHE_DIR: with the per-process
+# cache, logging out in one worker would leave the session cached, and
+# valid, in every other worker, so they fall back to db. Sessions are written
+# only when modified. Expired rows left by the db engines are removed with
+# `manage.py purge_sessions`. With a shared cache the signed-in user is cached
+# too (messaging.auth.CachedModelBackend), so most requests resolve
+# request.user without touching the database.
+
+SESSION_BACKEND = os.environ.get('MESSAGEBOARD_SESSION_BACKEND', 'cached_db')
+if SESSION_BACKEND in ('cache', 'cached_db') and not MESSAGEBOARD_SHARED_CACHE:
+    SESSION_BACKEND = 'db'
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + SESSION_BACKEND
+SESSION_CACHE_ALIAS = 'sessions'
+SESSION_SAVE_EVERY_REQUEST = False
+
+# ModelBackend stays listed so sessions signed in before CachedModelBackend
+# was added (which record ModelBackend as their backend) still resolve.
+AUTHENTICATION_BACKENDS = [
+    'messaging.auth.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -115,10 +235,63 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
-import os
-
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'messaging', 'static')]
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# collectstatic writes content-hashed copies plus gzip (and, with the brotli
+# package installed, brotli) variants into STATIC_ROOT, and
+# StaticFilesMiddleware serves them with a far-future Cache-Control. The
+# collected tree is build output and not tracked: run collectstatic when
+# deploying. Templates resolve {% static %} through
+# STATIC_ROOT/staticfiles.json whenever DEBUG is off, so the test runner
+# collects into a temporary STATIC_ROOT first.
+
+TEST_RUNNER = 'messageboard.testing.CollectStaticTestRunner'
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'messageboard.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
 LOGIN_URL = '/login/'
+
+# Live updates
+# Backend that fans wall events out to connected Server-Sent Events clients.
+# The in-process hub needs no broker but only reaches clients of the same
+# ASGI process.
+
+MESSAGING_EVENT_BACKEND = 'messaging.events.InProcessBackend'
+
+# Reaction counters
+# When enabled, reaction counter updates are buffered in memory and written
+# as one UPDATE per message every MESSAGING_REACTION_FLUSH_INTERVAL seconds.
+# Off by default: a crash loses the pending deltas until reconcile_reactions
+# is run, and each process only sees its own. See `manage.py bench_reactions`
+# for the throughput it buys.
+
+MESSAGING_REACTION_BUFFER = False
+MESSAGING_REACTION_FLUSH_INTERVAL = 2.0
+
+# Write retries
+# Write transactions that still find the database locked after the busy
+# timeout are retried this many times, with exponential backoff starting at
+# MESSAGING_DB_RETRY_BACKOFF seconds.
+
+MESSAGING_DB_RETRY_ATTEMPTS = 5
+MESSAGING_DB_RETRY_BACKOFF = 0.05
+
+# Request metrics
+# RequestMetricsMiddleware keeps the last MESSAGEBOARD_METRICS_SAMPLES requests
+# of each view for percentiles (see /metrics/dashboard/). Requests that repeat
+# one SQL statement more than MESSAGEBOARD_NPLUSONE_THRESHOLD times are logged
+# as likely N+1 queries. /metrics/ serves Prometheus text to staff users or to
+# "Authorization: Bearer <MESSAGEBOARD_METRICS_TOKEN>" when a token is set.
+
+MESSAGEBOARD_METRICS_SAMPLES = 1000
+MESSAGEBOARD_NPLUSONE_THRESHOLD = 10
+MESSAGEBOARD_METRICS_TOKEN = os.environ.get('MESSAGEBOARD_METRICS_TOKEN', '')
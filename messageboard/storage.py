@@ -0,0 +1,57 @@
+"""Static files storage for deployment.
+
+``collectstatic`` writes every asset under a content-hashed name (through
+Django's manifest storage) and, next to each text asset, gzip and brotli
+variants so ``StaticFilesMiddleware`` can serve them without compressing
+per request. Brotli variants are only written when the ``brotli`` package
+is installed; the ``brotli_quality`` option trades their size for speed.
+"""
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.json', '.map', '.svg', '.txt', '.xml', '.html', '.ico')
+# Smaller files are not worth the extra request header and file lookup.
+MIN_COMPRESS_SIZE = 256
+
+
+def _compressors(brotli_quality):
+    yield '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+    if brotli is not None:
+        yield '.br', lambda data: brotli.compress(data, quality=brotli_quality)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def __init__(self, *args, brotli_quality=11, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.brotli_quality = brotli_quality
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name, hashed_name in self.hashed_files.items():
+            for path in {name, hashed_name}:
+                if path.endswith(COMPRESSIBLE_EXTENSIONS):
+                    self.compress(path)
+
+    def compress(self, name):
+        """Write the variants of ``name`` that come out smaller than it."""
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return
+        for suffix, compress in _compressors(self.brotli_quality):
+            compressed = compress(data)
+            if len(compressed) < len(data) * 0.95:
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+            elif os.path.exists(path + suffix):
+                os.remove(path + suffix)
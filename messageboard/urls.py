@@ -17,7 +17,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from . import views
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics/', views.prometheus_metrics, name='metrics'),
+    path('metrics/dashboard/', views.metrics_dashboard, name='metrics_dashboard'),
     path('', include('messaging.urls')),
 ]
@@ -0,0 +1,42 @@
+import hmac
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, HttpResponseForbidden
+from django.shortcuts import render
+from django.views.decorators.http import require_GET
+
+from .metrics import QUANTILES, prometheus_text, registry
+
+
+@staff_member_required
+@require_GET
+def metrics_dashboard(request):
+    views = registry.snapshot()
+    rows = sorted(views.items(), key=lambda item: item[1]['duration'][0.95], reverse=True)
+    return render(request, 'messageboard/metrics.html', {
+        'rows': [
+            {
+                'view': view,
+                'count': summary['count'],
+                'duration_ms': [summary['duration'][q] * 1000 for q in QUANTILES],
+                'queries': [summary['queries'][q] for q in QUANTILES],
+                'db_ms': [summary['db_duration'][q] * 1000 for q in QUANTILES],
+                'nplusone': summary['nplusone'],
+                'last_nplusone': summary['last_nplusone'],
+            }
+            for view, summary in rows
+        ],
+        'quantiles': [f'p{int(q * 100)}' for q in QUANTILES],
+    })
+
+
+@require_GET
+def prometheus_metrics(request):
+    """Metrics for Prometheus; open to staff or to ``Authorization: Bearer <MESSAGEBOARD_METRICS_TOKEN>``."""
+    token = getattr(settings, 'MESSAGEBOARD_METRICS_TOKEN', '')
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    allowed = request.user.is_staff or (token and hmac.compare_digest(supplied, token))
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
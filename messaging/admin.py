@@ -1,37 +1,117 @@
 from django.contrib import admin
-from .models import Message, Reply, Reaction, Profile, Task
+from .models import Message, MessageReactionCount, Reply, Reaction, Profile, Task
+from . import reaction_types, search
+from .fragments import invalidate_card
+from .pagination import EstimatedCountPaginator
+from .replies import recount_replies
+from .tasks import invalidate_task_counts
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    # Changelists over tables with millions of rows: no COUNT(*) of the whole
+    # table (estimated by the paginator, and no second unfiltered count next
+    # to a filtered one) and pickers that search instead of listing every row.
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class ReactionTypeFilter(admin.SimpleListFilter):
+    # The registry instead of a SELECT DISTINCT over every reaction.
+    title = 'reaction type'
+    parameter_name = 'reaction_type'
+
+    def lookups(self, request, model_admin):
+        return [(reaction_type.name, reaction_type.label) for reaction_type in reaction_types.registered()]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(reaction_type=self.value())
+        return queryset
+
+class MessageReactionCountInline(admin.TabularInline):
+    # Maintained by messaging.counters; rebuilt by reconcile_reactions.
+    model = MessageReactionCount
+    fields = ('reaction_type', 'count')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 @admin.register(Message)
-class MessageAdmin(admin.ModelAdmin):
-    list_display = ('author', 'text_preview', 'timestamp', 'total_reactions')
+class MessageAdmin(LargeTableAdmin):
+    list_display = ('author', 'text_preview', 'timestamp', 'total_reactions', 'reply_count')
     search_fields = ('author__username', 'text')
-    list_filter = ('timestamp', 'author')
-    readonly_fields = ('timestamp',)
+    list_filter = ('timestamp',)
+    # Newest first by rowid, and the tie-break the changelist appends to a
+    # column sort, so sorting by reactions follows message_reaction_total_idx.
+    ordering = ('-id',)
+    autocomplete_fields = ('author',)
+    readonly_fields = ('timestamp', 'reaction_total', 'reply_count')
+    inlines = [MessageReactionCountInline]
+
+    def get_queryset(self, request):
+        # Here rather than list_select_related so the autocomplete results,
+        # labelled with the author's name, are joined too.
+        return super().get_queryset(request).select_related('author')
+
+    def get_search_results(self, request, queryset, search_term):
+        # The full-text index rather than LIKE '%term%' over every message.
+        if not search_term:
+            return queryset, False
+        return search.filter_messages(queryset, search_term), False
     
     def text_preview(self, obj):
         return obj.text[:50] + ('...' if len(obj.text) > 50 else '')
     text_preview.short_description = 'Mesaj'
     
     def total_reactions(self, obj):
-        return obj.like_count + obj.laugh_count + obj.sad_count + obj.fire_count + obj.thumbs_up_count + obj.angry_count
+        return obj.reaction_total
     total_reactions.short_description = 'Toplam Tepkiler'
+    # Most reacted first on the first click.
+    total_reactions.admin_order_field = '-reaction_total'
 
 @admin.register(Reply)
-class ReplyAdmin(admin.ModelAdmin):
+class ReplyAdmin(LargeTableAdmin):
     list_display = ('author', 'message', 'timestamp')
+    list_select_related = ('author', 'message__author')
     search_fields = ('author__username', 'text')
     list_filter = ('timestamp',)
+    autocomplete_fields = ('author', 'message')
     readonly_fields = ('timestamp',)
 
+    def save_model(self, request, obj, form, change):
+        previous = form.initial.get('message') if change else None
+        super().save_model(request, obj, form, change)
+        self._replies_changed({obj.message_id, previous} - {None})
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self._replies_changed({obj.message_id})
+
+    def delete_queryset(self, request, queryset):
+        message_ids = set(queryset.values_list('message_id', flat=True))
+        super().delete_queryset(request, queryset)
+        self._replies_changed(message_ids)
+
+    def _replies_changed(self, message_ids):
+        recount_replies(message_ids)
+        for message_id in message_ids:
+            invalidate_card(message_id)
+
 @admin.register(Reaction)
-class ReactionAdmin(admin.ModelAdmin):
+class ReactionAdmin(LargeTableAdmin):
     list_display = ('user', 'message', 'reaction_type')
+    list_select_related = ('user', 'message__author')
     search_fields = ('user__username', 'reaction_type')
-    list_filter = ('reaction_type',)
+    list_filter = (ReactionTypeFilter,)
+    autocomplete_fields = ('user', 'message')
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'location', 'created_at')
+    list_select_related = ('user',)
     search_fields = ('user__username', 'location')
     readonly_fields = ('created_at', 'updated_at')
 
@@ -50,3 +130,17 @@ class TaskAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+    # The board's cached status counts are only dropped by the code that
+    # changes tasks; the admin is one of those.
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        invalidate_task_counts()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_task_counts()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        invalidate_task_counts()
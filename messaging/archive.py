@@ -0,0 +1,347 @@
+"""Hot/cold archival of old messages.
+
+Almost every request reads the newest messages, so messages older than a
+cutoff are moved -- replies and reactions included -- to the archive tables
+by ``archive_messages``, a batch per transaction, and moved back under their
+original ids by ``restore_messages``. The archive tables live in their own
+database when one is configured (see messaging.routers).
+
+Archived messages stay readable. ``ReadThroughPaginator`` carries the keyset
+pages of the wall, a search or a profile on into the archive, and
+``as_messages`` turns archived rows into read-only ``Message`` instances the
+card templates render as usual. The archive is only queried once a page
+reaches past the newest archived message, so pages of recent messages cost
+what they did before.
+"""
+import heapq
+from collections import Counter
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, Prefetch, Q, prefetch_related_objects
+
+from . import reaction_types, search
+from .caching import bump_version, forget_count, get_version
+from .fragments import invalidate_card
+from .models import ArchivedMessage, ArchivedReaction, ArchivedReply, Message, MessageReactionCount, Reaction, Reply
+from .pagination import KeysetPaginator
+from .replies import REPLIES_PER_PAGE, REPLIES_PREVIEW, REPLY_ORDERING
+from .routers import archive_db
+from .transactions import retry_on_lock
+
+ARCHIVE_BATCH_SIZE = 500
+ARCHIVE_ORDERING = ('-timestamp', '-id')
+NEWEST_TIMEOUT = 60 * 5
+
+
+@contextmanager
+def _atomic():
+    # The archive transaction is inside, so it commits first: a failure
+    # between the two commits leaves a batch in both places rather than in
+    # neither. Archiving, restoring and reading all tolerate the overlap.
+    with transaction.atomic(using=DEFAULT_DB_ALIAS), transaction.atomic(using=archive_db()):
+        yield
+
+
+def _moved(messages):
+    """Let caches and open pages catch up with messages that changed tables."""
+    for message in messages:
+        invalidate_card(message.pk)
+    for author_id in {message.author_id for message in messages}:
+        bump_version(f'profile:{author_id}')
+    bump_version('archive')
+    bump_version('board')
+    forget_count('messages')
+    forget_count('archived-messages')
+
+
+def archive_messages(before, batch_size=ARCHIVE_BATCH_SIZE, limit=None):
+    """Move messages posted before ``before`` to the archive, oldest first.
+
+    Yields the number of messages moved by each batch. ``limit`` caps the
+    total for one run.
+    """
+    moved = 0
+    while limit is None or moved < limit:
+        count = _archive_batch(before, batch_size if limit is None else min(batch_size, limit - moved))
+        if not count:
+            return
+        moved += count
+        yield count
+
+
+@retry_on_lock
+def _archive_batch(before, size):
+    with _atomic():
+        messages = list(Message.objects.filter(timestamp__lt=before).order_by('timestamp', 'id')[:size])
+        if not messages:
+            return 0
+        ids = [message.pk for message in messages]
+        replies = list(Reply.objects.filter(message_id__in=ids))
+        reactions = list(Reaction.objects.filter(message_id__in=ids))
+        # Totals from the rows themselves, which also settles any drift in
+        # the live counters.
+        reaction_totals = Counter(reaction.message_id for reaction in reactions)
+        reply_counts = Counter(reply.message_id for reply in replies)
+
+        ArchivedMessage.objects.bulk_create([
+            ArchivedMessage(
+                id=message.pk, text=message.text, author_id=message.author_id, timestamp=message.timestamp,
+                reaction_total=reaction_totals[message.pk], reply_count=reply_counts[message.pk],
+            )
+            for message in messages
+        ], ignore_conflicts=True)
+        ArchivedReply.objects.bulk_create([
+            ArchivedReply(
+                id=reply.pk, message_id=reply.message_id, text=reply.text, emoji=reply.emoji,
+                author_id=reply.author_id, timestamp=reply.timestamp,
+            )
+            for reply in replies
+        ], ignore_conflicts=True)
+        ArchivedReaction.objects.bulk_create([
+            ArchivedReaction(
+                id=reaction.pk, user_id=reaction.user_id, message_id=reaction.message_id,
+                reaction_type=reaction.reaction_type,
+            )
+            for reaction in reactions
+        ], ignore_conflicts=True)
+        # Cascades to the replies, reactions and count rows, and unindexes
+        # the messages from search.
+        Message.objects.filter(pk__in=ids).delete()
+    _moved(messages)
+    return len(messages)
+
+
+def restore_messages(archived, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move the messages in the ``archived`` queryset back to the live tables.
+
+    Yields ``(restored, skipped)`` per batch. Messages whose author has been
+    deleted are skipped and stay archived, as are replies and reactions by
+    deleted users.
+    """
+    last_id = 0
+    while True:
+        batch = list(archived.filter(pk__gt=last_id).order_by('pk')[:batch_size])
+        if not batch:
+            return
+        last_id = batch[-1].pk
+        restored = _restore_batch(batch)
+        yield restored, len(batch) - restored
+
+
+@retry_on_lock
+def _restore_batch(batch):
+    ids = [message.pk for message in batch]
+    replies = list(ArchivedReply.objects.filter(message_id__in=ids))
+    reactions = list(ArchivedReaction.objects.filter(message_id__in=ids))
+    users = get_user_model().objects.in_bulk(
+        {message.author_id for message in batch}
+        | {reply.author_id for reply in replies}
+        | {reaction.user_id for reaction in reactions}
+    )
+    messages = [message for message in batch if message.author_id in users]
+    if not messages:
+        return 0
+    restored_ids = {message.pk for message in messages}
+    replies = [reply for reply in replies if reply.message_id in restored_ids and reply.author_id in users]
+    reactions = [
+        reaction for reaction in reactions if reaction.message_id in restored_ids and reaction.user_id in users
+    ]
+    counts = Counter((reaction.message_id, reaction.reaction_type) for reaction in reactions)
+    reaction_totals = Counter(reaction.message_id for reaction in reactions)
+    reply_counts = Counter(reply.message_id for reply in replies)
+
+    live_messages = [
+        Message(
+            id=message.pk, text=message.text, author=users[message.author_id],
+            reaction_total=reaction_totals[message.pk], reply_count=reply_counts[message.pk],
+        )
+        for message in messages
+    ]
+    live_replies = [
+        Reply(id=reply.pk, message_id=reply.message_id, text=reply.text, emoji=reply.emoji, author_id=reply.author_id)
+        for reply in replies
+    ]
+    with _atomic():
+        Message.objects.bulk_create(live_messages, ignore_conflicts=True)
+        Reply.objects.bulk_create(live_replies, ignore_conflicts=True)
+        # auto_now_add stamps the inserted rows with the current time; put
+        # the original timestamps back.
+        for live, message in zip(live_messages, messages):
+            live.timestamp = message.timestamp
+        for live, reply in zip(live_replies, replies):
+            live.timestamp = reply.timestamp
+        Message.objects.bulk_update(live_messages, ['timestamp'])
+        Reply.objects.bulk_update(live_replies, ['timestamp'])
+        Reaction.objects.bulk_create([
+            Reaction(id=reaction.pk, user_id=reaction.user_id, message_id=reaction.message_id,
+                     reaction_type=reaction.reaction_type)
+            for reaction in reactions
+        ], ignore_conflicts=True)
+        MessageReactionCount.objects.bulk_create([
+            MessageReactionCount(message_id=message_id, reaction_type=reaction_type, count=count)
+            for (message_id, reaction_type), count in counts.items()
+        ], ignore_conflicts=True)
+        for message in live_messages:
+            search.index_message(message)
+        ArchivedMessage.objects.filter(pk__in=restored_ids).delete()
+    _moved(messages)
+    return len(messages)
+
+
+def _newest_key():
+    return f'messaging:archive-newest:{get_version("archive")}'
+
+
+def newest_archived():
+    """``(timestamp, id)`` of the newest archived message, or ``None``; cached."""
+    key = _newest_key()
+    newest = cache.get(key)
+    if newest is None:
+        newest = ArchivedMessage.objects.order_by(*ARCHIVE_ORDERING).values_list('timestamp', 'id').first() or ()
+        cache.set(key, tuple(newest), NEWEST_TIMEOUT)
+    return tuple(newest) or None
+
+
+async def anewest_archived():
+    """Async ``newest_archived``."""
+    key = _newest_key()
+    newest = await cache.aget(key)
+    if newest is None:
+        newest = await ArchivedMessage.objects.order_by(*ARCHIVE_ORDERING).values_list('timestamp', 'id').afirst() or ()
+        await cache.aset(key, tuple(newest), NEWEST_TIMEOUT)
+    return tuple(newest) or None
+
+
+def filter_archived(archived, query):
+    """Restrict ``archived`` to messages whose text contains every word of ``query``.
+
+    The archive has no full-text index and is not searched by author;
+    archived matches are the rare, slower path.
+    """
+    words = search.tokens(query)
+    if not words:
+        return archived.none()
+    condition = Q()
+    for word in words:
+        condition &= Q(text__icontains=word)
+    return archived.filter(condition)
+
+
+def archived_reply_paginator(message_id, per_page=REPLIES_PER_PAGE):
+    """``replies.reply_paginator`` for an archived message; pages hold ``ArchivedReply`` rows."""
+    return KeysetPaginator(ArchivedReply.objects.filter(message_id=message_id), per_page, ordering=REPLY_ORDERING)
+
+
+def as_replies(archived_replies, users=None):
+    """Unsaved ``Reply`` instances for ``archived_replies``, for the reply template."""
+    if users is None:
+        users = get_user_model().objects.in_bulk({reply.author_id for reply in archived_replies})
+    return [
+        Reply(
+            id=reply.pk, message_id=reply.message_id, text=reply.text, emoji=reply.emoji,
+            author=users[reply.author_id], timestamp=reply.timestamp,
+        )
+        for reply in archived_replies if reply.author_id in users
+    ]
+
+
+def as_messages(archived):
+    """Read-only ``Message`` instances for ``archived`` rows, ready for the card templates.
+
+    Reaction counts, the latest replies and the authors are loaded with one
+    query each. Messages whose author has been deleted are left out, as the
+    live ones are deleted with their author.
+    """
+    if not archived:
+        return []
+    counts = {row.pk: dict.fromkeys(reaction_types.names(), 0) for row in archived}
+    reacted = [row.pk for row in archived if row.reaction_total]
+    if reacted:
+        rows = (
+            ArchivedReaction.objects.filter(message_id__in=reacted)
+            .order_by().values_list('message_id', 'reaction_type').annotate(n=Count('id'))
+        )
+        for message_id, reaction_type, n in rows:
+            if reaction_type in counts[message_id]:
+                counts[message_id][reaction_type] = n
+
+    with_replies = [row for row in archived if row.reply_count]
+    latest = ArchivedReply.objects.order_by(*REPLY_ORDERING)[:REPLIES_PREVIEW]
+    prefetch_related_objects(with_replies, Prefetch('replies', queryset=latest, to_attr='latest_replies'))
+    users = get_user_model().objects.in_bulk(
+        {row.author_id for row in archived}
+        | {reply.author_id for row in with_replies for reply in row.latest_replies}
+    )
+
+    messages = []
+    for row in archived:
+        if row.author_id not in users:
+            continue
+        message = Message(
+            id=row.pk, text=row.text, author=users[row.author_id], timestamp=row.timestamp,
+            reaction_total=row.reaction_total, reply_count=row.reply_count,
+        )
+        message.archived = True
+        message.set_reaction_counts(counts[row.pk])
+        latest_replies = getattr(row, 'latest_replies', [])[::-1]
+        message.latest_replies = as_replies(latest_replies, users)
+        message.more_replies_cursor = None
+        if row.reply_count > len(latest_replies):
+            message.more_replies_cursor = archived_reply_paginator(row.pk).encode_cursor('next', latest_replies[0])
+        messages.append(message)
+    return messages
+
+
+class ReadThroughPaginator(KeysetPaginator):
+    """Newest-first keyset pagination over messages that carries on into the archive.
+
+    ``archived`` is the ``ArchivedMessage`` queryset matching the same
+    filter as ``queryset``. Cursors are shared, since both are ordered by
+    ``(timestamp, id)`` and ids are kept on archiving. The archive is queried
+    only for pages that reach past its newest message; its rows are merged
+    in as ``as_messages`` instances.
+    """
+
+    def __init__(self, queryset, archived, per_page):
+        super().__init__(queryset, per_page, ordering=ARCHIVE_ORDERING)
+        self.archived = archived
+
+    def page(self, cursor=None):
+        direction, queryset = self._query(cursor)
+        rows = list(queryset)
+        if self._reaches_archive(direction, cursor, rows, newest_archived()):
+            archived = as_messages(list(self._query(cursor, self.archived)[1]))
+            rows = self._merge(direction, rows, archived)
+        return self._page(direction, rows)
+
+    async def apage(self, cursor=None):
+        direction, queryset = self._query(cursor)
+        rows = [row async for row in queryset]
+        if self._reaches_archive(direction, cursor, rows, await anewest_archived()):
+            archived = [row async for row in self._query(cursor, self.archived)[1]]
+            rows = self._merge(direction, rows, await sync_to_async(as_messages)(archived))
+        return self._page(direction, rows)
+
+    def _reaches_archive(self, direction, cursor, rows, newest):
+        if newest is None:
+            return False
+        if direction == 'prev':
+            # Newer than the cursor; every archived message is at or before ``newest``.
+            return tuple(self.decode_cursor(cursor)[1]) < newest
+        # Newest first: a full window that ends after ``newest`` leaves no
+        # room for archived messages.
+        return len(rows) <= self.per_page or (rows[-1].timestamp, rows[-1].pk) < newest
+
+    def _merge(self, direction, rows, archived):
+        merged, seen = [], set()
+        for message in heapq.merge(rows, archived, key=lambda m: (m.timestamp, m.pk), reverse=direction != 'prev'):
+            # A message caught between the two commits of a batch is in
+            # both; the live row comes first.
+            if message.pk not in seen:
+                seen.add(message.pk)
+                merged.append(message)
+        return merged[:self.per_page + 1]
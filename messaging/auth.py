@@ -0,0 +1,50 @@
+"""Authentication backend that keeps signed-in users in the cache.
+
+Django resolves ``request.user`` by loading the user's row on every request.
+With a shared cache (see messaging.caching.is_shared) ``CachedModelBackend``
+keeps that row in the cache for ``USER_CACHE_TIMEOUT`` seconds. Saving or
+deleting a user drops the entry (see messaging.signals), so a password change
+or deactivation still signs other sessions out on their next request.
+Changes made with ``QuerySet.update()`` skip the signals and only show up
+once the entry expires.
+
+With the per-process cache the entry would only be dropped in the worker that
+saved the user, and the others would go on accepting the old password hash
+and ``is_active`` flag, so there every request loads the user as usual.
+"""
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from .caching import is_shared
+
+USER_CACHE_TIMEOUT = 60 * 5
+
+
+def _key(user_id):
+    return f'messaging:auth-user:{user_id}'
+
+
+def forget_user(user_id):
+    cache.delete(_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        if not is_shared():
+            return super().get_user(user_id)
+        user = cache.get(_key(user_id))
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(_key(user_id), user, USER_CACHE_TIMEOUT)
+        return user
+
+    async def aget_user(self, user_id):
+        if not is_shared():
+            return await super().aget_user(user_id)
+        user = await cache.aget(_key(user_id))
+        if user is None:
+            user = await super().aget_user(user_id)
+            if user is not None:
+                await cache.aset(_key(user_id), user, USER_CACHE_TIMEOUT)
+        return user
@@ -0,0 +1,213 @@
+"""Request scenarios for ``manage.py run_benchmarks``.
+
+A scenario turns a ``BenchmarkData`` sample of the database into a list of
+``(method, path, data)`` requests. Drivers replay them either in-process
+through the Django test client (which also counts SQL queries) or over HTTP
+against a running server with several concurrent sessions.
+"""
+import http.cookiejar
+import itertools
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import reaction_types
+from .models import Message, Task
+from .pagination import KeysetPaginator
+
+_WORD_RE = re.compile(r'\w{4,}')
+
+
+class BenchmarkData:
+    """Ids, names and cursors the scenarios request, read once from the database."""
+
+    def __init__(self, deep_page=100):
+        latest = list(Message.objects.order_by('-timestamp', '-id').values('id', 'text', 'author__username')[:50])
+        if not latest:
+            raise ValueError('The database has no messages; run seed_data first.')
+        self.hot_message_ids = [row['id'] for row in latest[:5]]
+
+        words = []
+        for row in latest:
+            words.extend(_WORD_RE.findall(row['text']))
+        self.search_terms = sorted(set(words))[:20] or ['message']
+
+        self.usernames = sorted({row['author__username'] for row in latest})
+
+        paginator = KeysetPaginator(Message.objects.all(), 10)
+        deep = Message.objects.order_by('-timestamp', '-id').only('id', 'timestamp')[deep_page * 10:][:1]
+        self.deep_cursor = paginator.encode_cursor('next', deep[0]) if deep else None
+        self.task_statuses = [status for status, _ in Task.STATUS_CHOICES]
+
+
+def wall_browse(data, n):
+    return [('GET', reverse('message_list'), None)] * n
+
+
+def deep_page(data, n):
+    if data.deep_cursor is None:
+        return []
+    query = urllib.parse.urlencode({'cursor': data.deep_cursor})
+    return [('GET', f"{reverse('message_list')}?{query}", None)] * n
+
+
+def search(data, n):
+    terms = itertools.cycle(data.search_terms)
+    return [('GET', f"{reverse('message_list')}?{urllib.parse.urlencode({'q': next(terms)})}", None)
+            for _ in range(n)]
+
+
+def react_burst(data, n):
+    # Every request toggles a reaction on one of the newest messages.
+    targets = itertools.cycle(itertools.product(data.hot_message_ids, reaction_types.names()))
+    return [('POST', reverse('react', args=next(targets)), {}) for _ in range(n)]
+
+
+def profile_view(data, n):
+    names = itertools.cycle(data.usernames)
+    return [('GET', reverse('profile', args=[next(names)]), None) for _ in range(n)]
+
+
+def task_list_filter(data, n):
+    statuses = itertools.cycle(data.task_statuses)
+    return [('GET', f"{reverse('task_list')}?status={next(statuses)}", None) for _ in range(n)]
+
+
+SCENARIOS = {
+    'wall_browse': wall_browse,
+    'deep_page': deep_page,
+    'search': search,
+    'react_burst': react_burst,
+    'profile_view': profile_view,
+    'task_list_filter': task_list_filter,
+}
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(samples, elapsed):
+    """Aggregate ``(seconds, status, queries)`` samples into a report entry."""
+    latencies = sorted(seconds * 1000 for seconds, _, _ in samples)
+    queries = sorted(count for _, _, count in samples if count is not None)
+    errors = sum(1 for _, status, _ in samples if status is None or status >= 400)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'seconds': round(elapsed, 4),
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 3) if latencies else None,
+            **{f'p{int(q * 100)}': round(percentile(latencies, q), 3) if latencies else None
+               for q in (0.5, 0.95, 0.99)},
+            'max': round(latencies[-1], 3) if latencies else None,
+        },
+        'queries': {
+            'p50': percentile(queries, 0.5),
+            'max': queries[-1] if queries else None,
+        },
+    }
+
+
+class ClientDriver:
+    """Replay requests in-process, one at a time, counting queries per request."""
+
+    def __init__(self, user):
+        self.client = Client()
+        self.client.force_login(user)
+
+    def run(self, requests):
+        samples = []
+        started = time.perf_counter()
+        for method, path, data in requests:
+            with CaptureQueriesContext(connection) as queries:
+                request_started = time.perf_counter()
+                if method == 'POST':
+                    response = self.client.post(path, data or {})
+                else:
+                    response = self.client.get(path)
+                seconds = time.perf_counter() - request_started
+            samples.append((seconds, response.status_code, len(queries)))
+        return samples, time.perf_counter() - started
+
+
+class HttpDriver:
+    """Replay requests against a running server from ``concurrency`` logged-in sessions.
+
+    Each session signs in through the login form as one of ``usernames``.
+    Query counts are not visible from outside the server and are reported as
+    ``None``.
+    """
+
+    def __init__(self, base_url, usernames, password, concurrency=8, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.sessions = [self.login(usernames[i % len(usernames)], password) for i in range(concurrency)]
+
+    def login(self, username, password):
+        jar = http.cookiejar.CookieJar()
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+        login_url = self.base_url + reverse('login')
+        opener.open(login_url, timeout=self.timeout).read()
+        body = urllib.parse.urlencode({
+            'username': username, 'password': password, 'csrfmiddlewaretoken': self.csrf_token(jar),
+        }).encode()
+        opener.open(urllib.request.Request(login_url, body, headers={'Referer': login_url}), timeout=self.timeout)
+        if not any(cookie.name == 'sessionid' for cookie in jar):
+            raise ValueError(f'Could not sign in to {self.base_url} as {username}.')
+        return opener, jar
+
+    def csrf_token(self, jar):
+        return next((cookie.value for cookie in jar if cookie.name == 'csrftoken'), '')
+
+    def send(self, session, method, path, data):
+        opener, jar = session
+        url = self.base_url + path
+        body = None
+        headers = {}
+        if method == 'POST':
+            body = urllib.parse.urlencode(data or {}).encode()
+            headers = {'X-CSRFToken': self.csrf_token(jar), 'Referer': url}
+        started = time.perf_counter()
+        try:
+            with opener.open(urllib.request.Request(url, body, headers, method=method), timeout=self.timeout) as r:
+                r.read()
+                status = r.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except OSError:
+            status = None
+        return time.perf_counter() - started, status, None
+
+    def run(self, requests):
+        lock = threading.Lock()
+        pending = iter(requests)
+        samples = []
+
+        def worker(session):
+            while True:
+                with lock:
+                    request = next(pending, None)
+                if request is None:
+                    return
+                sample = self.send(session, *request)
+                with lock:
+                    samples.append(sample)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            list(pool.map(worker, self.sessions))
+        return samples, time.perf_counter() - started
@@ -0,0 +1,84 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def is_shared():
+    """Whether the cache is shared by every worker process.
+
+    With the per-process cache a version bumped by one worker is invisible
+    to the others, so anything validated by a version must not be served
+    from the cache then.
+    """
+    return getattr(settings, 'MESSAGEBOARD_SHARED_CACHE', False)
+
+
+def _version_key(name):
+    return f'messaging:version:{name}'
+
+
+def get_version(name):
+    """Return the current version number for ``name``.
+
+    Missing keys are seeded from the clock so a cache eviction can never hand
+    out a version that was already used before.
+    """
+    return cache.get_or_set(_version_key(name), lambda: time.time_ns() // 1000, None)
+
+
+def get_versions(names):
+    """``{name: version}`` for many names with a single cache round trip."""
+    keys = {name: _version_key(name) for name in names}
+    versions = cache.get_many(keys.values())
+    missing = [key for key in keys.values() if key not in versions]
+    if missing:
+        seed = time.time_ns() // 1000
+        for key in missing:
+            cache.add(key, seed, None)
+        versions.update(cache.get_many(missing))
+    return {name: versions[key] for name, key in keys.items()}
+
+
+def bump_version(name):
+    key = _version_key(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = time.time_ns() // 1000
+        cache.set(key, version, None)
+        return version
+
+
+COUNT_TIMEOUT = 300
+
+
+def _count_key(name):
+    return f'messaging:count:{name}'
+
+
+def cached_count(name, queryset, timeout=COUNT_TIMEOUT):
+    """Return an approximate row count, recounting at most every ``timeout`` seconds."""
+    return cache.get_or_set(_count_key(name), queryset.count, timeout)
+
+
+async def acached_count(name, queryset, timeout=COUNT_TIMEOUT):
+    """Async ``cached_count``."""
+    count = await cache.aget(_count_key(name))
+    if count is None:
+        count = await queryset.acount()
+        await cache.aset(_count_key(name), count, timeout)
+    return count
+
+
+def adjust_count(name, delta):
+    """Keep a cached count roughly current between recounts."""
+    try:
+        cache.incr(_count_key(name), delta)
+    except ValueError:
+        pass
+
+
+def forget_count(name):
+    """Drop a cached count so the next read recounts, e.g. after a bulk load."""
+    cache.delete(_count_key(name))
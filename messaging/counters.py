@@ -0,0 +1,191 @@
+"""Reaction counts and their write-behind buffer.
+
+A message's counts are one ``MessageReactionCount`` row per reaction type it
+has received plus the ``Message.reaction_total`` column, changed together by
+``apply_deltas``.
+
+With ``MESSAGING_REACTION_BUFFER`` enabled, ``toggle_reaction`` still writes
+the ``Reaction`` row synchronously but leaves the counts to this buffer.
+Deltas are coalesced per message and flushed by a background thread in one
+transaction every ``MESSAGING_REACTION_FLUSH_INTERVAL`` seconds. Reads merge
+the pending deltas so a click is visible immediately.
+
+Pending deltas live in process memory. They are flushed at interpreter exit;
+after a crash the counts can be rebuilt from the ``Reaction`` rows with
+``manage.py reconcile_reactions``.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+
+from . import reaction_types
+from .models import Message, MessageReactionCount
+from .transactions import retry_on_lock
+
+logger = logging.getLogger(__name__)
+
+
+def apply_deltas(message_id, deltas, using=None):
+    """Add ``{reaction_type: delta}`` to a message's counts in the database.
+
+    Only the rows of the types in ``deltas`` are written, each with an
+    ``F()`` increment. The first reaction of a type inserts its row, ignoring
+    the conflict if a concurrent writer got there first, and then increments
+    it like any other. A deleted message is skipped.
+    """
+    summary = MessageReactionCount.objects.using(using).filter(message_id=message_id)
+    messages = Message.objects.using(using).filter(pk=message_id)
+    for reaction_type, delta in deltas.items():
+        if not delta:
+            continue
+        row = summary.filter(reaction_type=reaction_type)
+        if row.update(count=F('count') + delta):
+            continue
+        if not messages.exists():
+            return
+        MessageReactionCount.objects.using(using).bulk_create(
+            [MessageReactionCount(message_id=message_id, reaction_type=reaction_type)], ignore_conflicts=True
+        )
+        row.update(count=F('count') + delta)
+    total = sum(deltas.values())
+    if total:
+        messages.update(reaction_total=F('reaction_total') + total)
+
+
+def get_counts(message_id):
+    """Current counts for a message, including deltas not flushed yet."""
+    counts = dict.fromkeys(reaction_types.names(), 0)
+    rows = MessageReactionCount.objects.filter(message_id=message_id).values_list('reaction_type', 'count')
+    _merge(counts, rows, reaction_buffer.pending(message_id))
+    return counts
+
+
+def _summary_rows(messages):
+    # Messages without reactions have no rows to read.
+    return MessageReactionCount.objects.filter(
+        message_id__in=[message.pk for message in messages if message.reaction_total]
+    ).values_list('message_id', 'reaction_type', 'count')
+
+
+def attach_reaction_counts(messages):
+    """Set the counts of ``messages`` from one query, pending deltas included.
+
+    Also adds the pending deltas to ``reaction_total``, so the messages must
+    have that field loaded. Archived messages already carry their counts
+    and are left alone.
+    """
+    messages = [message for message in messages if not message.archived]
+    if any(message.reaction_total for message in messages):
+        _attach(messages, _summary_rows(messages))
+    else:
+        _attach(messages, ())
+
+
+async def aattach_reaction_counts(messages):
+    """Async ``attach_reaction_counts``."""
+    messages = [message for message in messages if not message.archived]
+    if any(message.reaction_total for message in messages):
+        _attach(messages, [row async for row in _summary_rows(messages)])
+    else:
+        _attach(messages, ())
+
+
+def _attach(messages, rows):
+    rows_by_message = defaultdict(list)
+    for message_id, reaction_type, count in rows:
+        rows_by_message[message_id].append((reaction_type, count))
+    pending = reaction_buffer.pending_many([message.pk for message in messages])
+    for message in messages:
+        counts = dict.fromkeys(reaction_types.names(), 0)
+        deltas = pending.get(message.pk, {})
+        _merge(counts, rows_by_message[message.pk], deltas)
+        message.reaction_total += sum(deltas.values())
+        message.set_reaction_counts(counts)
+
+
+def _merge(counts, rows, deltas):
+    # Rows and deltas of types no longer registered are left out.
+    for reaction_type, count in rows:
+        if reaction_type in counts:
+            counts[reaction_type] = count
+    for reaction_type, delta in deltas.items():
+        if reaction_type in counts:
+            counts[reaction_type] += delta
+
+
+class ReactionBuffer:
+    def __init__(self):
+        self._pending = defaultdict(Counter)
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._stopped = threading.Event()
+
+    def enabled(self):
+        return getattr(settings, 'MESSAGING_REACTION_BUFFER', False)
+
+    def add(self, message_id, deltas):
+        with self._lock:
+            self._pending[message_id].update(deltas)
+        self._ensure_flusher()
+
+    def pending(self, message_id):
+        with self._lock:
+            return dict(self._pending.get(message_id, ()))
+
+    def pending_many(self, message_ids):
+        with self._lock:
+            return {message_id: dict(self._pending[message_id])
+                    for message_id in message_ids if message_id in self._pending}
+
+    @retry_on_lock
+    def flush(self):
+        """Write all pending deltas in one transaction. Returns the message count."""
+        with self._lock:
+            batch, self._pending = self._pending, defaultdict(Counter)
+        if not batch:
+            return 0
+        try:
+            with transaction.atomic():
+                for message_id, deltas in batch.items():
+                    apply_deltas(message_id, deltas)
+        except Exception:
+            # Put the deltas back so the next flush retries them.
+            with self._lock:
+                for message_id, deltas in batch.items():
+                    self._pending[message_id].update(deltas)
+            raise
+        return len(batch)
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name='reaction-flusher', daemon=True)
+                self._flusher.start()
+                atexit.register(self.stop)
+
+    def _run(self):
+        interval = getattr(settings, 'MESSAGING_REACTION_FLUSH_INTERVAL', 2.0)
+        while not self._stopped.wait(interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing buffered reaction counters failed')
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self._stopped.set()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Flushing buffered reaction counters at shutdown failed')
+
+
+reaction_buffer = ReactionBuffer()
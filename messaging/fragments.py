@@ -0,0 +1,74 @@
+"""Cached message cards.
+
+A card is rendered once per message version and shared by every viewer; the
+version is bumped whenever a reply, reaction or delete changes what the card
+shows. What differs per viewer -- the highlighted reaction and the author's
+delete button -- is applied to the cached HTML afterwards with plain string
+replacements on markers the template leaves for that purpose. With the
+per-process cache a bump would only reach the worker that made it, so there
+every card is rendered on each request.
+"""
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .caching import bump_version, get_versions, is_shared
+from .counters import attach_reaction_counts
+from .replies import attach_latest_replies
+
+CARD_TEMPLATE = 'messaging/includes/message_card.html'
+CARD_TIMEOUT = 60 * 60 * 24
+OWNER_ACTION_MARKER = 'data-owner-action hidden'
+ACTIVE_REACTION_CLASSES = 'active btn-primary text-white'
+
+
+def _version_name(message_id):
+    return f'message:{message_id}'
+
+
+def invalidate_card(message_id):
+    bump_version(_version_name(message_id))
+
+
+def shared_cards(messages):
+    """``{message_id: html}`` of the viewer-independent cards, rendering only cache misses."""
+    if not is_shared():
+        attach_reaction_counts(messages)
+        attach_latest_replies(messages)
+        return {message.pk: render_to_string(CARD_TEMPLATE, {'message': message}) for message in messages}
+    versions = get_versions([_version_name(message.pk) for message in messages])
+    keys = {message.pk: f'messaging:card:{message.pk}:{versions[_version_name(message.pk)]}'
+            for message in messages}
+    cached = cache.get_many(keys.values())
+    # Counts and replies are only fetched for the cards that have to be rendered.
+    misses = [message for message in messages if keys[message.pk] not in cached]
+    attach_reaction_counts(misses)
+    attach_latest_replies(misses)
+    cards, missing = {}, {}
+    for message in messages:
+        html = cached.get(keys[message.pk])
+        if html is None:
+            html = missing[keys[message.pk]] = render_to_string(CARD_TEMPLATE, {'message': message})
+        cards[message.pk] = html
+    if missing:
+        cache.set_many(missing, CARD_TIMEOUT)
+    return cards
+
+
+def personalize(html, message, user, reaction_type=None):
+    """Apply ``user``'s view of a shared card: their reaction and, on their own messages, delete."""
+    if reaction_type:
+        marker = f'data-type="{reaction_type}" class="reaction-button '
+        html = html.replace(marker, f'{marker}{ACTIVE_REACTION_CLASSES} ', 1)
+    if message.author_id == user.pk:
+        html = html.replace(OWNER_ACTION_MARKER, 'data-owner-action', 1)
+    return mark_safe(html)
+
+
+def render_cards(messages, user, user_reactions):
+    """``[(message, html)]`` for ``messages`` as ``user`` sees them."""
+    cards = shared_cards(messages)
+    return [
+        (message, personalize(cards[message.pk], message, user, user_reactions.get(message.pk)))
+        for message in messages
+    ]
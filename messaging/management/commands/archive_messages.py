@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from messaging.archive import ARCHIVE_BATCH_SIZE, archive_messages
+from messaging.models import Message
+from messaging.routers import archive_db
+
+
+class Command(BaseCommand):
+    help = (
+        'Move messages older than a cutoff, with their replies and reactions, to the archive '
+        'tables (the "archive" database when MESSAGEBOARD_ARCHIVE_DB is set). Each batch is '
+        'copied and deleted in one transaction, so the command can be stopped and run again at '
+        'any point. Archived messages stay readable on the wall, in searches and on profiles; '
+        'restore_messages moves them back.'
+    )
+
+    def add_arguments(self, parser):
+        cutoff = parser.add_mutually_exclusive_group()
+        cutoff.add_argument('--older-than', type=int, default=365, metavar='DAYS',
+                            help='Archive messages posted more than this many days ago (default 365).')
+        cutoff.add_argument('--before', help='Archive messages posted before this date/time.')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+        parser.add_argument('--limit', type=int, help='Archive at most this many messages in this run.')
+        parser.add_argument('--dry-run', action='store_true', help='Count the messages without moving them.')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            before = self.parse_before(options['before'])
+        else:
+            before = timezone.now() - timedelta(days=options['older_than'])
+
+        if options['dry_run']:
+            count = Message.objects.filter(timestamp__lt=before).count()
+            self.stdout.write(f'{count} messages posted before {before:%Y-%m-%d %H:%M} would be archived')
+            return
+
+        total = 0
+        for count in archive_messages(before, options['batch_size'], options['limit']):
+            total += count
+            self.stdout.write(f'archived {total} messages')
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {total} messages posted before {before:%Y-%m-%d %H:%M} to the {archive_db()!r} database'
+        ))
+
+    def parse_before(self, value):
+        before = parse_datetime(value)
+        if before is None:
+            day = parse_date(value)
+            if day is None:
+                raise CommandError(f'Invalid --before value {value!r}; use YYYY-MM-DD or an ISO date/time.')
+            before = datetime(day.year, day.month, day.day)
+        if timezone.is_naive(before):
+            before = timezone.make_aware(before)
+        return before
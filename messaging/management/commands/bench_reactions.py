@@ -0,0 +1,98 @@
+import random
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.models import Count, Sum
+from django.test.utils import override_settings
+
+from messaging import reaction_types
+from messaging.counters import reaction_buffer
+from messaging.models import Message, MessageReactionCount, Reaction
+from messaging.reactions import toggle_reaction
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark reaction throughput with direct counter updates against the '
+        'write-behind buffer. Creates temporary users and messages and deletes them afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clicks', type=int, default=5000)
+        parser.add_argument('--messages', type=int, default=10, help='Size of the hot message set.')
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--threads', type=int, default=1, help='Concurrent clickers, each with its own connection.')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        User.objects.bulk_create(User(username=f'bench_reactions_{i}') for i in range(options['users']))
+        users = list(User.objects.filter(username__startswith='bench_reactions_'))
+        try:
+            self.stdout.write(f"{'mode':<10}{'clicks/s':>10}{'count UPDATEs':>18}{'consistent':>12}")
+            for buffered in (False, True):
+                self.run(users, buffered, options)
+        finally:
+            User.objects.filter(username__startswith='bench_reactions_').delete()
+
+    def run(self, users, buffered, options):
+        rng = random.Random(options['seed'])
+        Message.objects.bulk_create(
+            Message(text=f'hot message {i}', author=users[0]) for i in range(options['messages'])
+        )
+        message_ids = list(Message.objects.filter(author=users[0]).values_list('id', flat=True))
+        names = reaction_types.names()
+        updates = []
+
+        def count_updates(execute, sql, params, many, context):
+            if sql.startswith((f'UPDATE "{Message._meta.db_table}"', f'UPDATE "{MessageReactionCount._meta.db_table}"')):
+                updates.append(sql)
+            return execute(sql, params, many, context)
+
+        threads = options['threads']
+        clicks = [
+            (rng.choice(users), rng.choice(message_ids), rng.choice(names)) for _ in range(options['clicks'])
+        ]
+
+        def click(share):
+            try:
+                with connection.execute_wrapper(count_updates):
+                    for args in share:
+                        toggle_reaction(*args)
+            finally:
+                if threads > 1:
+                    connections.close_all()
+
+        # Flush explicitly at the end so the timing covers exactly one flush.
+        quiet_flusher = override_settings(MESSAGING_REACTION_BUFFER=buffered, MESSAGING_REACTION_FLUSH_INTERVAL=3600)
+        with quiet_flusher:
+            started = time.perf_counter()
+            if threads > 1:
+                workers = [threading.Thread(target=click, args=(clicks[i::threads],)) for i in range(threads)]
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+            else:
+                click(clicks)
+            with connection.execute_wrapper(count_updates):
+                reaction_buffer.flush()
+            elapsed = time.perf_counter() - started
+
+        summed = dict(
+            MessageReactionCount.objects.filter(message_id__in=message_ids)
+            .values_list('message_id').annotate(Sum('count')).order_by()
+        )
+        reacted = dict(
+            Reaction.objects.filter(message_id__in=message_ids)
+            .values_list('message_id').annotate(Count('id')).order_by()
+        )
+        consistent = all(
+            total == summed.get(pk, 0) == reacted.get(pk, 0)
+            for pk, total in Message.objects.filter(id__in=message_ids).values_list('id', 'reaction_total')
+        )
+        mode = 'buffered' if buffered else 'direct'
+        self.stdout.write(f"{mode:<10}{options['clicks'] / elapsed:>10.0f}{len(updates):>18}{str(consistent):>12}")
+        Message.objects.filter(id__in=message_ids).delete()
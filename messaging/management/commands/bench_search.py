@@ -0,0 +1,94 @@
+import itertools
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from messaging import search
+from messaging.models import Message
+
+SYLLABLES = ['ka', 'lo', 'mi', 're', 'tu', 'sa', 'ne', 'po', 'di', 'va', 'ge', 'zu', 'ri', 'mo', 'le', 'ta']
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark message search: icontains scans against the full-text index. '
+        'Data is generated inside a transaction that is rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1_000_000)
+        parser.add_argument('--authors', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if not search.fts_enabled():
+            raise CommandError('The full-text index is only available on SQLite with FTS5; run migrate first.')
+
+        rng = random.Random(options['seed'])
+        vocabulary = sorted({''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(20_000)})
+        # Zipf-like weights so the benchmark has both very common and rare words.
+        cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+
+        with transaction.atomic():
+            started = time.perf_counter()
+            authors = User.objects.bulk_create(
+                User(username=f'bench_search_{i}') for i in range(options['authors'])
+            )
+            self.seed_messages(rng, authors, vocabulary, cum_weights, options['messages'], options['batch_size'])
+            self.stdout.write(f"Seeded {options['messages']} messages in {time.perf_counter() - started:.1f}s")
+
+            started = time.perf_counter()
+            search.rebuild_index()
+            self.stdout.write(f'Built search index in {time.perf_counter() - started:.1f}s')
+
+            queries = {
+                'common word': vocabulary[0],
+                'rare word': vocabulary[-1],
+                'prefix': vocabulary[len(vocabulary) // 2][:3],
+                'two words': f'{vocabulary[1]} {vocabulary[50]}',
+                'author': authors[0].username,
+            }
+            self.stdout.write(f"{'query':<14}{'icontains ms':>14}{'fts ms':>10}{'ranked ms':>12}")
+            for label, query in queries.items():
+                scan = self.time(lambda: self.icontains_page(query), options['repeat'])
+                fts = self.time(lambda: self.fts_page(query), options['repeat'])
+                ranked = self.time(lambda: search.ranked_message_ids(query, 50), options['repeat'])
+                self.stdout.write(f'{label:<14}{scan:>14.1f}{fts:>10.1f}{ranked:>12.1f}')
+
+            transaction.set_rollback(True)
+
+    def seed_messages(self, rng, authors, vocabulary, cum_weights, total, batch_size):
+        for offset in range(0, total, batch_size):
+            Message.objects.bulk_create(
+                Message(
+                    text=' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(6, 24))),
+                    author=rng.choice(authors),
+                )
+                for _ in range(min(batch_size, total - offset))
+            )
+
+    def icontains_page(self, query):
+        # The wall's original search: a filtered count for the paginator
+        # plus the first page.
+        queryset = Message.objects.filter(Q(text__icontains=query) | Q(author__username__icontains=query))
+        queryset.count()
+        return list(queryset.order_by('-timestamp')[:10])
+
+    def fts_page(self, query):
+        queryset = search.filter_messages(Message.objects.all(), query)
+        return list(queryset.order_by('-timestamp', '-id')[:11])
+
+    def time(self, func, repeat):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
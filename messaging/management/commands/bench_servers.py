@@ -0,0 +1,148 @@
+import contextlib
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from messaging.benchmarks import SCENARIOS, BenchmarkData, HttpDriver, summarize
+
+SERVERS = {
+    # The WSGI deployment: a fixed pool of worker threads, one per request in flight.
+    'wsgi': ('gunicorn', lambda o: [
+        'gunicorn', 'messageboard.wsgi:application', '--bind', f"127.0.0.1:{o['port']}",
+        '--workers', str(o['workers']), '--threads', str(o['threads']), '--log-level', 'warning',
+    ]),
+    # The ASGI deployment: async views on one event loop per worker.
+    'asgi': ('uvicorn', lambda o: [
+        'uvicorn', 'messageboard.asgi:application', '--port', str(o['port']),
+        '--workers', str(o['workers']), '--log-level', 'warning',
+    ]),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the WSGI deployment (gunicorn with a thread pool) with the ASGI one (uvicorn) '
+        'at increasing numbers of concurrent connections. Each server is started on the current '
+        'settings and database (use one filled by seed_data), driven over HTTP with the '
+        'run_benchmarks scenarios, and stopped. --slow-clients holds extra connections open '
+        'that send half a request and stall, like slow mobile clients or long polls. A server\'s '
+        'capacity is the highest concurrency it served without errors within --slo milliseconds at p95.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', action='append', dest='servers', choices=sorted(SERVERS),
+                            help='Server to run (repeatable; default both).')
+        parser.add_argument('--concurrency', action='append', type=int, dest='levels',
+                            help='Concurrent connections (repeatable; default 1, 8, 32, 64).')
+        parser.add_argument('--scenario', default='wall_browse', choices=sorted(SCENARIOS))
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per level.')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per level first.')
+        parser.add_argument('--workers', type=int, default=1, help='Server processes.')
+        parser.add_argument('--threads', type=int, default=8, help='Threads per gunicorn worker.')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--password', default='seed-pass', help='Password of the seeded users.')
+        parser.add_argument('--slow-clients', type=int, default=0,
+                            help='Stalled connections held open while measuring (default 0).')
+        parser.add_argument('--timeout', type=float, default=10, help='Seconds before a request fails.')
+        parser.add_argument('--slo', type=float, default=500, help='p95 latency limit in ms (default 500).')
+
+    def handle(self, *args, **options):
+        servers = options['servers'] or list(SERVERS)
+        for name in servers:
+            module = SERVERS[name][0]
+            if importlib.util.find_spec(module) is None:
+                raise CommandError(f'The {name} benchmark needs {module}: pip install {module}')
+        try:
+            data = BenchmarkData()
+        except ValueError as e:
+            raise CommandError(e)
+        levels = sorted(set(options['levels'] or [1, 8, 32, 64]))
+
+        self.stdout.write(f"{'server':<8}{'conns':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+        capacity = {}
+        for name in servers:
+            capacity[name] = 0
+            with _Server(SERVERS[name][1](options), options['port'], name):
+                for level in levels:
+                    result = self.measure(data, level, options)
+                    if result is None:
+                        self.stdout.write(f'{name:<8}{level:>7}  no response within {options["timeout"]:.0f}s')
+                        continue
+                    latency = result['latency_ms']
+                    self.stdout.write(
+                        f"{name:<8}{level:>7}{result['throughput_rps']:>9.1f}{latency['p50']:>9.1f}"
+                        f"{latency['p95']:>9.1f}{latency['p99']:>9.1f}{result['errors']:>8}"
+                    )
+                    if not result['errors'] and latency['p95'] <= options['slo']:
+                        capacity[name] = level
+        for name, level in capacity.items():
+            served = f'{level} connections' if level else 'nothing'
+            self.stdout.write(f'{name} capacity: {served} within {options["slo"]:.0f} ms p95')
+
+    def measure(self, data, level, options):
+        base_url = f"http://127.0.0.1:{options['port']}"
+        requests = SCENARIOS[options['scenario']](data, options['warmup'] + options['requests'])
+        with stalled_connections(options['port'], options['slow_clients']):
+            try:
+                driver = HttpDriver(base_url, data.usernames, options['password'], level, options['timeout'])
+            except (OSError, ValueError):
+                # Could not even sign in: every worker is busy with the stalled clients.
+                return None
+            driver.run(requests[:options['warmup']])
+            return summarize(*driver.run(requests[options['warmup']:]))
+
+
+@contextlib.contextmanager
+def stalled_connections(port, count):
+    """Hold ``count`` connections that sent an unfinished request to the server."""
+    connections = []
+    try:
+        for _ in range(count):
+            connection = socket.create_connection(('127.0.0.1', port))
+            connection.sendall(b'GET / HTTP/1.1\r\nHost: 127.0.0.1\r\n')
+            connections.append(connection)
+        # Let the server pick them up before the measured requests arrive.
+        time.sleep(0.5)
+        yield
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+class _Server:
+    """A server subprocess on the current settings, running while the block runs."""
+
+    def __init__(self, argv, port, server, timeout=30):
+        self.argv = [sys.executable, '-m', *argv]
+        self.port = port
+        self.env = dict(os.environ, MESSAGEBOARD_SERVER=server)
+        self.timeout = timeout
+
+    def __enter__(self):
+        # The child inherits DJANGO_SETTINGS_MODULE, so it serves the same database.
+        self.process = subprocess.Popen(self.argv, cwd=settings.BASE_DIR, env=self.env)
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError(f'{self.argv[2]} exited with status {self.process.returncode}.')
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                return self
+            except OSError:
+                time.sleep(0.2)
+        self.__exit__()
+        raise CommandError(f'{self.argv[2]} did not start listening on port {self.port}.')
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
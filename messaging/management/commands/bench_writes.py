@@ -0,0 +1,139 @@
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+
+from messaging import reaction_types
+from messaging.counters import apply_deltas
+from messaging.models import Message, MessageReactionCount, Reaction
+from messaging.transactions import is_lock_error, retry_on_lock
+
+BASELINE_OPTIONS = {'init_command': 'PRAGMA journal_mode=DELETE'}
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark concurrent write throughput on SQLite: the stock configuration '
+        '(rollback journal, deferred transactions, no retries) against the one in '
+        'settings.DATABASES (WAL, IMMEDIATE transactions, busy timeout, lock retries). '
+        'Each run uses a fresh temporary database file; threads post messages and '
+        'toggle reactions on a small set of hot messages.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--writes', type=int, default=200, help='Writes per thread.')
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--messages', type=int, default=10, help='Size of the hot message set.')
+        parser.add_argument('--post-ratio', type=float, default=0.2, help='Share of writes that post a message.')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        tuned = settings.DATABASES['default']
+        if tuned['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('bench_writes only applies to the SQLite backend.')
+        directory = tempfile.mkdtemp(prefix='bench_writes_')
+        try:
+            self.stdout.write(f"{'config':<10}{'writes/s':>10}{'failed':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+            self.run('stock', os.path.join(directory, 'stock.sqlite3'), BASELINE_OPTIONS, False, options)
+            self.run('tuned', os.path.join(directory, 'tuned.sqlite3'), tuned.get('OPTIONS', {}), True, options)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def run(self, label, path, db_options, retry, options):
+        alias = f'bench_writes_{label}'
+        connections.settings[alias] = connections.configure_settings({
+            'default': settings.DATABASES['default'],
+            alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path, 'OPTIONS': dict(db_options)},
+        })[alias]
+        try:
+            user_ids, message_ids = self.prepare(alias, options)
+            write = retry_on_lock(self.write) if retry else self.write
+            latencies, failures = [], []
+            lock = threading.Lock()
+
+            def worker(seed):
+                rng = random.Random(seed)
+                samples, failed = [], 0
+                try:
+                    for _ in range(options['writes']):
+                        started = time.perf_counter()
+                        try:
+                            write(alias, rng, user_ids, message_ids, options['post_ratio'])
+                        except OperationalError as exc:
+                            if not is_lock_error(exc):
+                                raise
+                            failed += 1
+                            continue
+                        samples.append(time.perf_counter() - started)
+                finally:
+                    connections[alias].close()
+                with lock:
+                    latencies.extend(samples)
+                    failures.append(failed)
+
+            threads = [threading.Thread(target=worker, args=(options['seed'] + i,))
+                       for i in range(options['threads'])]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            connections[alias].close()
+            del connections.settings[alias]
+
+        latencies.sort()
+
+        def pct(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else 0
+
+        self.stdout.write(
+            f'{label:<10}{len(latencies) / elapsed:>10.0f}{sum(failures):>8}'
+            f'{pct(0.5):>9.1f}{pct(0.95):>9.1f}{pct(0.99):>9.1f}'
+        )
+
+    def prepare(self, alias, options):
+        with connections[alias].schema_editor() as editor:
+            for model in (User, Message, MessageReactionCount, Reaction):
+                editor.create_model(model)
+        User.objects.using(alias).bulk_create(User(username=f'writer{i}') for i in range(options['users']))
+        user_ids = list(User.objects.using(alias).values_list('id', flat=True))
+        Message.objects.using(alias).bulk_create(
+            Message(text=f'hot message {i}', author_id=user_ids[0]) for i in range(options['messages'])
+        )
+        message_ids = list(Message.objects.using(alias).values_list('id', flat=True))
+        connections[alias].close()
+        return user_ids, message_ids
+
+    def write(self, alias, rng, user_ids, message_ids, post_ratio):
+        """One request's worth of writes: post a message or toggle a reaction."""
+        user_id = rng.choice(user_ids)
+        with transaction.atomic(using=alias):
+            if rng.random() < post_ratio:
+                # bulk_create skips the search-index signal, which would write to the default database.
+                Message.objects.using(alias).bulk_create([Message(text='benchmark post', author_id=user_id)])
+                return
+            message_id = rng.choice(message_ids)
+            reaction_type = rng.choice(reaction_types.names())
+            reactions = Reaction.objects.using(alias)
+            existing = reactions.filter(user_id=user_id, message_id=message_id).first()
+            if existing is None:
+                reactions.create(user_id=user_id, message_id=message_id, reaction_type=reaction_type)
+                deltas = {reaction_type: 1}
+            elif existing.reaction_type == reaction_type:
+                existing.delete()
+                deltas = {reaction_type: -1}
+            else:
+                deltas = {existing.reaction_type: -1, reaction_type: 1}
+                existing.reaction_type = reaction_type
+                existing.save(update_fields=['reaction_type'])
+            apply_deltas(message_id, deltas, using=alias)
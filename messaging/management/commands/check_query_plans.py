@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from messaging.query_plans import HOT_QUERIES, check_plans
+
+
+class Command(BaseCommand):
+    help = (
+        'Run EXPLAIN QUERY PLAN on the queries behind the wall, profile, reaction, reply and '
+        'task pages and fail if any of them scans a whole table or sorts in a temporary B-tree. '
+        'Use -v 2 to print every plan. Only SQLite is supported.'
+    )
+
+    def handle(self, *args, **options):
+        results = check_plans()
+        if not results:
+            raise CommandError('Query plans can only be checked on SQLite.')
+        failed = []
+        for name in HOT_QUERIES:
+            plan, problems = results[name]
+            if problems:
+                failed.append(name)
+                self.stdout.write(self.style.ERROR(f'{name}: {"; ".join(problems)}'))
+            else:
+                self.stdout.write(f'{name}: ok')
+            if options['verbosity'] > 1 or problems:
+                for line in plan.splitlines():
+                    self.stdout.write(f'    {line}')
+        if failed:
+            raise CommandError(f'{len(failed)} of {len(results)} hot queries lost their index: {", ".join(failed)}.')
+        self.stdout.write(self.style.SUCCESS(f'All {len(results)} hot queries use indexes.'))
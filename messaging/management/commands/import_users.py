@@ -0,0 +1,98 @@
+import csv
+import sys
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from messaging.models import Profile
+
+USER_FIELDS = ('email', 'first_name', 'last_name')
+PROFILE_FIELDS = ('bio', 'website', 'location')
+
+
+class Command(BaseCommand):
+    help = (
+        'Import users and their profiles from a CSV file with a header row. '
+        'Only "username" is required; "email", "first_name", "last_name", "password", '
+        '"bio", "website" and "location" are used when present. Rows are written with '
+        'bulk_create in batches, so no per-row signals or queries run. Usernames that '
+        'already exist keep their account; their profile gets the profile columns present in '
+        'the file, written only when something changed. Users without a password get an '
+        'unusable one.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='Path to the CSV file, or "-" to read standard input.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['csv_file'] == '-':
+            created, updated, skipped = self.import_rows(csv.DictReader(sys.stdin), options['batch_size'])
+        else:
+            try:
+                with open(options['csv_file'], newline='', encoding='utf-8') as f:
+                    created, updated, skipped = self.import_rows(csv.DictReader(f), options['batch_size'])
+            except OSError as e:
+                raise CommandError(f'Cannot read {options["csv_file"]}: {e}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {created} users, updated {updated} profiles, skipped {skipped}.'
+        ))
+
+    def import_rows(self, reader, batch_size):
+        if reader.fieldnames is None or 'username' not in reader.fieldnames:
+            raise CommandError('The CSV file needs a header row with a "username" column.')
+        profile_fields = [field for field in PROFILE_FIELDS if field in reader.fieldnames]
+        totals = [0, 0, 0]
+        batch = []
+        for row in reader:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                totals = [t + n for t, n in zip(totals, self.import_batch(batch, profile_fields))]
+                batch = []
+        if batch:
+            totals = [t + n for t, n in zip(totals, self.import_batch(batch, profile_fields))]
+        return totals
+
+    @transaction.atomic
+    def import_batch(self, rows, profile_fields):
+        """Import one batch; returns ``(created, updated, skipped)``."""
+        rows_by_username = {}
+        for row in rows:
+            username = (row.get('username') or '').strip()
+            if username and username not in rows_by_username:
+                rows_by_username[username] = row
+        existing = {
+            user.username: user
+            for user in User.objects.filter(username__in=rows_by_username).select_related('profile')
+        }
+        new_rows = {username: row for username, row in rows_by_username.items() if username not in existing}
+
+        User.objects.bulk_create([
+            User(
+                username=username,
+                password=make_password(row.get('password') or None),
+                **{field: row.get(field) or '' for field in USER_FIELDS},
+            )
+            for username, row in new_rows.items()
+        ])
+        # Not every backend returns primary keys from bulk_create, so look
+        # the new users up again by username.
+        user_ids = dict(User.objects.filter(username__in=new_rows).values_list('username', 'id'))
+        Profile.objects.bulk_create([
+            Profile(user_id=user_ids[username], **{field: row.get(field) or '' for field in PROFILE_FIELDS})
+            for username, row in new_rows.items()
+        ], ignore_conflicts=True)
+
+        # The joined profile is already loaded, so only changed or missing
+        # profiles cost a query.
+        updated = 0
+        for username, user in existing.items() if profile_fields else ():
+            values = {field: rows_by_username[username].get(field) or '' for field in profile_fields}
+            if not hasattr(user, 'profile') and not any(values.values()):
+                # Nothing to store; the profile is created on first access.
+                continue
+            if Profile.objects.for_user(user).update(**values):
+                updated += 1
+        return len(new_rows), updated, len(rows) - len(new_rows) - updated
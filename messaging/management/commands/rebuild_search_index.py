@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from messaging import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for all messages.'
+
+    def handle(self, *args, **options):
+        if not search.fts_enabled():
+            raise CommandError('The full-text index is only available on SQLite with FTS5; run migrate first.')
+        count = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} messages.'))
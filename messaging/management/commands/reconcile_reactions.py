@@ -0,0 +1,123 @@
+from collections import defaultdict
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from messaging.models import Message, MessageReactionCount, Reaction
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute message reaction counts (the per-type summary rows and the stored total) from '
+        'the Reaction rows and fix the ones that drifted. Messages are walked in id order, '
+        '--batch-size at a time, with one grouped aggregate over their reactions and one read '
+        'of their summary rows per batch, so memory stays bounded by --batch-size. '
+        'Run it while no web process holds buffered counter deltas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--message', type=int, action='append', dest='message_ids',
+                            help='Only reconcile this message id (repeatable).')
+        parser.add_argument('--since', help='Only reconcile messages posted at or after this date/time.')
+        parser.add_argument('--since-id', type=int, help='Only reconcile messages with an id at or above this.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Report the differences without writing them.')
+        parser.add_argument('--show', type=int, default=20, help='How many differences to print (default 20).')
+
+    def handle(self, *args, **options):
+        messages = Message.objects.all()
+        if options['message_ids']:
+            messages = messages.filter(pk__in=options['message_ids'])
+        if options['since']:
+            messages = messages.filter(timestamp__gte=self.parse_since(options['since']))
+        if options['since_id'] is not None:
+            messages = messages.filter(pk__gte=options['since_id'])
+
+        checked = drifted = 0
+        for batch in self.compare(messages, options['batch_size']):
+            pending = []
+            for pk, current_total, current, expected in batch:
+                checked += 1
+                expected_total = sum(expected.values())
+                if current == expected and current_total == expected_total:
+                    continue
+                drifted += 1
+                if drifted <= options['show']:
+                    changes = [
+                        f'{name} {current.get(name, 0)} -> {expected.get(name, 0)}'
+                        for name in sorted(current.keys() | expected.keys())
+                        if current.get(name, 0) != expected.get(name, 0)
+                    ]
+                    if current_total != expected_total:
+                        changes.append(f'reaction_total {current_total} -> {expected_total}')
+                    self.stdout.write(f"message {pk}: {', '.join(changes)}")
+                pending.append((pk, expected))
+            if pending and not options['dry_run']:
+                self.fix(pending)
+
+        verb = 'would be fixed' if options['dry_run'] else 'fixed'
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} messages, {drifted} {verb}.'))
+
+    def parse_since(self, value):
+        since = parse_datetime(value)
+        if since is None:
+            day = parse_date(value)
+            if day is None:
+                raise CommandError(f'Invalid --since value {value!r}; use YYYY-MM-DD or an ISO date/time.')
+            since = datetime(day.year, day.month, day.day)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        return since
+
+    def compare(self, messages, batch_size):
+        """Yield lists of ``(pk, total, current, expected)``, in pk order.
+
+        ``total`` is the stored ``reaction_total`` and ``current`` and
+        ``expected`` are ``{reaction_type: n}`` of the non-zero counts in
+        the summary rows and in the Reaction rows. Each batch is read with
+        plain fetches, so no cursor is left open while it is being fixed.
+        """
+        last_pk = 0
+        while True:
+            rows = list(
+                messages.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'reaction_total')[:batch_size]
+            )
+            if not rows:
+                return
+            last_pk = rows[-1][0]
+            pks = [pk for pk, _ in rows]
+            current = _counts_by_message(
+                MessageReactionCount.objects.filter(message_id__in=pks)
+                .values_list('message_id', 'reaction_type', 'count')
+            )
+            expected = _counts_by_message(
+                Reaction.objects.filter(message_id__in=pks)
+                .values_list('message_id', 'reaction_type').annotate(n=Count('id')).order_by()
+            )
+            yield [(pk, total, current.get(pk, {}), expected.get(pk, {})) for pk, total in rows]
+
+    @transaction.atomic
+    def fix(self, pending):
+        """Replace the summary rows and totals of ``[(pk, expected)]``."""
+        MessageReactionCount.objects.filter(message_id__in=[pk for pk, _ in pending]).delete()
+        MessageReactionCount.objects.bulk_create([
+            MessageReactionCount(message_id=pk, reaction_type=reaction_type, count=count)
+            for pk, expected in pending
+            for reaction_type, count in expected.items()
+        ])
+        Message.objects.bulk_update(
+            [Message(pk=pk, reaction_total=sum(expected.values())) for pk, expected in pending], ['reaction_total']
+        )
+
+
+def _counts_by_message(rows):
+    """Group ``(message_id, type, n)`` rows into ``{message_id: {type: n}}``, dropping zeros."""
+    counts = defaultdict(dict)
+    for message_id, reaction_type, n in rows:
+        if n:
+            counts[message_id][reaction_type] = n
+    return counts
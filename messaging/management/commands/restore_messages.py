@@ -0,0 +1,58 @@
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from messaging.archive import ARCHIVE_BATCH_SIZE, restore_messages
+from messaging.models import ArchivedMessage
+
+
+class Command(BaseCommand):
+    help = (
+        'Move archived messages, with their replies and reactions, back to the live tables under '
+        'their original ids, a batch per transaction. Messages by deleted users stay archived.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--message', type=int, action='append', dest='message_ids',
+                            help='Restore this message id (repeatable).')
+        parser.add_argument('--author', help='Only restore messages by this username.')
+        parser.add_argument('--since', help='Only restore messages posted at or after this date/time.')
+        parser.add_argument('--all', action='store_true', help='Restore the whole archive.')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if not (options['message_ids'] or options['author'] or options['since'] or options['all']):
+            raise CommandError('Choose what to restore: --message, --author, --since or --all.')
+        archived = ArchivedMessage.objects.all()
+        if options['message_ids']:
+            archived = archived.filter(pk__in=options['message_ids'])
+        if options['author']:
+            user = get_user_model().objects.filter(username=options['author']).first()
+            if user is None:
+                raise CommandError(f'No user named {options["author"]!r}.')
+            archived = archived.filter(author_id=user.pk)
+        if options['since']:
+            archived = archived.filter(timestamp__gte=self.parse_since(options['since']))
+
+        restored = skipped = 0
+        for batch_restored, batch_skipped in restore_messages(archived, options['batch_size']):
+            restored += batch_restored
+            skipped += batch_skipped
+            self.stdout.write(f'restored {restored} messages')
+        if skipped:
+            self.stdout.write(self.style.WARNING(f'Skipped {skipped} messages whose author no longer exists'))
+        self.stdout.write(self.style.SUCCESS(f'Restored {restored} messages'))
+
+    def parse_since(self, value):
+        since = parse_datetime(value)
+        if since is None:
+            day = parse_date(value)
+            if day is None:
+                raise CommandError(f'Invalid --since value {value!r}; use YYYY-MM-DD or an ISO date/time.')
+            since = datetime(day.year, day.month, day.day)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        return since
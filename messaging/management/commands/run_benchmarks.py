@@ -0,0 +1,139 @@
+import json
+import platform
+import subprocess
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from messaging.benchmarks import SCENARIOS, BenchmarkData, ClientDriver, HttpDriver, summarize
+from messaging.models import Message, Reaction, Reply, Task
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the request scenarios (%s) and write throughput, latency percentiles and query counts '
+        'as JSON. By default requests go through the Django test client in this process; with --url '
+        'they are sent over HTTP to a running server from --concurrency sessions. Use a database '
+        'filled by seed_data: react_burst writes to it. --compare prints the change against an '
+        'earlier report.' % ', '.join(SCENARIOS)
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=sorted(SCENARIOS),
+                            help='Scenario to run (repeatable; default all).')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per scenario first.')
+        parser.add_argument('--deep-page', type=int, default=100, help='Page number used by deep_page.')
+        parser.add_argument('--username', help='User for the test client (default: newest message author).')
+        parser.add_argument('--url', help='Base URL of a running server, e.g. http://127.0.0.1:8000.')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--password', default='seed-pass', help='Password of the users signing in with --url.')
+        parser.add_argument('--output', help='Write the JSON report here instead of standard output.')
+        parser.add_argument('--compare', help='Earlier JSON report to compare against.')
+        parser.add_argument('--tolerance', type=float, default=0.10,
+                            help='Relative p95 slowdown reported as a regression (default 0.10).')
+
+    def handle(self, *args, **options):
+        try:
+            data = BenchmarkData(deep_page=options['deep_page'])
+        except ValueError as e:
+            raise CommandError(e)
+        scenarios = options['scenarios'] or list(SCENARIOS)
+
+        if options['url']:
+            driver = HttpDriver(options['url'], data.usernames, options['password'], options['concurrency'])
+            mode = {'driver': 'http', 'url': options['url'], 'concurrency': options['concurrency']}
+        else:
+            username = options['username'] or data.usernames[0]
+            try:
+                user = User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'No user named {username!r}.')
+            driver = ClientDriver(user)
+            mode = {'driver': 'client', 'username': username}
+
+        results = {}
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for name in scenarios:
+                requests = SCENARIOS[name](data, options['warmup'] + options['requests'])
+                if not requests:
+                    self.stderr.write(f'Skipping {name}: not enough data.')
+                    continue
+                driver.run(requests[:options['warmup']])
+                samples, elapsed = driver.run(requests[options['warmup']:])
+                results[name] = summarize(samples, elapsed)
+                self.stderr.write(self.describe(name, results[name]))
+
+        report = {'meta': self.meta(mode, options), 'scenarios': results}
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stderr.write(f"Wrote {options['output']}")
+        else:
+            self.stdout.write(output)
+
+        if options['compare']:
+            self.compare(options['compare'], results, options['tolerance'])
+
+    def describe(self, name, result):
+        latency = result['latency_ms']
+        queries = result['queries']['p50']
+        return (
+            f"{name:<18}{result['throughput_rps']:>9.1f} req/s  p50 {latency['p50']:>8.1f} ms  "
+            f"p95 {latency['p95']:>8.1f} ms  p99 {latency['p99']:>8.1f} ms  "
+            f"queries {queries if queries is not None else '-':>3}  errors {result['errors']}"
+        )
+
+    def meta(self, mode, options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                cwd=settings.BASE_DIR,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'date': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'requests': options['requests'],
+            'warmup': options['warmup'],
+            'rows': {
+                'users': User.objects.count(),
+                'messages': Message.objects.count(),
+                'reactions': Reaction.objects.count(),
+                'replies': Reply.objects.count(),
+                'tasks': Task.objects.count(),
+            },
+            **mode,
+        }
+
+    def compare(self, path, results, tolerance):
+        try:
+            with open(path) as f:
+                baseline = json.load(f)['scenarios']
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f'Cannot read report {path}: {e}')
+        regressions = 0
+        self.stderr.write(f"{'scenario':<18}{'p95 before':>12}{'p95 after':>12}{'change':>9}{'queries':>12}")
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            before, after = baseline[name]['latency_ms']['p95'], result['latency_ms']['p95']
+            change = (after - before) / before if before else 0
+            queries = f"{baseline[name]['queries']['p50']} -> {result['queries']['p50']}"
+            line = f'{name:<18}{before:>12.1f}{after:>12.1f}{change:>+9.0%}{queries:>12}'
+            if change > tolerance:
+                regressions += 1
+                line = self.style.ERROR(line + '  regression')
+            self.stderr.write(line)
+        if regressions:
+            raise CommandError(f'{regressions} scenario(s) slowed down by more than {tolerance:.0%} at p95.')
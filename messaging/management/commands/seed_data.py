@@ -0,0 +1,211 @@
+import itertools
+import random
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from messaging import reaction_types, search
+from messaging.caching import bump_version, forget_count
+from messaging.models import Message, MessageReactionCount, Reaction, Reply, Task
+
+SYLLABLES = ['ka', 'lo', 'mi', 're', 'tu', 'sa', 'ne', 'po', 'di', 'va', 'ge', 'zu', 'ri', 'mo', 'le', 'ta']
+EMOJIS = ['👍', '😂', '❤️', '🔥', '😢', '🎉']
+TASK_STATUSES = [status for status, _ in Task.STATUS_CHOICES]
+
+_SCALE_RE = re.compile(r'^(\d+(?:\.\d+)?)([km]?)$', re.IGNORECASE)
+
+
+def parse_scale(value):
+    """``'10k'`` -> 10000, ``'2.5m'`` -> 2500000."""
+    match = _SCALE_RE.match(value.strip())
+    if not match:
+        raise CommandError(f'Invalid scale {value!r}; use a number such as 10000, 50k or 10m.')
+    number, suffix = match.groups()
+    return int(float(number) * {'': 1, 'k': 1_000, 'm': 1_000_000}[suffix.lower()])
+
+
+@contextmanager
+def explicit_timestamps(model, *field_names):
+    """Let bulk_create keep the given auto_now/auto_now_add values."""
+    fields = [model._meta.get_field(name) for name in field_names]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database with generated users, messages, replies, reactions and tasks for '
+        'benchmarks (see run_benchmarks). --scale sets the number of messages (e.g. 10k, 1m, 10m) '
+        'and the other counts follow from it unless given explicitly. Rows are written with '
+        'bulk_create in batches, reaction counts and totals are filled in directly and the search index '
+        'is rebuilt once at the end. Every generated user has the password given by --password.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', default='10k', help='Number of messages (default 10k).')
+        parser.add_argument('--users', type=int, help='Default: messages / 100, at least 50.')
+        parser.add_argument('--reactions', type=int, help='About how many reactions (default 3 per message).')
+        parser.add_argument('--replies', type=int, help='About how many replies (default 1 per 2 messages).')
+        parser.add_argument('--tasks', type=int, help='Default: messages / 10.')
+        parser.add_argument('--days', type=int, default=365, help='Spread timestamps over this many days.')
+        parser.add_argument('--prefix', default='seed_', help='Username prefix for generated users.')
+        parser.add_argument('--password', default='seed-pass', help='Password of every generated user.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if not connection.features.can_return_rows_from_bulk_insert:
+            raise CommandError('seed_data needs a database that returns primary keys from bulk inserts.')
+        messages = parse_scale(options['scale'])
+        users = options['users'] or max(50, messages // 100)
+        reactions = options['reactions'] if options['reactions'] is not None else messages * 3
+        replies = options['replies'] if options['replies'] is not None else messages // 2
+        tasks = options['tasks'] if options['tasks'] is not None else messages // 10
+        if User.objects.filter(username__startswith=options['prefix']).exists():
+            raise CommandError(f"Users named {options['prefix']}* already exist; pick another --prefix.")
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.end = timezone.now()
+        self.start = self.end - timedelta(days=options['days'])
+        vocabulary = sorted({''.join(self.rng.choices(SYLLABLES, k=self.rng.randint(2, 4))) for _ in range(5000)})
+        # Zipf-like weights so searches hit both very common and rare words.
+        self.vocabulary = vocabulary
+        self.cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+
+        started = time.perf_counter()
+        user_ids = self.seed_users(users, options['prefix'], options['password'])
+        self.report('users', len(user_ids), started)
+
+        started = time.perf_counter()
+        counts = self.seed_messages(messages, user_ids, reactions / max(messages, 1), replies / max(messages, 1))
+        self.report('messages', messages, started)
+        self.stdout.write(f"  with {counts['reactions']} reactions and {counts['replies']} replies")
+
+        started = time.perf_counter()
+        self.seed_tasks(tasks)
+        self.report('tasks', tasks, started)
+
+        if search.fts_enabled():
+            started = time.perf_counter()
+            search.rebuild_index()
+            self.report('messages into the search index', messages, started)
+
+        bump_version('board')
+        forget_count('messages')
+        self.stdout.write(self.style.SUCCESS('Done.'))
+
+    def report(self, label, count, started):
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(f'Wrote {count} {label} in {elapsed:.1f}s ({rate:,.0f}/s)')
+
+    def batches(self, total):
+        for offset in range(0, total, self.batch_size):
+            yield min(self.batch_size, total - offset)
+
+    def timestamps(self, size, offset, total):
+        # Increasing with the primary key, like rows inserted over time.
+        span = (self.end - self.start) / max(total, 1)
+        return [self.start + span * (offset + i) for i in range(size)]
+
+    def draw(self, mean):
+        """A skewed non-negative integer averaging ``mean``."""
+        if not mean:
+            return 0
+        return int(self.rng.expovariate(1 / mean) + self.rng.random())
+
+    def text(self):
+        return ' '.join(self.rng.choices(self.vocabulary, cum_weights=self.cum_weights, k=self.rng.randint(6, 24)))
+
+    def seed_users(self, total, prefix, password):
+        password = make_password(password)
+        joined = self.start
+        ids = []
+        for offset, size in zip(itertools.count(0, self.batch_size), self.batches(total)):
+            created = User.objects.bulk_create(
+                User(username=f'{prefix}{offset + i}', password=password, date_joined=joined)
+                for i in range(size)
+            )
+            ids.extend(user.pk for user in created)
+        return ids
+
+    def seed_messages(self, total, user_ids, reactions_per_message, replies_per_message):
+        counts = {'reactions': 0, 'replies': 0}
+        names = reaction_types.names()
+        offset = 0
+        for size in self.batches(total):
+            with transaction.atomic(), explicit_timestamps(Message, 'timestamp'), \
+                    explicit_timestamps(Reply, 'timestamp'):
+                messages, message_reactions = [], []
+                for timestamp in self.timestamps(size, offset, total):
+                    message = Message(text=self.text(), author_id=self.rng.choice(user_ids), timestamp=timestamp)
+                    # Exponential draws give a few hot messages and a long tail.
+                    k = min(len(user_ids), self.draw(reactions_per_message))
+                    chosen = [(user_id, self.rng.choice(names))
+                              for user_id in self.rng.sample(user_ids, k)]
+                    message.reaction_total = len(chosen)
+                    message.reply_count = self.draw(replies_per_message)
+                    messages.append(message)
+                    message_reactions.append(chosen)
+                Message.objects.bulk_create(messages)
+
+                Reaction.objects.bulk_create(
+                    Reaction(message_id=message.pk, user_id=user_id, reaction_type=reaction_type)
+                    for message, chosen in zip(messages, message_reactions)
+                    for user_id, reaction_type in chosen
+                )
+                MessageReactionCount.objects.bulk_create(
+                    MessageReactionCount(message_id=message.pk, reaction_type=reaction_type, count=count)
+                    for message, chosen in zip(messages, message_reactions)
+                    for reaction_type, count in Counter(reaction_type for _, reaction_type in chosen).items()
+                )
+                counts['reactions'] += sum(len(chosen) for chosen in message_reactions)
+
+                replies = []
+                for message in messages:
+                    for _ in range(message.reply_count):
+                        emoji = self.rng.random() < 0.3
+                        replies.append(Reply(
+                            message_id=message.pk,
+                            author_id=self.rng.choice(user_ids),
+                            text='' if emoji else self.text(),
+                            emoji=self.rng.choice(EMOJIS) if emoji else '',
+                            timestamp=message.timestamp + timedelta(minutes=self.rng.randint(1, 600)),
+                        ))
+                Reply.objects.bulk_create(replies, batch_size=self.batch_size)
+                counts['replies'] += len(replies)
+            offset += size
+        return counts
+
+    def seed_tasks(self, total):
+        offset = 0
+        for size in self.batches(total):
+            tasks = []
+            for created_at in self.timestamps(size, offset, total):
+                status = self.rng.choices(TASK_STATUSES, weights=(5, 2, 3))[0]
+                tasks.append(Task(
+                    title=self.text()[:200],
+                    description=self.text() if self.rng.random() < 0.5 else '',
+                    status=status,
+                    created_at=created_at,
+                    updated_at=created_at,
+                    completed_at=created_at + timedelta(days=1) if status == 'completed' else None,
+                ))
+            with explicit_timestamps(Task, 'created_at', 'updated_at'):
+                Task.objects.bulk_create(tasks)
+            offset += size
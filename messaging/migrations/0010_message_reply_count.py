@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-18 11:55
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_replies(apps, schema_editor):
+    Message = apps.get_model('messaging', 'Message')
+    Reply = apps.get_model('messaging', 'Reply')
+    replies = (
+        Reply.objects.filter(message=OuterRef('pk'))
+        .order_by().values('message').annotate(total=Count('pk')).values('total')
+    )
+    Message.objects.filter(replies__isnull=False).update(reply_count=Coalesce(Subquery(replies), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0009_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='reply_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_replies, migrations.RunPython.noop),
+    ]
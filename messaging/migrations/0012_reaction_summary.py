@@ -0,0 +1,95 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+
+# The types that had a column; fixed here rather than read from the registry.
+COLUMN_TYPES = ('like', 'laugh', 'sad', 'fire', 'thumbs_up', 'angry')
+BATCH_SIZE = 2000
+
+
+def copy_counts(apps, schema_editor):
+    """Stream the six count columns into summary rows and fill in the totals."""
+    Message = apps.get_model('messaging', 'Message')
+    MessageReactionCount = apps.get_model('messaging', 'MessageReactionCount')
+    fields = [f'{reaction_type}_count' for reaction_type in COLUMN_TYPES]
+    reacted = Message.objects.exclude(**dict.fromkeys(fields, 0))
+
+    batch = []
+    for pk, *counts in reacted.order_by('pk').values_list('pk', *fields).iterator(chunk_size=BATCH_SIZE):
+        batch.extend(
+            MessageReactionCount(message_id=pk, reaction_type=reaction_type, count=count)
+            for reaction_type, count in zip(COLUMN_TYPES, counts) if count
+        )
+        if len(batch) >= BATCH_SIZE:
+            MessageReactionCount.objects.bulk_create(batch)
+            batch = []
+    MessageReactionCount.objects.bulk_create(batch)
+    reacted.update(reaction_total=sum((F(field) for field in fields[1:]), F(fields[0])))
+
+
+def restore_columns(apps, schema_editor):
+    Message = apps.get_model('messaging', 'Message')
+    MessageReactionCount = apps.get_model('messaging', 'MessageReactionCount')
+    for reaction_type in COLUMN_TYPES:
+        counts = MessageReactionCount.objects.filter(message=OuterRef('pk'), reaction_type=reaction_type)
+        Message.objects.filter(reaction_summary__reaction_type=reaction_type).update(
+            **{f'{reaction_type}_count': Subquery(counts.values('count')[:1])}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0011_task_position'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageReactionCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reaction_type', models.CharField(max_length=10)),
+                ('count', models.IntegerField(default=0)),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reaction_summary', to='messaging.message')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('message', 'reaction_type'), name='message_reaction_count_unique')],
+            },
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='reaction_total',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(copy_counts, restore_columns),
+        migrations.RemoveField(
+            model_name='message',
+            name='like_count',
+        ),
+        migrations.RemoveField(
+            model_name='message',
+            name='laugh_count',
+        ),
+        migrations.RemoveField(
+            model_name='message',
+            name='sad_count',
+        ),
+        migrations.RemoveField(
+            model_name='message',
+            name='fire_count',
+        ),
+        migrations.RemoveField(
+            model_name='message',
+            name='thumbs_up_count',
+        ),
+        migrations.RemoveField(
+            model_name='message',
+            name='angry_count',
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['-reaction_total', '-id'], name='message_reaction_total_idx'),
+        ),
+    ]
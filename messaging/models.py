@@ -1,6 +1,19 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+from . import reaction_types
+
+class ProfileManager(models.Manager):
+    def for_user(self, user):
+        """Return the user's profile, creating it on first access."""
+        try:
+            return user.profile
+        except Profile.DoesNotExist:
+            profile, _ = self.get_or_create(user=user)
+            user.profile = profile
+            return profile
+
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     bio = models.TextField(max_length=500, blank=True)
@@ -11,23 +24,85 @@ class Profile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProfileManager()
+
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
+    def update(self, **values):
+        """Set ``values`` and save only the fields that changed; returns whether it wrote."""
+        changed = [name for name, value in values.items() if getattr(self, name) != value]
+        if not changed:
+            return False
+        for name in changed:
+            setattr(self, name, values[name])
+        self.save(update_fields=changed + ['updated_at'])
+        return True
+
 class Message(models.Model):
     text = models.TextField()
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     timestamp = models.DateTimeField(auto_now_add=True)
-    like_count = models.IntegerField(default=0)
-    laugh_count = models.IntegerField(default=0)
-    sad_count = models.IntegerField(default=0)
-    fire_count = models.IntegerField(default=0)
-    thumbs_up_count = models.IntegerField(default=0)
-    angry_count = models.IntegerField(default=0)
+    # Reactions of every type; the per-type counts are MessageReactionCount
+    # rows. Both are kept in step by messaging.counters.apply_deltas.
+    reaction_total = models.IntegerField(default=0)
+    # Kept in step with the replies by messaging.replies.save_reply.
+    reply_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # The wall and the profile page are keyset-paginated on these.
+            models.Index(fields=['-timestamp', '-id'], name='message_timestamp_idx'),
+            models.Index(fields=['author', '-timestamp', '-id'], name='message_author_timestamp_idx'),
+            models.Index(fields=['-reaction_total', '-id'], name='message_reaction_total_idx'),
+        ]
+
+    # True on the read-only copies messaging.archive builds from ArchivedMessage rows.
+    archived = False
 
     def __str__(self):
         return f"{self.author.username}: {self.text[:50]}"
 
+    def reaction_counts(self):
+        """``{type: n}`` for every registered reaction type.
+
+        Loaded from the summary rows on first use unless
+        ``messaging.counters.attach_reaction_counts`` already set them.
+        """
+        if not hasattr(self, '_reaction_counts'):
+            counts = dict.fromkeys(reaction_types.names(), 0)
+            counts.update(
+                (reaction_type, count)
+                for reaction_type, count in self.reaction_summary.values_list('reaction_type', 'count')
+                if reaction_type in counts
+            )
+            self._reaction_counts = counts
+        return self._reaction_counts
+
+    def set_reaction_counts(self, counts):
+        self._reaction_counts = counts
+
+    def reaction_items(self):
+        """``[(ReactionType, n)]`` in display order, for templates."""
+        counts = self.reaction_counts()
+        return [(reaction_type, counts[reaction_type.name]) for reaction_type in reaction_types.registered()]
+
+
+class MessageReactionCount(models.Model):
+    """How many reactions of one type a message has."""
+    message = models.ForeignKey(Message, related_name='reaction_summary', on_delete=models.CASCADE)
+    reaction_type = models.CharField(max_length=reaction_types.NAME_MAX_LENGTH)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Also the index the counts of a page of messages are read through.
+            models.UniqueConstraint(fields=['message', 'reaction_type'], name='message_reaction_count_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.reaction_type} x{self.count} on message {self.message_id}"
+
 class Reaction(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     message = models.ForeignKey(Message, on_delete=models.CASCADE)
@@ -46,6 +121,11 @@ class Reply(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['message', 'timestamp'], name='reply_message_timestamp_idx'),
+        ]
+
     def __str__(self):
         if self.text:
             return f"Reply by {self.author.username}: {self.text[:50]}"
@@ -66,9 +146,72 @@ class Task(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     completed_at = models.DateTimeField(null=True, blank=True)
+    # Place on the board, set by reordering; new tasks share 0 and sort newest first.
+    position = models.PositiveIntegerField(default=0)
 
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['position', '-created_at']
+        indexes = [
+            models.Index(fields=['position', '-created_at'], name='task_position_idx'),
+            models.Index(fields=['status', 'position', '-created_at'], name='task_status_position_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.get_status_display()}"
+
+
+# Archive
+# Old messages are moved here, with their replies and reactions, by the
+# archive_messages command (see messaging.archive). The tables live in the
+# 'archive' database when one is configured, so they cannot hold database
+# foreign keys to users; ids are kept from the live tables.
+
+class ArchivedMessage(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    text = models.TextField()
+    author = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    timestamp = models.DateTimeField()
+    reaction_total = models.IntegerField(default=0)
+    reply_count = models.IntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Read through from the wall and the profile page in the same order as Message.
+            models.Index(fields=['-timestamp', '-id'], name='archived_message_ts_idx'),
+            models.Index(fields=['author', '-timestamp', '-id'], name='archived_message_author_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived message {self.id}: {self.text[:50]}"
+
+class ArchivedReply(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    message = models.ForeignKey(ArchivedMessage, related_name='replies', on_delete=models.CASCADE)
+    text = models.TextField(blank=True)
+    emoji = models.CharField(max_length=10, blank=True)
+    author = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['message', 'timestamp'], name='archived_reply_message_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived reply {self.id} on message {self.message_id}"
+
+class ArchivedReaction(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    message = models.ForeignKey(ArchivedMessage, related_name='reactions', on_delete=models.CASCADE, db_index=False)
+    reaction_type = models.CharField(max_length=reaction_types.NAME_MAX_LENGTH)
+
+    class Meta:
+        indexes = [
+            # Counts of a page of archived messages are grouped through this.
+            models.Index(fields=['message', 'reaction_type'], name='archived_reaction_type_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived {self.reaction_type} reaction on message {self.message_id}"
@@ -0,0 +1,180 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<KeysetPage of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Cursor pagination over a unique ordering such as ``('-timestamp', '-id')``.
+
+    Pages are fetched with a range condition on the ordering columns instead
+    of OFFSET, so every page costs the same index seek however deep it is,
+    and no COUNT(*) is ever issued. Cursors are opaque url-safe tokens.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-timestamp', '-id')):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+
+    def get_page(self, cursor=None):
+        """Return the page for ``cursor``, falling back to the first page."""
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self.page(None)
+
+    async def aget_page(self, cursor=None):
+        """Async ``get_page``, for views running on the event loop."""
+        try:
+            return await self.apage(cursor)
+        except InvalidCursor:
+            return await self.apage(None)
+
+    def page(self, cursor=None):
+        direction, queryset = self._query(cursor)
+        return self._page(direction, list(queryset))
+
+    async def apage(self, cursor=None):
+        direction, queryset = self._query(cursor)
+        return self._page(direction, [row async for row in queryset])
+
+    def _page(self, direction, rows):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'prev':
+            rows.reverse()
+            return KeysetPage(
+                rows,
+                next_cursor=self.encode_cursor('next', rows[-1]) if rows else None,
+                previous_cursor=self.encode_cursor('prev', rows[0]) if has_more else None,
+            )
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor('next', rows[-1]) if has_more else None,
+            previous_cursor=self.encode_cursor('prev', rows[0]) if direction == 'next' and rows else None,
+        )
+
+    def query(self, cursor=None):
+        """The sliced queryset ``page(cursor)`` runs, e.g. to inspect its plan."""
+        return self._query(cursor)[1]
+
+    def _query(self, cursor, queryset=None):
+        # One row more than a page tells whether there is another page.
+        # ``queryset`` runs the same window over another queryset with the
+        # ordering columns, e.g. the archive (see messaging.archive).
+        if queryset is None:
+            queryset = self.queryset
+        if not cursor:
+            return None, queryset.order_by(*self.ordering)[:self.per_page + 1]
+        direction, values = self.decode_cursor(cursor)
+        if direction == 'next':
+            return direction, queryset.filter(self._after(values)).order_by(*self.ordering)[:self.per_page + 1]
+        reverse = [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+        return direction, queryset.filter(self._before(values)).order_by(*reverse)[:self.per_page + 1]
+
+    def _after(self, values):
+        return self._compare(values, forward=True)
+
+    def _before(self, values):
+        return self._compare(values, forward=False)
+
+    def _compare(self, values, forward):
+        # Lexicographic (a, b) > (x, y) expanded into
+        # a > x OR (a = x AND b > y), honouring each column's direction.
+        condition = Q()
+        for i, name in enumerate(self.ordering):
+            descending = name.startswith('-')
+            lookup = 'lt' if descending == forward else 'gt'
+            term = Q(**{f'{self.fields[i]}__{lookup}': values[i]})
+            for j in range(i):
+                term &= Q(**{self.fields[j]: values[j]})
+            condition |= term
+        # The OR above hides the range from SQLite's planner; bounding the
+        # leading column too lets it seek the index instead of scanning it.
+        descending = self.ordering[0].startswith('-')
+        lookup = 'lte' if descending == forward else 'gte'
+        return Q(**{f'{self.fields[0]}__{lookup}': values[0]}) & condition
+
+    def encode_cursor(self, direction, obj):
+        values = []
+        for name in self.fields:
+            value = getattr(obj, name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        payload = json.dumps([direction, values], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, raw_values = json.loads(payload)
+        except (ValueError, TypeError):
+            raise InvalidCursor(cursor)
+        if direction not in ('next', 'prev') or len(raw_values) != len(self.fields):
+            raise InvalidCursor(cursor)
+
+        opts = self.queryset.model._meta
+        try:
+            values = [opts.get_field(name).to_python(value) for name, value in zip(self.fields, raw_values)]
+        except ValidationError:
+            raise InvalidCursor(cursor)
+        return direction, values
+
+
+class EstimatedCountPaginator(Paginator):
+    """Page-number pagination that avoids COUNT(*) over a whole large table.
+
+    For an unfiltered queryset the count is the highest primary key, a single
+    index lookup. It never undercounts, so every row stays reachable, but
+    gaps left by deleted rows can leave the last pages short or empty. Once
+    the queryset is filtered, or the table holds at most ``exact_limit``
+    rows, the count is exact.
+    """
+
+    exact_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query') or queryset.query.where or queryset.query.is_sliced:
+            return super().count
+        estimate = queryset.model._base_manager.using(queryset.db).aggregate(top=Max('pk'))['top'] or 0
+        if estimate <= self.exact_limit:
+            return super().count
+        return estimate
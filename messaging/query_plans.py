@@ -0,0 +1,93 @@
+"""Query plan checks for the queries behind the busiest pages.
+
+Each entry in ``HOT_QUERIES`` builds the queryset a view runs. ``check_plans``
+asks SQLite for its ``EXPLAIN QUERY PLAN`` and reports queries that scan a
+whole table or sort rows in a temporary B-tree, which means an index the
+query relies on is missing or no longer usable.
+"""
+import re
+
+from django.db import connections, router
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import ArchivedMessage, ArchivedReaction, Message, MessageReactionCount, Reaction, Task
+from .pagination import KeysetPaginator
+from .replies import reply_paginator
+from .tasks import TASK_ORDERING
+
+PER_PAGE = 10
+_FULL_SCAN_RE = re.compile(r'\bSCAN (?!CONSTANT ROW)(\S+)(?!.*\bUSING (?:COVERING )?INDEX\b)')
+_TEMP_SORT_RE = re.compile(r'\bUSE TEMP B-TREE\b')
+
+
+def _cursor(direction):
+    # Any values will do: only the shape of the query matters for its plan.
+    return KeysetPaginator(Message.objects.all(), PER_PAGE).encode_cursor(
+        direction, Message(pk=1000, timestamp=timezone.now())
+    )
+
+
+def _wall(cursor=None):
+    return KeysetPaginator(Message.objects.select_related('author'), PER_PAGE).query(cursor)
+
+
+def _profile(cursor=None):
+    return KeysetPaginator(Message.objects.filter(author_id=1), PER_PAGE).query(cursor)
+
+
+def _archive(**filters):
+    return KeysetPaginator(ArchivedMessage.objects.filter(**filters), PER_PAGE).query(_cursor('next'))
+
+
+def _tasks(next_page=False, **filters):
+    paginator = KeysetPaginator(Task.objects.filter(**filters), 20, ordering=TASK_ORDERING)
+    cursor = paginator.encode_cursor('next', Task(pk=1000, position=0, created_at=timezone.now())) if next_page else None
+    return paginator.query(cursor)
+
+
+HOT_QUERIES = {
+    'wall first page': lambda: _wall(),
+    'wall next page': lambda: _wall(_cursor('next')),
+    'wall previous page': lambda: _wall(_cursor('prev')),
+    'profile first page': lambda: _profile(),
+    'profile next page': lambda: _profile(_cursor('next')),
+    'viewer reactions on a page': lambda: Reaction.objects.filter(user_id=1, message_id__in=[1, 2, 3]),
+    'reaction counts of a page': lambda: MessageReactionCount.objects.filter(message_id__in=[1, 2, 3]),
+    'most reacted messages': lambda: Message.objects.order_by('-reaction_total', '-id')[:10],
+    'latest replies of a message': lambda: reply_paginator(1).query(),
+    'earlier replies of a message': lambda: reply_paginator(1).query(_cursor('next')),
+    'archived wall page': lambda: _archive(),
+    'archived profile page': lambda: _archive(author_id=1),
+    'newest archived message': lambda: ArchivedMessage.objects.order_by('-timestamp', '-id')[:1],
+    'reaction counts of an archived page': lambda: (
+        ArchivedReaction.objects.filter(message_id__in=[1, 2, 3])
+        .order_by().values_list('message_id', 'reaction_type').annotate(n=Count('id'))
+    ),
+    'task list': lambda: _tasks(),
+    'task list next page': lambda: _tasks(next_page=True),
+    'task list by status': lambda: _tasks(status='pending'),
+    'task list by status next page': lambda: _tasks(next_page=True, status='pending'),
+}
+
+
+def plan_problems(plan):
+    """Lines of an ``EXPLAIN QUERY PLAN`` output that show a full scan or a temp sort."""
+    return [line.strip() for line in plan.splitlines()
+            if _FULL_SCAN_RE.search(line) or _TEMP_SORT_RE.search(line)]
+
+
+def check_plans(queries=None):
+    """Return ``{name: (plan, problems)}`` for every hot query.
+
+    Only SQLite plans are understood; other backends get an empty result.
+    """
+    queries = HOT_QUERIES if queries is None else queries
+    connection = connections[router.db_for_read(Message)]
+    if connection.vendor != 'sqlite':
+        return {}
+    results = {}
+    for name, build in queries.items():
+        plan = build().explain()
+        results[name] = (plan, plan_problems(plan))
+    return results
@@ -0,0 +1,50 @@
+"""The reactions users can leave on a message.
+
+Counts are stored as one ``MessageReactionCount`` row per message and type,
+so a new type is a ``register`` call (and an icon) rather than a schema
+change. Types are listed in the order they were registered, which is the
+order the reaction bar shows them in.
+"""
+from dataclasses import dataclass
+
+# Matches the width of Reaction.reaction_type and MessageReactionCount.reaction_type.
+NAME_MAX_LENGTH = 10
+
+
+@dataclass(frozen=True)
+class ReactionType:
+    name: str
+    label: str
+    # Font Awesome icon class.
+    icon: str
+
+
+_registry = {}
+
+
+def register(name, label, icon):
+    if len(name) > NAME_MAX_LENGTH:
+        raise ValueError(f'Reaction type names are at most {NAME_MAX_LENGTH} characters: {name!r}')
+    _registry[name] = reaction_type = ReactionType(name, label, icon)
+    return reaction_type
+
+
+def get(name):
+    """The registered type called ``name``, or ``None``."""
+    return _registry.get(name)
+
+
+def names():
+    return tuple(_registry)
+
+
+def registered():
+    return tuple(_registry.values())
+
+
+register('like', 'Like', 'fa-heart')
+register('laugh', 'Laugh', 'fa-laugh')
+register('sad', 'Sad', 'fa-sad-tear')
+register('fire', 'Fire', 'fa-fire')
+register('thumbs_up', 'Thumbs Up', 'fa-thumbs-up')
+register('angry', 'Angry', 'fa-angry')
@@ -0,0 +1,59 @@
+from django.db import IntegrityError, transaction
+
+from .counters import apply_deltas, get_counts, reaction_buffer
+from .models import Message, Reaction
+from .stats import adjust_user_stats
+from .transactions import retry_on_lock
+
+TOGGLE_ATTEMPTS = 3
+
+
+@retry_on_lock
+def toggle_reaction(user, message_id, reaction_type):
+    """Apply ``user`` clicking ``reaction_type`` on a message.
+
+    Clicking the user's current reaction removes it and clicking a different
+    one switches to it. Counters are changed with ``F()`` expressions so
+    concurrent clicks never overwrite each other; with the reaction buffer
+    enabled they are deferred to it instead. Returns ``(counts, active)``
+    where ``active`` tells whether the reaction is now set.
+    Raises ``Message.DoesNotExist`` for an unknown message.
+    """
+    for attempt in range(TOGGLE_ATTEMPTS):
+        try:
+            buffered = reaction_buffer.enabled()
+            with transaction.atomic():
+                author_id, deltas, active = _toggle(user, message_id, reaction_type, lock_message=not buffered)
+                transaction.on_commit(lambda: adjust_user_stats(author_id, reactions=deltas))
+                if buffered:
+                    transaction.on_commit(lambda: reaction_buffer.add(message_id, deltas))
+                else:
+                    apply_deltas(message_id, deltas)
+            return get_counts(message_id), active
+        except IntegrityError:
+            # A parallel request from the same user created the reaction
+            # first; retry against the row it wrote.
+            if attempt == TOGGLE_ATTEMPTS - 1:
+                raise
+
+
+def _toggle(user, message_id, reaction_type, lock_message=True):
+    # Locking the message row serializes reactions on it where the backend
+    # supports row locks; SQLite already serializes writers. Buffered
+    # counters never touch the row here, so there is nothing to serialize.
+    messages = Message.objects.select_for_update() if lock_message else Message.objects
+    author_id = messages.only('id', 'author_id').get(pk=message_id).author_id
+    existing = Reaction.objects.select_for_update().filter(user=user, message_id=message_id).first()
+
+    if existing is None:
+        Reaction.objects.create(user=user, message_id=message_id, reaction_type=reaction_type)
+        deltas, active = {reaction_type: 1}, True
+    elif existing.reaction_type == reaction_type:
+        existing.delete()
+        deltas, active = {reaction_type: -1}, False
+    else:
+        deltas, active = {existing.reaction_type: -1, reaction_type: 1}, True
+        existing.reaction_type = reaction_type
+        existing.save(update_fields=['reaction_type'])
+    return author_id, deltas, active
+
@@ -0,0 +1,71 @@
+"""Replies under the messages on the wall.
+
+Each card shows the latest ``REPLIES_PREVIEW`` replies of its message; older
+ones are fetched on demand a page at a time. ``Message.reply_count`` is kept
+next to the replies so the wall knows which messages have any, and how many,
+without counting them on every request.
+"""
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Prefetch, Subquery, prefetch_related_objects
+from django.db.models.functions import Coalesce
+
+from .models import Message, Reply
+from .pagination import KeysetPaginator
+from .transactions import retry_on_lock
+
+REPLIES_PREVIEW = 3
+REPLIES_PER_PAGE = 10
+REPLY_ORDERING = ('-timestamp', '-id')
+
+
+@retry_on_lock
+def save_reply(reply):
+    """Save ``reply`` and count it on its message in the same transaction."""
+    with transaction.atomic():
+        reply.save()
+        Message.objects.filter(pk=reply.message_id).update(reply_count=F('reply_count') + 1)
+
+
+def recount_replies(message_ids):
+    """Recompute ``reply_count`` of ``message_ids``, e.g. after replies were deleted in bulk."""
+    replies = (
+        Reply.objects.filter(message=OuterRef('pk'))
+        .order_by().values('message').annotate(total=Count('pk')).values('total')
+    )
+    Message.objects.filter(pk__in=message_ids).update(reply_count=Coalesce(Subquery(replies), 0))
+
+
+def reply_paginator(message_id, per_page=REPLIES_PER_PAGE):
+    """Newest-first keyset paginator over the replies of one message."""
+    replies = Reply.objects.filter(message_id=message_id).select_related('author')
+    return KeysetPaginator(replies, per_page, ordering=REPLY_ORDERING)
+
+
+def attach_latest_replies(messages, limit=REPLIES_PREVIEW):
+    """Set ``latest_replies`` (oldest first) and ``more_replies_cursor`` on ``messages``.
+
+    Messages without replies are skipped on ``reply_count``, and the others
+    share one windowed query that returns at most ``limit`` rows per message.
+    Archived messages come with their replies attached and are skipped.
+    """
+    with_replies = []
+    for message in messages:
+        if message.archived:
+            continue
+        message.more_replies_cursor = None
+        if message.reply_count > 0:
+            with_replies.append(message)
+        else:
+            message.latest_replies = []
+    if not with_replies:
+        return
+    # Prefetching skips instances that already have the attribute set.
+    latest = Reply.objects.select_related('author').order_by(*REPLY_ORDERING)[:limit]
+    prefetch_related_objects(with_replies, Prefetch('replies', queryset=latest, to_attr='latest_replies'))
+    for message in with_replies:
+        message.latest_replies.reverse()
+        if message.reply_count > len(message.latest_replies):
+            # Older replies continue after the oldest one shown.
+            message.more_replies_cursor = reply_paginator(message.pk).encode_cursor(
+                'next', message.latest_replies[0]
+            )
@@ -0,0 +1,44 @@
+"""Database routing for the message archive.
+
+With an ``archive`` entry in ``DATABASES`` the archive models
+(``ArchivedMessage``, ``ArchivedReply``, ``ArchivedReaction``) are read,
+written and migrated there and everything else stays on ``default``;
+without one, the archive tables sit in the default database.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+ARCHIVE_DB_ALIAS = 'archive'
+ARCHIVE_MODELS = {'archivedmessage', 'archivedreply', 'archivedreaction'}
+
+
+def archive_db():
+    """The alias the archive tables live in."""
+    return ARCHIVE_DB_ALIAS if ARCHIVE_DB_ALIAS in settings.DATABASES else DEFAULT_DB_ALIAS
+
+
+def is_archive_model(model):
+    # A model class or instance.
+    return model._meta.app_label == 'messaging' and model._meta.model_name in ARCHIVE_MODELS
+
+
+class ArchiveRouter:
+    def db_for_read(self, model, **hints):
+        # Everything else goes to default explicitly: the archive models point
+        # at users, and Django would otherwise look users up in the database
+        # the archived row came from.
+        return archive_db() if is_archive_model(model) else DEFAULT_DB_ALIAS
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if is_archive_model(obj1) or is_archive_model(obj2):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if ARCHIVE_DB_ALIAS not in settings.DATABASES:
+            return None
+        if app_label == 'messaging' and model_name in ARCHIVE_MODELS:
+            return db == ARCHIVE_DB_ALIAS
+        return db != ARCHIVE_DB_ALIAS
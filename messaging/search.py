@@ -0,0 +1,112 @@
+"""Message search.
+
+On SQLite, messages are indexed in an FTS5 virtual table (``rowid`` is the
+message id) and searched with ranked prefix queries. Other backends fall
+back to ``icontains`` filtering.
+"""
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Message
+
+FTS_TABLE = 'messaging_message_fts'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_fts_ready = {}
+
+
+def _connection():
+    return connections[router.db_for_write(Message)]
+
+
+def fts_enabled(connection=None):
+    """Whether the FTS index exists on ``connection`` (checked once per alias)."""
+    connection = connection or _connection()
+    if connection.alias not in _fts_ready:
+        ready = False
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+                ready = cursor.fetchone() is not None
+        _fts_ready[connection.alias] = ready
+    return _fts_ready[connection.alias]
+
+
+def tokens(query):
+    """The words of a free-text query."""
+    return _TOKEN_RE.findall(query)
+
+
+def match_expression(query):
+    """Turn free text into an FTS5 query: every word must match as a prefix."""
+    return ' '.join(f'"{token}"*' for token in tokens(query))
+
+
+def filter_messages(queryset, query):
+    """Restrict ``queryset`` to messages matching ``query``."""
+    if not fts_enabled():
+        return queryset.filter(Q(text__icontains=query) | Q(author__username__icontains=query))
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    return queryset.filter(
+        id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [expression])
+    )
+
+
+def ranked_message_ids(query, limit):
+    """Ids of the ``limit`` best matches for ``query``, best first."""
+    if not fts_enabled():
+        return list(
+            filter_messages(Message.objects.all(), query)
+            .order_by('-timestamp', '-id')
+            .values_list('id', flat=True)[:limit]
+        )
+    expression = match_expression(query)
+    if not expression:
+        return []
+    with _connection().cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rank LIMIT %s',
+            [expression, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def index_message(message):
+    if not fts_enabled():
+        return
+    with _connection().cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [message.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, text, author) VALUES (%s, %s, %s)',
+            [message.pk, message.text, message.author.username],
+        )
+
+
+def unindex_message(message_id):
+    if not fts_enabled():
+        return
+    with _connection().cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [message_id])
+
+
+def rebuild_index():
+    """Repopulate the whole index with one INSERT ... SELECT; returns the row count."""
+    if not fts_enabled():
+        return 0
+    message_table = Message._meta.db_table
+    user_table = Message._meta.get_field('author').related_model._meta.db_table
+    with _connection().cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, text, author) '
+            f'SELECT m.id, m.text, u.username FROM {message_table} m '
+            f'JOIN {user_table} u ON u.id = m.author_id'
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
@@ -0,0 +1,101 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // 1. Dark Mode Toggle
+    const themeToggle = document.getElementById('themeToggle');
+    const html = document.documentElement;
+    const currentTheme = localStorage.getItem('theme') || 'light';
+
+    if (currentTheme === 'dark') {
+        html.setAttribute('data-theme', 'dark');
+        themeToggle.querySelector('i').className = 'fas fa-sun';
+    }
+
+    themeToggle.addEventListener('click', function() {
+        const isDark = html.getAttribute('data-theme') === 'dark';
+        const newTheme = isDark ? 'light' : 'dark';
+        html.setAttribute('data-theme', newTheme);
+        localStorage.setItem('theme', newTheme);
+        this.querySelector('i').className = isDark ? 'fas fa-sun' : 'fas fa-moon';
+    });
+
+    // 2. Global Confirm Delete Modal
+    window.showDeleteConfirm = function(deleteUrl) {
+        document.getElementById('confirmDeleteBtn').href = deleteUrl;
+        const modal = new bootstrap.Modal(document.getElementById('confirmDeleteModal'));
+        modal.show();
+    };
+
+    // 3. Bootstrap Tooltips init
+    const tooltipTriggerList = [].slice.call(document.querySelectorAll('[data-bs-toggle=\"tooltip\"]'));
+    tooltipTriggerList.map(function (tooltipTriggerEl) {
+        return new bootstrap.Tooltip(tooltipTriggerEl);
+    });
+
+    // 4. Toast notification function
+    window.showToast = function(message, type = 'success') {
+        const container = document.querySelector('.toast-container');
+        const toastHtml = `
+            <div class="toast align-items-center text-white bg-${type === 'success' ? 'success' : 'danger'} border-0" role="alert">
+                <div class="d-flex">
+                    <div class="toast-body">${message}</div>
+                    <button type="button" class="btn-close btn-close-white me-2 m-auto" data-bs-dismiss="toast"></button>
+                </div>
+            </div>
+        `;
+        container.innerHTML = toastHtml;
+        const toast = new bootstrap.Toast(container.querySelector('.toast'));
+        toast.show();
+    };
+
+    // 5. Cursor Follower
+    const cursorFollower = document.getElementById('cursorFollower');
+    let mouseX = 0, mouseY = 0, followerX = 0, followerY = 0;
+
+    document.addEventListener('mousemove', e => {
+        mouseX = e.clientX;
+        mouseY = e.clientY;
+    });
+
+    const interactiveElements = document.querySelectorAll('a, button, [data-bs-toggle], .reaction-button');
+    interactiveElements.forEach(el => {
+        el.addEventListener('mouseenter', () => cursorFollower.classList.add('hovering'));
+        el.addEventListener('mouseleave', () => cursorFollower.classList.remove('hovering'));
+    });
+
+    function animateCursor() {
+        const dx = mouseX - followerX;
+        const dy = mouseY - followerY;
+        followerX += dx * 0.15;
+        followerY += dy * 0.15;
+        cursorFollower.style.left = (followerX - 20) + 'px';
+        cursorFollower.style.top = (followerY - 20) + 'px';
+        requestAnimationFrame(animateCursor);
+    }
+    animateCursor();
+
+    // 6. Scroll animations for cards
+    const observerOptions = { threshold: 0.1, rootMargin: '0px 0px -100px 0px' };
+    const observer = new IntersectionObserver(entries => {
+        entries.forEach(entry => {
+            if (entry.isIntersecting) {
+                entry.target.style.opacity = '1';
+                entry.target.style.transform = 'translateY(0)';
+            }
+        });
+    }, observerOptions);
+
+    document.querySelectorAll('.card').forEach(card => {
+        card.style.opacity = '0';
+        card.style.transform = 'translateY(20px)';
+        card.style.transition = 'opacity 0.5s ease, transform 0.5s ease';
+        observer.observe(card);
+    });
+});
+
+// Service worker: serves the app shell (styles, scripts, icons, fonts) from
+// its cache so repeat visits only download the page itself.
+window.addEventListener('load', () => {
+    const url = document.body.dataset.serviceWorker;
+    if ('serviceWorker' in navigator && url) {
+        navigator.serviceWorker.register(url).catch(error => console.error('Service worker registration failed:', error));
+    }
+});
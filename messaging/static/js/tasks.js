@@ -0,0 +1,107 @@
+const bulkTasksUrl = document.getElementById('taskBoard').dataset.bulkUrl;
+
+function csrfToken() {
+  const input = document.querySelector('[name=csrfmiddlewaretoken]');
+  return input ? input.value : '';
+}
+
+// Every change goes through the bulk endpoint, one request per action.
+function updateTasks(operation, ids, status) {
+  return fetch(bulkTasksUrl, {
+    method: 'POST',
+    headers: { 'X-CSRFToken': csrfToken(), 'Content-Type': 'application/json' },
+    body: JSON.stringify({ operation: operation, ids: ids, status: status })
+  }).then(response => {
+    if (!response.ok) {
+      return response.json().then(data => Promise.reject(new Error(data.error)));
+    }
+    // Status changes restyle the cards and counts, so reload the board;
+    // deletes and reorders are already reflected in place.
+    if (operation === 'status') {
+      window.location.reload();
+    }
+    return response.json();
+  }).catch(error => alert(error.message || 'The tasks could not be updated.'));
+}
+
+function selectedTaskIds() {
+  return Array.from(document.querySelectorAll('.task-select:checked')).map(box => parseInt(box.value));
+}
+
+function refreshSelection() {
+  const count = selectedTaskIds().length;
+  document.getElementById('selectedCount').textContent = count;
+  document.getElementById('bulkStatusButton').disabled = !count;
+  document.getElementById('bulkDeleteButton').disabled = !count;
+}
+
+function startBulkActions() {
+  const container = document.getElementById('tasks');
+  if (!container) {
+    return;
+  }
+  container.addEventListener('change', event => {
+    if (event.target.classList.contains('task-select')) {
+      refreshSelection();
+    }
+  });
+  document.getElementById('selectAllTasks').addEventListener('change', event => {
+    document.querySelectorAll('.task-select').forEach(box => {
+      box.checked = event.target.checked;
+    });
+    refreshSelection();
+  });
+  document.getElementById('bulkStatusButton').addEventListener('click', () => {
+    updateTasks('status', selectedTaskIds(), document.getElementById('bulkStatus').value);
+  });
+  document.getElementById('bulkDeleteButton').addEventListener('click', () => {
+    const ids = selectedTaskIds();
+    if (!confirm(`Delete ${ids.length} task(s)?`)) {
+      return;
+    }
+    updateTasks('delete', ids).then(data => {
+      if (data) {
+        ids.forEach(id => container.querySelector(`.task-card[data-id="${id}"]`).remove());
+        refreshSelection();
+      }
+    });
+  });
+}
+
+// Drag a card onto another to move it there; the new order of the whole
+// board is saved in one request.
+function startReordering() {
+  const container = document.getElementById('tasks');
+  if (!container || !('reorderable' in container.dataset)) {
+    return;
+  }
+  let dragged = null;
+  container.addEventListener('dragstart', event => {
+    dragged = event.target.closest('.task-card');
+    dragged.classList.add('dragging');
+  });
+  container.addEventListener('dragover', event => {
+    event.preventDefault();
+    const target = event.target.closest('.task-card');
+    if (!dragged || !target || target === dragged) {
+      return;
+    }
+    const box = target.getBoundingClientRect();
+    const after = event.clientY > box.top + box.height / 2;
+    container.insertBefore(dragged, after ? target.nextSibling : target);
+  });
+  container.addEventListener('dragend', () => {
+    if (!dragged) {
+      return;
+    }
+    dragged.classList.remove('dragging');
+    dragged = null;
+    const ids = Array.from(container.querySelectorAll('.task-card')).map(card => parseInt(card.dataset.id));
+    updateTasks('reorder', ids);
+  });
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+  startBulkActions();
+  startReordering();
+});
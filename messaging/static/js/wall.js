@@ -0,0 +1,323 @@
+let lastMessageId = 0;
+let feedEtag = null;
+let isAutoRefreshEnabled = true;
+// URLs and the viewer come from data attributes the template sets.
+const wall = document.getElementById('messages').dataset;
+const currentUsername = wall.username;
+
+// Get the latest message ID on page load
+function initializeLastMessageId() {
+  lastMessageId = Math.max(0, ...visibleMessageIds());
+}
+
+// Character counter
+const messageInput = document.getElementById('messageInput');
+const charCount = document.getElementById('charCount');
+
+messageInput.addEventListener('input', function() {
+  charCount.textContent = this.value.length;
+  if (this.value.length > 500) {
+    this.value = this.value.substring(0, 500);
+    charCount.textContent = '500';
+  }
+});
+
+// Post new message without page reload
+document.getElementById('messageForm').addEventListener('submit', function(e) {
+  e.preventDefault();
+  const submitBtn = this.querySelector('button[type=\"submit\"]');
+  const originalText = submitBtn.innerHTML;
+  submitBtn.innerHTML = '<span class="loading spinner-border spinner-border-sm me-2"></span>Posting...';
+  submitBtn.disabled = true;
+
+  const formData = new FormData(this);
+  fetch(wall.addUrl, {
+    method: 'POST',
+    body: formData,
+    headers: {
+      'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value
+    }
+  }).then(response => {
+    if (response.ok) {
+      messageInput.value = '';
+      charCount.textContent = '0';
+      showToast('Message posted successfully!', 'success');
+      // Immediately fetch new messages
+      fetchNewMessages();
+    } else {
+      showToast('Failed to post message. Try again.', 'danger');
+    }
+    submitBtn.innerHTML = originalText;
+    submitBtn.disabled = false;
+  }).catch(() => {
+    showToast('Network error. Please check your connection.', 'danger');
+    submitBtn.innerHTML = originalText;
+    submitBtn.disabled = false;
+  });
+});
+
+// Ask the delta feed for messages newer than the newest one on the page
+// and for fresh reaction counts of the ones already shown. The server
+// answers 304 Not Modified when nothing changed since the last poll.
+function fetchNewMessages() {
+  const searchQuery = new URLSearchParams(window.location.search).get('q') || '';
+  const url = new URL(wall.feedUrl, window.location.origin);
+  if (searchQuery) {
+    url.searchParams.set('q', searchQuery);
+  }
+  url.searchParams.set('since', lastMessageId);
+  url.searchParams.set('ids', visibleMessageIds().join(','));
+
+  const headers = {};
+  if (feedEtag) {
+    headers['If-None-Match'] = feedEtag;
+  }
+
+  fetch(url.toString(), { headers: headers, cache: 'no-store' })
+    .then(response => {
+      if (response.status === 304 || !response.ok) {
+        return null;
+      }
+      feedEtag = response.headers.get('ETag');
+      return response.json();
+    })
+    .then(data => {
+      if (data) {
+        applyFeed(data);
+      }
+    })
+    .catch(error => console.error('Error fetching messages:', error));
+}
+
+function visibleMessageIds() {
+  return Array.from(document.querySelectorAll('#messages .message')).map(m => parseInt(m.dataset.id));
+}
+
+function applyFeed(data) {
+  const messagesContainer = document.getElementById('messages');
+  const currentIds = new Set(visibleMessageIds());
+
+  // Messages arrive oldest first; inserting each on top leaves the newest there.
+  data.messages.forEach(item => {
+    if (currentIds.has(item.id)) {
+      return;
+    }
+    const template = document.createElement('template');
+    template.innerHTML = item.html.trim();
+    const newMsg = template.content.firstElementChild;
+    newMsg.style.opacity = '0';
+    newMsg.style.transform = 'translateY(20px)';
+    messagesContainer.insertBefore(newMsg, messagesContainer.firstChild);
+
+    // Trigger animation
+    setTimeout(() => {
+      newMsg.style.transition = 'opacity 0.3s ease, transform 0.3s ease';
+      newMsg.style.opacity = '1';
+      newMsg.style.transform = 'translateY(0)';
+    }, 10);
+
+    updateMessageCount(1);
+  });
+
+  Object.entries(data.reactions).forEach(([messageId, counts]) => {
+    updateReactionCounts(messageId, counts);
+  });
+
+  data.deleted.forEach(messageId => {
+    const card = messagesContainer.querySelector(`.message[data-id="${messageId}"]`);
+    if (card) {
+      card.remove();
+      updateMessageCount(-1);
+    }
+  });
+
+  lastMessageId = Math.max(lastMessageId, data.latest_id);
+}
+
+function updateReactionCounts(messageId, counts) {
+  const card = document.querySelector(`#messages .message[data-id="${messageId}"]`);
+  if (!card) {
+    return;
+  }
+  Object.entries(counts).forEach(([reactionType, count]) => {
+    const button = card.querySelector(`.reaction-button[data-type="${reactionType}"] small`);
+    if (button) {
+      button.textContent = count;
+    }
+  });
+}
+
+function updateMessageCount(delta) {
+  const badge = document.querySelector('.badge');
+  if (badge) {
+    const count = (parseInt(badge.textContent) || 0) + delta;
+    badge.innerHTML = '<i class="fas fa-envelope"></i> ' + count + ' messages';
+  }
+}
+
+// Auto-refresh messages every 3 seconds
+function startAutoRefresh() {
+  setInterval(() => {
+    if (isAutoRefreshEnabled) {
+      fetchNewMessages();
+    }
+  }, 3000);
+}
+
+// Subscribe to server-pushed updates. While the stream is open polling is
+// paused; when it drops (or the server runs under WSGI) polling takes over.
+function startLiveUpdates() {
+  if (!window.EventSource) {
+    return;
+  }
+  const searchQuery = new URLSearchParams(window.location.search).get('q');
+  const source = new EventSource(wall.eventsUrl);
+
+  source.onopen = () => {
+    isAutoRefreshEnabled = false;
+    // Catch up on anything published while we were disconnected.
+    fetchNewMessages();
+  };
+  source.onerror = () => {
+    isAutoRefreshEnabled = true;
+  };
+
+  source.addEventListener('message.created', event => {
+    const data = JSON.parse(event.data);
+    // Filtered walls and our own messages need the viewer-specific rendering.
+    if (searchQuery || data.author === currentUsername) {
+      fetchNewMessages();
+      return;
+    }
+    applyFeed({ messages: [{ id: data.id, html: data.html }], reactions: {}, deleted: [], latest_id: 0 });
+  });
+  source.addEventListener('reaction.updated', event => {
+    const data = JSON.parse(event.data);
+    updateReactionCounts(data.message_id, data.counts);
+  });
+  source.addEventListener('reply.created', event => {
+    const data = JSON.parse(event.data);
+    appendReply(data.message_id, data.id, data.html);
+  });
+  source.addEventListener('message.deleted', event => {
+    const data = JSON.parse(event.data);
+    applyFeed({ messages: [], reactions: {}, deleted: [data.id], latest_id: 0 });
+  });
+  source.addEventListener('resync', () => fetchNewMessages());
+}
+
+// Infinite scroll: when the "Older" link comes into view, append the next
+// page in place and move the link's cursor forward.
+function startInfiniteScroll() {
+  const olderLink = document.getElementById('olderMessagesLink');
+  if (!olderLink || !window.IntersectionObserver) {
+    return;
+  }
+  let loading = false;
+  const observer = new IntersectionObserver(entries => {
+    if (!entries[0].isIntersecting || loading) {
+      return;
+    }
+    loading = true;
+    const url = new URL(wall.pageUrl, window.location.origin);
+    const searchQuery = new URLSearchParams(window.location.search).get('q');
+    if (searchQuery) {
+      url.searchParams.set('q', searchQuery);
+    }
+    url.searchParams.set('cursor', olderLink.dataset.cursor);
+    fetch(url.toString())
+      .then(response => response.json())
+      .then(data => {
+        const messagesContainer = document.getElementById('messages');
+        const currentIds = new Set(visibleMessageIds());
+        data.messages.forEach(item => {
+          if (!currentIds.has(item.id)) {
+            messagesContainer.insertAdjacentHTML('beforeend', item.html);
+          }
+        });
+        if (data.next) {
+          olderLink.dataset.cursor = data.next;
+          olderLink.href = '?cursor=' + data.next + (searchQuery ? '&q=' + encodeURIComponent(searchQuery) : '');
+        } else {
+          observer.disconnect();
+          olderLink.closest('li').remove();
+        }
+        loading = false;
+      })
+      .catch(() => {
+        loading = false;
+      });
+  });
+  observer.observe(olderLink);
+}
+
+// Older replies: each click prepends the next page above the ones shown.
+function startReplyLoading() {
+  document.getElementById('messages').addEventListener('click', event => {
+    const button = event.target.closest('.load-replies');
+    if (!button || button.disabled) {
+      return;
+    }
+    button.disabled = true;
+    const url = new URL(button.dataset.url, window.location.origin);
+    url.searchParams.set('cursor', button.dataset.cursor);
+    fetch(url.toString())
+      .then(response => response.json())
+      .then(data => {
+        const list = button.closest('.replies').querySelector('.reply-list');
+        data.replies.forEach(item => {
+          if (!list.querySelector(`.reply[data-id="${item.id}"]`)) {
+            list.insertAdjacentHTML('afterbegin', item.html);
+          }
+        });
+        if (data.next) {
+          button.dataset.cursor = data.next;
+          button.disabled = false;
+        } else {
+          button.remove();
+        }
+      })
+      .catch(() => {
+        button.disabled = false;
+      });
+  });
+}
+
+function appendReply(messageId, id, html) {
+  const list = document.querySelector(`#messages .message[data-id="${messageId}"] .reply-list`);
+  if (list && !list.querySelector(`.reply[data-id="${id}"]`)) {
+    list.insertAdjacentHTML('beforeend', html);
+  }
+}
+
+// React to messages
+function react(element, reactionType) {
+  const messageDiv = element.closest('.message');
+  const messageId = messageDiv.dataset.id;
+  fetch(`/react/${messageId}/${reactionType}/`, {
+    method: 'POST',
+    headers: {
+      'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value,
+      'Content-Type': 'application/json'
+    }
+  }).then(response => response.json()).then(data => {
+    updateReactionCounts(messageId, data.counts);
+    // A user holds at most one reaction per message: clicking it again
+    // removes it, clicking another one moves it.
+    messageDiv.querySelectorAll('.reaction-button').forEach(button => {
+      button.classList.remove('active', 'btn-primary', 'text-white');
+    });
+    if (data.active) {
+      element.classList.add('active', 'btn-primary', 'text-white');
+    }
+  });
+}
+
+// Initialize on page load
+document.addEventListener('DOMContentLoaded', function() {
+  initializeLastMessageId();
+  startAutoRefresh();
+  startLiveUpdates();
+  startInfiniteScroll();
+  startReplyLoading();
+});
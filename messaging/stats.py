@@ -0,0 +1,119 @@
+"""Per-user posting statistics.
+
+The summary (message count and reactions received per type) is computed with
+one aggregate over the user's messages and their reaction summary rows, plus
+one over the archive, and kept in the cache as one counter per value, so
+posts, reactions and deletes can adjust it with atomic ``incr`` calls instead
+of invalidating it. Every adjustment also bumps the user's profile version so
+cached profile pages are re-rendered. With the per-process cache the
+adjustments would only reach the worker that made them, so there the summary
+is computed on every read.
+"""
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+
+from . import reaction_types
+from .caching import bump_version, is_shared
+from .models import ArchivedMessage, Message
+
+STATS_TIMEOUT = 60 * 60 * 24
+
+
+def _key(user_id, name):
+    return f'messaging:user-stats:{user_id}:{name}'
+
+
+def _stat_names():
+    # Read on every call so types registered after import are included.
+    return ('messages',) + reaction_types.names()
+
+
+def _received(reaction_type):
+    # Prefixed so a type can't clash with the count or a model field.
+    return f'received_{reaction_type}'
+
+
+def _stats_queries(user_id):
+    """``(queryset, aggregates)`` for the live messages and for the archive."""
+    names = reaction_types.names()
+    received = {
+        _received(name): Sum('reaction_summary__count', filter=Q(reaction_summary__reaction_type=name))
+        for name in names
+    }
+    archived_received = {
+        _received(name): Count('reactions', filter=Q(reactions__reaction_type=name)) for name in names
+    }
+    # Joining the reactions repeats each message, hence the distinct count.
+    return (
+        (Message.objects.filter(author_id=user_id), dict(received, messages=Count('id', distinct=True))),
+        (ArchivedMessage.objects.filter(author_id=user_id),
+         dict(archived_received, messages=Count('id', distinct=True))),
+    )
+
+
+def _values(*results):
+    values = {name: sum(result[_received(name)] or 0 for result in results) for name in reaction_types.names()}
+    values['messages'] = sum(result['messages'] for result in results)
+    return values
+
+
+def compute_user_stats(user_id):
+    return _values(*(messages.aggregate(**aggregates) for messages, aggregates in _stats_queries(user_id)))
+
+
+async def acompute_user_stats(user_id):
+    return _values(*[await messages.aaggregate(**aggregates) for messages, aggregates in _stats_queries(user_id)])
+
+
+def user_stats(user_id):
+    """Return ``{'messages', 'reactions': {type: n}, 'total_reactions'}`` for a user."""
+    if not is_shared():
+        return _summary(compute_user_stats(user_id))
+    keys = {name: _key(user_id, name) for name in _stat_names()}
+    cached = cache.get_many(keys.values())
+    if len(cached) == len(keys):
+        values = {name: cached[key] for name, key in keys.items()}
+    else:
+        values = compute_user_stats(user_id)
+        cache.set_many({keys[name]: value for name, value in values.items()}, STATS_TIMEOUT)
+    return _summary(values)
+
+
+async def auser_stats(user_id):
+    """Async ``user_stats``."""
+    if not is_shared():
+        return _summary(await acompute_user_stats(user_id))
+    keys = {name: _key(user_id, name) for name in _stat_names()}
+    cached = await cache.aget_many(keys.values())
+    if len(cached) == len(keys):
+        values = {name: cached[key] for name, key in keys.items()}
+    else:
+        values = await acompute_user_stats(user_id)
+        await cache.aset_many({keys[name]: value for name, value in values.items()}, STATS_TIMEOUT)
+    return _summary(values)
+
+
+def _summary(values):
+    reactions = {reaction_type: values[reaction_type] for reaction_type in reaction_types.names()}
+    return {
+        'messages': values['messages'],
+        'reactions': reactions,
+        'total_reactions': sum(reactions.values()),
+    }
+
+
+def adjust_user_stats(user_id, messages=0, reactions=None):
+    """Apply deltas to a cached summary; a missing summary is left to be recomputed."""
+    if not is_shared():
+        return
+    bump_version(f'profile:{user_id}')
+    deltas = dict(reactions or {}, messages=messages)
+    for name, delta in deltas.items():
+        if not delta:
+            continue
+        try:
+            cache.incr(_key(user_id, name), delta)
+        except ValueError:
+            # Not cached (or evicted): the next read recomputes everything.
+            cache.delete_many([_key(user_id, stat) for stat in _stat_names()])
+            return
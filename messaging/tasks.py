@@ -0,0 +1,102 @@
+"""The task board: its ordering, status counts and changes to many tasks at once.
+
+Every bulk operation is a single UPDATE or DELETE over the given ids inside
+one transaction, however many tasks it touches. The per-status counts come
+from one grouped query and, with a shared cache, are cached until a task
+changes; with the per-process cache only the worker that changed a task
+would see the new counts, so there they are counted on every request.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .caching import bump_version, get_version, is_shared
+from .models import Task
+from .transactions import retry_on_lock
+
+# Board order; the id tie-break follows the rowid SQLite keeps in every index.
+TASK_ORDERING = ('position', '-created_at', 'id')
+COUNTS_TIMEOUT = 60 * 10
+MAX_BULK_TASKS = 1000
+OPERATIONS = ('status', 'delete', 'reorder')
+
+
+class BulkTaskError(ValueError):
+    pass
+
+
+def invalidate_task_counts():
+    bump_version('tasks')
+
+
+async def astatus_counts(tasks=None):
+    """``{status: n}`` for every status, from one grouped aggregate.
+
+    Counts of the whole board are cached when the cache is shared; pass a
+    filtered ``tasks`` queryset to count only its rows, uncached.
+    """
+    key = None
+    if tasks is None and not is_shared():
+        tasks = Task.objects.all()
+    elif tasks is None:
+        key = f'messaging:task-counts:{get_version("tasks")}'
+        counts = await cache.aget(key)
+        if counts is not None:
+            return counts
+        tasks = Task.objects.all()
+    counts = dict.fromkeys(dict(Task.STATUS_CHOICES), 0)
+    async for status, total in tasks.order_by().values_list('status').annotate(total=Count('id')):
+        counts[status] = total
+    if key:
+        await cache.aset(key, counts, COUNTS_TIMEOUT)
+    return counts
+
+
+def status_changes(status, now=None):
+    """Field values that move tasks to ``status``.
+
+    Completing a task stamps ``completed_at`` unless it was already
+    completed; any other status clears it.
+    """
+    if status not in dict(Task.STATUS_CHOICES):
+        raise BulkTaskError(f'Unknown status {status!r}.')
+    now = now or timezone.now()
+    completed_at = Coalesce(F('completed_at'), Value(now)) if status == 'completed' else None
+    return {'status': status, 'completed_at': completed_at, 'updated_at': now}
+
+
+@retry_on_lock
+def bulk_update_tasks(ids, operation, status=None):
+    """Apply ``operation`` to the tasks in ``ids`` and return how many rows it changed.
+
+    ``reorder`` places the tasks in the order of ``ids``; tasks left out keep
+    their position. Unknown ids are ignored.
+    """
+    if operation not in OPERATIONS:
+        raise BulkTaskError(f'Unknown operation {operation!r}.')
+    if not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+        raise BulkTaskError('ids must be a list of task ids.')
+    if len(ids) > MAX_BULK_TASKS:
+        raise BulkTaskError(f'At most {MAX_BULK_TASKS} tasks can be changed at once.')
+    if len(set(ids)) != len(ids):
+        raise BulkTaskError('ids must not repeat.')
+    if not ids:
+        return 0
+
+    tasks = Task.objects.filter(pk__in=ids)
+    changes = status_changes(status) if operation == 'status' else None
+    with transaction.atomic():
+        if operation == 'status':
+            count = tasks.update(**changes)
+        elif operation == 'delete':
+            count = tasks.delete()[0]
+        else:
+            count = tasks.update(
+                position=Case(*(When(pk=pk, then=Value(i)) for i, pk in enumerate(ids))),
+                updated_at=timezone.now(),
+            )
+    if operation != 'reorder':
+        invalidate_task_counts()
+    return count
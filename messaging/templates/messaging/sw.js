@@ -0,0 +1,47 @@
+// Service worker for the message board, rendered by messaging.views.service_worker.
+// It precaches the app shell under its content-hashed URLs; a deploy that
+// changes any of them renders a new CACHE name, which installs afresh and
+// drops the previous cache on activation.
+const CACHE = 'messageboard-shell-{{ version }}';
+const SHELL = {{ shell_json|safe }};
+const STATIC_URL = '{{ static_url|escapejs }}';
+// Versioned CDN assets (Bootstrap, Font Awesome, web fonts) the pages link to.
+const CDN_HOSTS = ['cdn.jsdelivr.net', 'cdnjs.cloudflare.com', 'fonts.googleapis.com', 'fonts.gstatic.com'];
+
+self.addEventListener('install', event => {
+  event.waitUntil(
+    caches.open(CACHE).then(cache => cache.addAll(SHELL)).then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener('activate', event => {
+  event.waitUntil(
+    caches.keys()
+      .then(keys => Promise.all(
+        keys.filter(key => key.startsWith('messageboard-shell-') && key !== CACHE).map(key => caches.delete(key))
+      ))
+      .then(() => self.clients.claim())
+  );
+});
+
+// Static and CDN assets are served cache-first and cached on first use.
+// Pages, JSON and the event stream are left to the network.
+self.addEventListener('fetch', event => {
+  const request = event.request;
+  if (request.method !== 'GET') {
+    return;
+  }
+  const url = new URL(request.url);
+  const isStatic = url.origin === self.location.origin && url.pathname.startsWith(STATIC_URL);
+  if (!isStatic && !CDN_HOSTS.includes(url.hostname)) {
+    return;
+  }
+  event.respondWith(
+    caches.open(CACHE).then(cache => cache.match(request).then(cached => cached || fetch(request).then(response => {
+      if (response.ok || response.type === 'opaque') {
+        cache.put(request, response.clone());
+      }
+      return response;
+    })))
+  );
+});
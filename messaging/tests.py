@@ -1,3 +1,1426 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Count
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.templatetags.static import static
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from messageboard.metrics import registry
+from messageboard.middleware import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, RequestMetricsMiddleware
+
+from . import archive, counters, events, reaction_types, search
+from .benchmarks import SCENARIOS
+from .models import (
+    ArchivedMessage, ArchivedReaction, ArchivedReply, Message, MessageReactionCount, Profile, Reaction, Reply, Task,
+)
+from .pagination import EstimatedCountPaginator, KeysetPaginator
+from .query_plans import HOT_QUERIES, check_plans
+from .reactions import toggle_reaction
+from .fragments import invalidate_card
+from .replies import attach_latest_replies
+from .stats import adjust_user_stats, user_stats
+from .transactions import retry_on_lock
+from .views import FEED_LIMIT
+
+
+class MessageListQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def create_messages(self, count):
+        start = Message.objects.count()
+        for i in range(start, start + count):
+            author = User.objects.create_user(f'author{i}')
+            message = Message.objects.create(text=f'message {i}', author=author)
+            Reaction.objects.create(user=self.user, message=message, reaction_type='like')
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        # session, user, page of messages with authors, the viewer's
+        # reactions for the page; the wall total comes from the cache
+        self.create_messages(1)
+        self.client.get(reverse('message_list'))
+        with self.assertNumQueries(4):
+            self.client.get(reverse('message_list'))
+
+        self.create_messages(9)
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('message_list'))
+        self.assertEqual(len(response.context['messages']), 10)
+
+    def test_user_reactions_are_mapped_by_message(self):
+        self.create_messages(3)
+        response = self.client.get(reverse('message_list'))
+        self.assertEqual(response.context['user_reactions'], {
+            message.id: 'like' for message in Message.objects.all()
+        })
+
+
+class MessageFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('poller')
+        cls.messages = [Message.objects.create(text=f'message {i}', author=cls.user) for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def feed(self, etag=None, **params):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse('message_feed'), params, **headers)
+
+    def test_returns_only_messages_after_the_cursor(self):
+        data = self.feed(since=self.messages[0].id, ids=f'{self.messages[0].id},999999').json()
+        self.assertEqual([card['id'] for card in data['messages']], [self.messages[1].id, self.messages[2].id])
+        self.assertEqual(data['latest_id'], self.messages[2].id)
+        self.assertEqual(list(data['reactions']), [str(self.messages[0].id)])
+        self.assertEqual(data['deleted'], [999999])
+
+        data = self.feed(since=self.messages[2].id).json()
+        self.assertEqual((data['messages'], data['latest_id']), ([], self.messages[2].id))
+
+    def test_client_far_behind_catches_up_over_several_polls(self):
+        since = self.messages[2].id
+        backlog = Message.objects.bulk_create(
+            Message(text=f'backlog {i}', author=self.user) for i in range(FEED_LIMIT + 5)
+        )
+        backlog_ids = sorted(message.id for message in backlog)
+
+        data = self.feed(since=since).json()
+        self.assertEqual([card['id'] for card in data['messages']], backlog_ids[:FEED_LIMIT])
+        self.assertEqual(data['latest_id'], backlog_ids[FEED_LIMIT - 1])
+
+        data = self.feed(since=data['latest_id']).json()
+        self.assertEqual([card['id'] for card in data['messages']], backlog_ids[FEED_LIMIT:])
+        self.assertEqual(data['latest_id'], backlog_ids[-1])
+
+    @override_settings(MESSAGEBOARD_SHARED_CACHE=True)
+    def test_matching_etag_is_not_modified(self):
+        params = {'since': self.messages[2].id, 'ids': str(self.messages[2].id)}
+        etag = self.feed(**params)['ETag']
+        self.assertEqual(self.feed(etag, **params).status_code, 304)
+        self.assertEqual(self.feed(etag, since=0).status_code, 200)
+
+    @override_settings(MESSAGEBOARD_SHARED_CACHE=True)
+    def test_etag_changes_after_add_and_delete(self):
+        params = {'since': self.messages[2].id}
+        etag = self.feed(**params)['ETag']
+        self.client.post(reverse('add_message'), {'text': 'new message'})
+        response = self.feed(etag, **params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['messages']), 1)
+
+        etag = response['ETag']
+        self.client.get(reverse('delete_message', args=[self.messages[0].id]))
+        self.assertEqual(self.feed(etag, **params).status_code, 200)
+
+    def test_no_etag_without_a_shared_cache(self):
+        # Another worker's writes would never change it.
+        response = self.feed(since=0)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(self.feed('"anything"', since=0).status_code, 200)
+
+
+@override_settings(MESSAGEBOARD_SHARED_CACHE=True)
+class MessageCardCacheTests(TestCase):
+    CARD = 'messaging/includes/message_card.html'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.reader = User.objects.create_user('reader')
+        cls.message = Message.objects.create(text='cached card', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def card(self, response):
+        return response.context['cards'][0]
+
+    def test_cards_are_rendered_once(self):
+        self.client.force_login(self.reader)
+        self.assertTemplateUsed(self.client.get(reverse('message_list')), self.CARD)
+        self.assertTemplateNotUsed(self.client.get(reverse('message_list')), self.CARD)
+
+    def test_reaction_invalidates_card_and_overlays_viewer_state(self):
+        self.client.force_login(self.reader)
+        self.client.get(reverse('message_list'))
+        self.client.post(reverse('react', args=[self.message.id, 'fire']))
+
+        card = self.card(self.client.get(reverse('message_list')))
+        self.assertIn('data-type="fire" class="reaction-button active', card)
+        self.assertIn('<small class="ms-1">1</small>', card)
+        self.assertIn('data-owner-action hidden', card)
+
+        self.client.force_login(self.author)
+        card = self.card(self.client.get(reverse('message_list')))
+        self.assertNotIn('reaction-button active', card)
+        self.assertIn('<small class="ms-1">1</small>', card)
+        self.assertNotIn('data-owner-action hidden', card)
+
+    def test_only_cards_that_changed_are_rendered_again(self):
+        self.client.force_login(self.reader)
+        Message.objects.create(text='second card', author=self.author)
+        self.client.get(reverse('message_list'))
+        # one windowed query for the replies of the card that was not cached
+        Reply.objects.create(message=self.message, author=self.reader, text='fresh reply')
+        Message.objects.filter(pk=self.message.pk).update(reply_count=1)
+        invalidate_card(self.message.pk)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('message_list'))
+        replies = [q['sql'] for q in queries if 'messaging_reply' in q['sql']]
+        self.assertEqual(len(replies), 1)
+        self.assertIn(f'IN ({self.message.pk})', replies[0])
+        self.assertIn('fresh reply', response.content.decode())
+
+    @override_settings(MESSAGEBOARD_SHARED_CACHE=False)
+    def test_per_process_cache_is_not_trusted_with_cards(self):
+        self.client.force_login(self.reader)
+        self.client.get(reverse('message_list'))
+        # As if another worker had handled the reaction: nothing here is bumped.
+        toggle_reaction(self.author, self.message.id, 'fire')
+        response = self.client.get(reverse('message_list'))
+        self.assertTemplateUsed(response, self.CARD)
+        self.assertIn('<small class="ms-1">1</small>', self.card(response))
+
+
+class WallReplyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader')
+        cls.message = Message.objects.create(text='threaded', author=cls.reader)
+        start = timezone.now() - timedelta(hours=1)
+        Reply.objects.bulk_create(
+            Reply(message=cls.message, author=cls.reader, text=f'reply {i}', timestamp=start + timedelta(minutes=i))
+            for i in range(15)
+        )
+        Message.objects.filter(pk=cls.message.pk).update(reply_count=15)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def reply_texts(self, html):
+        return [f'reply {i}' for i in range(15) if f'reply {i}<' in html]
+
+    def test_wall_shows_latest_replies_with_one_query_for_the_page(self):
+        self.client.get(reverse('message_list'))
+        for i in range(9):
+            message = Message.objects.create(text=f'other {i}', author=self.reader, reply_count=1)
+            Reply.objects.create(message=message, author=self.reader, text=f'other reply {i}')
+        # session, user, page, viewer reactions and one windowed query for
+        # the latest replies of the whole page
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('message_list'))
+        card = response.context['cards'][-1]
+        self.assertEqual(self.reply_texts(card), ['reply 12', 'reply 13', 'reply 14'])
+        self.assertIn('Show earlier replies (15)', card)
+
+    def test_earlier_replies_are_paged_by_cursor(self):
+        message = Message.objects.get(pk=self.message.pk)
+        attach_latest_replies([message])
+        url = reverse('message_replies', args=[message.pk])
+
+        data = self.client.get(url, {'cursor': message.more_replies_cursor}).json()
+        self.assertEqual([self.reply_texts(reply['html']) for reply in data['replies']],
+                         [[f'reply {i}'] for i in range(11, 1, -1)])
+        data = self.client.get(url, {'cursor': data['next']}).json()
+        self.assertEqual([self.reply_texts(reply['html']) for reply in data['replies']],
+                         [['reply 1'], ['reply 0']])
+        self.assertIsNone(data['next'])
+
+        self.assertEqual(self.client.get(url, {'cursor': 'nonsense'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('message_replies', args=[0])).status_code, 404)
+
+    def test_add_reply_counts_it_and_refreshes_the_card(self):
+        self.client.get(reverse('message_list'))
+        self.client.post(reverse('add_reply', args=[self.message.pk]), {'text': 'newest'})
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.reply_count, 16)
+        card = self.client.get(reverse('message_list')).context['cards'][0]
+        self.assertIn('newest<', card)
+        self.assertIn('Show earlier replies (16)', card)
+
+
+class AsyncViewTests(TestCase):
+    """The read-heavy views run on the event loop and must not touch the ORM synchronously."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        message = Message.objects.create(text='async wall', author=cls.author, reply_count=1)
+        Reply.objects.create(message=message, author=cls.author, text='async reply')
+        Task.objects.create(title='async task')
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_views_render_under_asgi(self):
+        await self.async_client.aforce_login(self.author)
+        for url, text in [
+            (reverse('message_list'), 'async reply'),
+            (reverse('message_list') + '?q=async', 'async wall'),
+            (reverse('message_page'), 'async wall'),
+            (reverse('profile', args=['author']), 'async wall'),
+            (reverse('profile'), 'async wall'),
+            (reverse('task_list') + '?status=pending', 'async task'),
+        ]:
+            response = await self.async_client.get(url)
+            self.assertContains(response, text)
+        response = await self.async_client.get(reverse('profile', args=['nobody']))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_anonymous_users_are_redirected(self):
+        response = await self.async_client.get(reverse('task_list'))
+        self.assertEqual(response.status_code, 302)
+
+
+class EventsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.backend = events.InProcessBackend()
+        patcher = mock.patch.object(events, 'get_backend', return_value=self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_publish_waits_for_commit(self):
+        with mock.patch.object(self.backend, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                events.publish('message.deleted', id=1)
+                publish.assert_not_called()
+        publish.assert_called_once_with({'type': 'message.deleted', 'data': {'id': 1}})
+
+    def test_rolled_back_changes_are_not_published(self):
+        with mock.patch.object(self.backend, 'publish') as publish:
+            with self.captureOnCommitCallbacks() as callbacks:
+                events.publish('message.deleted', id=1)
+        # The test transaction is rolled back, so the callback never runs.
+        self.assertEqual(len(callbacks), 1)
+        publish.assert_not_called()
+
+    def test_new_message_is_published(self):
+        user = User.objects.create_user('poster')
+        self.client.force_login(user)
+        with mock.patch.object(self.backend, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('add_message'), {'text': 'hello events'})
+        event = publish.call_args.args[0]
+        self.assertEqual(event['type'], 'message.created')
+        self.assertEqual(event['data']['author'], 'poster')
+        self.assertIn('hello events', event['data']['html'])
+
+    async def test_subscriber_receives_events(self):
+        subscription = self.backend.subscribe()
+        self.backend.publish({'type': 'message.deleted', 'data': {'id': 1}})
+        event = await asyncio.wait_for(subscription.get(), 1)
+        self.assertEqual(event, {'type': 'message.deleted', 'data': {'id': 1}})
+        subscription.close()
+        self.assertEqual(self.backend._subscribers, set())
+
+    async def test_slow_subscriber_is_told_to_resync(self):
+        with mock.patch.object(events, 'SUBSCRIBER_QUEUE_SIZE', 2):
+            subscription = self.backend.subscribe()
+        for i in range(3):
+            subscription.deliver({'type': 'message.deleted', 'data': {'id': i}})
+        self.assertEqual(await subscription.get(), {'type': 'resync', 'data': {}})
+        self.assertTrue(subscription.queue.empty())
+
+    async def test_stream_sends_heartbeats_and_unsubscribes_on_disconnect(self):
+        with mock.patch.object(events, 'HEARTBEAT_SECONDS', 0.01):
+            stream = events.stream()
+            self.assertEqual(await anext(stream), 'retry: 3000\n\n')
+            self.assertEqual(await anext(stream), ': keepalive\n\n')
+            self.assertEqual(len(self.backend._subscribers), 1)
+            self.backend.publish({'type': 'message.deleted', 'data': {'id': 7}})
+            self.assertEqual(await anext(stream), 'event: message.deleted\ndata: {"id": 7}\n\n')
+            # The server closes the generator when the client goes away.
+            await stream.aclose()
+        self.assertEqual(self.backend._subscribers, set())
+
+    def test_wsgi_clients_are_told_to_poll(self):
+        self.client.force_login(User.objects.create_user('poller'))
+        response = self.client.get(reverse('message_events'))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.backend._subscribers, set())
+
+
+@override_settings(MESSAGEBOARD_SHARED_CACHE=True)
+class ProfileCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.reader = User.objects.create_user('reader')
+        cls.message = Message.objects.create(text='hello profile', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def test_own_profile_url_works(self):
+        response = self.client.get(reverse('profile'))
+        self.assertContains(response, 'reader')
+
+    def test_cached_profile_needs_only_session_queries(self):
+        url = reverse('profile', args=['author'])
+        self.client.get(url)
+        # the session only; the signed-in user is cached too
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertContains(response, 'hello profile')
+
+    def test_new_message_invalidates_profile(self):
+        url = reverse('profile', args=['reader'])
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('add_message'), {'text': 'fresh post'})
+        self.assertContains(self.client.get(url), 'fresh post')
+
+    def test_reaction_invalidates_author_profile(self):
+        url = reverse('profile', args=['author'])
+        self.assertNotContains(self.client.get(url), 'fa-heart"></i> <small>1')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('react', args=[self.message.id, 'like']))
+        self.assertContains(self.client.get(url), 'fa-heart"></i> <small>1')
+
+    def test_unknown_user_is_404(self):
+        response = self.client.get(reverse('profile', args=['nobody']))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(MESSAGEBOARD_SHARED_CACHE=False)
+    def test_per_process_cache_is_not_trusted_with_profiles(self):
+        url = reverse('profile', args=['author'])
+        self.client.get(url)
+        # As if another worker had handled the post: nothing here is bumped.
+        Message.objects.create(text='posted elsewhere', author=self.author)
+        response = self.client.get(url)
+        self.assertContains(response, 'posted elsewhere')
+        self.assertContains(response, '<h5 class="card-title mb-1">2</h5>', html=True)
+
+
+class UserStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        readers = User.objects.bulk_create(User(username=f'reader{i}') for i in range(3))
+        for i in range(4):
+            message = Message.objects.create(text=f'stat {i}', author=cls.author)
+            for reader, reaction_type in zip(readers, ['like', 'like', 'fire'][:i]):
+                toggle_reaction(reader, message.pk, reaction_type)
+            if i % 2:
+                Message.objects.filter(pk=message.pk).update(timestamp=timezone.now() - timedelta(days=400))
+        call_command('archive_messages', older_than=365, stdout=StringIO())
+        Message.objects.create(text='someone else', author=readers[0])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_one_aggregate_over_live_and_one_over_archived_messages(self):
+        with self.assertNumQueries(2):
+            stats = user_stats(self.author.pk)
+        self.assertEqual(stats['messages'], 4)
+        self.assertEqual(stats['reactions'], {'like': 5, 'laugh': 0, 'sad': 0, 'fire': 1, 'thumbs_up': 0, 'angry': 0})
+        self.assertEqual(stats['total_reactions'], 6)
+
+    @override_settings(MESSAGEBOARD_SHARED_CACHE=True)
+    def test_cached_stats_are_adjusted_in_place(self):
+        with self.assertNumQueries(2):
+            stats = user_stats(self.author.pk)
+        adjust_user_stats(self.author.pk, messages=1, reactions={'sad': 1})
+        with self.assertNumQueries(0):
+            adjusted = user_stats(self.author.pk)
+        self.assertEqual(adjusted['messages'], stats['messages'] + 1)
+        self.assertEqual(adjusted['total_reactions'], stats['total_reactions'] + 1)
+
+
+class ProfileLifecycleTests(TestCase):
+    def test_login_does_not_touch_profiles(self):
+        User.objects.create_user('member', password='secret-pass')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('login'), {'username': 'member', 'password': 'secret-pass'})
+        self.assertRedirects(response, reverse('message_list'), fetch_redirect_response=False)
+        self.assertFalse([q for q in queries if Profile._meta.db_table in q['sql']])
+        # user lookup, new session key check and insert, last_login update,
+        # session save; nothing for the profile
+        statements = [q for q in queries if 'SAVEPOINT' not in q['sql']]
+        self.assertEqual(len(statements), 5)
+
+    def test_profile_is_created_on_first_access(self):
+        user = User.objects.create_user('lazy')
+        self.assertFalse(Profile.objects.filter(user=user).exists())
+        profile = Profile.objects.for_user(user)
+        self.assertEqual(profile.user, user)
+        with self.assertNumQueries(0):
+            self.assertEqual(Profile.objects.for_user(user), profile)
+
+    def test_update_writes_only_changes(self):
+        profile = Profile.objects.for_user(User.objects.create_user('editor'))
+        with self.assertNumQueries(1):
+            self.assertTrue(profile.update(bio='hello', location=''))
+        with self.assertNumQueries(0):
+            self.assertFalse(profile.update(bio='hello'))
+
+    def test_import_users(self):
+        User.objects.create_user('taken')
+        rows = 'username,email,bio\ntaken,x@example.com,\nnew1,new1@example.com,first\nnew2,,second\n'
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(rows)
+        self.addCleanup(os.remove, f.name)
+        out = StringIO()
+        call_command('import_users', f.name, batch_size=2, stdout=out)
+
+        self.assertIn('Created 2 users, updated 0 profiles, skipped 1.', out.getvalue())
+        self.assertEqual(User.objects.get(username='new1').email, 'new1@example.com')
+        self.assertFalse(User.objects.get(username='new2').has_usable_password())
+        self.assertEqual(
+            dict(Profile.objects.values_list('user__username', 'bio')),
+            {'new1': 'first', 'new2': 'second'},
+        )
+
+    def test_import_updates_existing_profiles(self):
+        User.objects.create_user('no-profile')
+        Profile.objects.for_user(User.objects.create_user('same')).update(bio='unchanged')
+        Profile.objects.for_user(User.objects.create_user('moved')).update(bio='hi', location='Oslo')
+        rows = 'username,bio,location\nno-profile,new here,\nsame,unchanged,\nmoved,hi,Bergen\n'
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(rows)
+        self.addCleanup(os.remove, f.name)
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_users', f.name, stdout=out)
+
+        self.assertIn('Created 0 users, updated 2 profiles, skipped 1.', out.getvalue())
+        self.assertEqual(
+            dict(Profile.objects.values_list('user__username', 'location')),
+            {'no-profile': '', 'same': '', 'moved': 'Bergen'},
+        )
+        self.assertEqual(Profile.objects.get(user__username='no-profile').bio, 'new here')
+        # One UPDATE each for the changed profiles; nothing for the unchanged one.
+        updates = [q for q in queries if q['sql'].startswith(f'UPDATE "{Profile._meta.db_table}"')]
+        self.assertEqual(len(updates), 2)
+
+
+class BulkTaskTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('planner')
+        cls.done_at = timezone.now() - timedelta(days=3)
+        cls.tasks = [Task.objects.create(title=f'task {i}') for i in range(5)]
+        Task.objects.filter(pk=cls.tasks[0].pk).update(status='completed', completed_at=cls.done_at)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def bulk(self, payload):
+        return self.client.post(reverse('bulk_tasks'), json.dumps(payload), content_type='application/json')
+
+    def ids(self, *indexes):
+        return [self.tasks[i].pk for i in indexes]
+
+    def test_status_change_is_one_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.bulk({'operation': 'status', 'ids': self.ids(0, 1, 2), 'status': 'completed'})
+        self.assertEqual(response.json(), {'operation': 'status', 'count': 3})
+        writes = [q['sql'] for q in queries if q['sql'].startswith(('UPDATE', 'DELETE'))]
+        self.assertEqual(len(writes), 1)
+
+        completed = {task.pk: task.completed_at for task in Task.objects.filter(status='completed')}
+        self.assertEqual(set(completed), set(self.ids(0, 1, 2)))
+        # Tasks that were already completed keep their completion time.
+        self.assertEqual(completed[self.tasks[0].pk], self.done_at)
+        self.assertGreater(completed[self.tasks[1].pk], self.done_at)
+
+        self.bulk({'operation': 'status', 'ids': self.ids(0, 1), 'status': 'in_progress'})
+        self.assertFalse(Task.objects.filter(pk__in=self.ids(0, 1), completed_at__isnull=False).exists())
+
+    def test_delete(self):
+        response = self.bulk({'operation': 'delete', 'ids': self.ids(1, 3) + [0]})
+        self.assertEqual(response.json(), {'operation': 'delete', 'count': 2})
+        self.assertEqual(Task.objects.count(), 3)
+
+    def test_reorder_sets_the_board_order(self):
+        order = self.ids(3, 0, 4, 1, 2)
+        self.assertEqual(self.bulk({'operation': 'reorder', 'ids': order}).json()['count'], 5)
+        self.assertEqual([task.pk for task in self.client.get(reverse('task_list')).context['tasks']], order)
+
+    def test_invalid_requests(self):
+        for payload in [
+            {'operation': 'archive', 'ids': self.ids(0)},
+            {'operation': 'status', 'ids': self.ids(0), 'status': 'someday'},
+            {'operation': 'delete', 'ids': 'all'},
+            {'operation': 'delete', 'ids': self.ids(0, 0)},
+            ['delete'],
+        ]:
+            self.assertEqual(self.bulk(payload).status_code, 400, payload)
+        self.assertEqual(self.client.post(reverse('bulk_tasks'), 'nope', content_type='text/plain').status_code, 400)
+        self.assertEqual(self.client.get(reverse('bulk_tasks')).status_code, 405)
+        self.assertEqual(Task.objects.count(), 5)
+
+    def test_single_status_update_clears_completion(self):
+        response = self.client.post(reverse('update_task_status', args=[self.tasks[0].pk]), {'status': 'pending'})
+        self.assertEqual(response.json(), {'success': True, 'status': 'Beklemede'})
+        self.assertIsNone(Task.objects.get(pk=self.tasks[0].pk).completed_at)
+        response = self.client.post(reverse('update_task_status', args=[0]), {'status': 'pending'})
+        self.assertEqual(response.status_code, 404)
+
+
+class TaskListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('planner')
+        start = timezone.now() - timedelta(days=1)
+        Task.objects.bulk_create(
+            Task(title=f'task {i}', description='groceries' if i % 5 == 0 else '',
+                 status='completed' if i % 3 == 0 else 'pending', created_at=start + timedelta(minutes=i))
+            for i in range(25)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def titles(self, response):
+        return [task.title for task in response.context['tasks']]
+
+    def test_pages_follow_the_cursor(self):
+        first = self.client.get(reverse('task_list'))
+        self.assertEqual(self.titles(first), [f'task {i}' for i in range(24, 4, -1)])
+        second = self.client.get(reverse('task_list'), {'cursor': first.context['tasks'].next_cursor})
+        self.assertEqual(self.titles(second), [f'task {i}' for i in range(4, -1, -1)])
+        self.assertFalse(second.context['tasks'].has_next())
+        self.assertFalse(first.context['reorderable'])
+
+    @override_settings(MESSAGEBOARD_SHARED_CACHE=True)
+    def test_status_counts_are_one_cached_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('task_list'), {'status': 'completed'})
+        self.assertEqual(sum('GROUP BY' in q['sql'] for q in queries), 1)
+        self.assertEqual(response.context['status_choices'], [
+            ('pending', 'Beklemede', 16), ('in_progress', 'Yapılıyor', 0), ('completed', 'Tamamlandı', 9),
+        ])
+        self.assertEqual(response.context['task_total'], 25)
+        self.assertEqual(len(response.context['tasks']), 9)
+        # the session and the page; the user is cached too
+        with self.assertNumQueries(2):
+            self.client.get(reverse('task_list'))
+
+        self.client.post(reverse('add_task'), {'title': 'new', 'status': 'in_progress'})
+        self.assertEqual(self.client.get(reverse('task_list')).context['status_choices'][1][2], 1)
+        self.client.post(reverse('bulk_tasks'), json.dumps({
+            'operation': 'status', 'ids': list(Task.objects.filter(status='pending').values_list('id', flat=True)),
+            'status': 'completed',
+        }), content_type='application/json')
+        self.assertEqual(self.client.get(reverse('task_list')).context['task_total'], 26)
+        self.assertEqual(self.client.get(reverse('task_list')).context['status_choices'][2][2], 25)
+
+    @override_settings(MESSAGEBOARD_SHARED_CACHE=True)
+    def test_admin_changes_refresh_the_counts(self):
+        self.client.get(reverse('task_list'))
+        self.client.force_login(User.objects.create_superuser('admin'))
+        task = Task.objects.filter(status='pending').first()
+        self.client.post(reverse('admin:messaging_task_change', args=[task.pk]), {
+            'title': task.title, 'description': '', 'status': 'in_progress', 'completed_at_0': '', 'completed_at_1': '',
+        })
+        self.client.post(reverse('admin:messaging_task_changelist'), {
+            'action': 'delete_selected', 'post': 'yes',
+            '_selected_action': list(Task.objects.filter(status='completed').values_list('pk', flat=True)[:2]),
+        })
+        self.assertEqual(self.client.get(reverse('task_list')).context['status_choices'], [
+            ('pending', 'Beklemede', 15), ('in_progress', 'Yapılıyor', 1), ('completed', 'Tamamlandı', 7),
+        ])
+
+    def test_per_process_cache_is_not_trusted_with_counts(self):
+        self.client.get(reverse('task_list'))
+        # As if another worker had added it: nothing here is bumped.
+        Task.objects.create(title='elsewhere', status='in_progress')
+        self.assertEqual(self.client.get(reverse('task_list')).context['status_choices'][1][2], 1)
+
+    def test_text_filter_matches_title_and_description(self):
+        response = self.client.get(reverse('task_list'), {'q': 'GROCER'})
+        self.assertEqual(self.titles(response), [f'task {i}' for i in (20, 15, 10, 5, 0)])
+        self.assertEqual(response.context['task_total'], 5)
+        response = self.client.get(reverse('task_list'), {'q': 'task 1', 'status': 'completed'})
+        self.assertEqual(self.titles(response), ['task 18', 'task 15', 'task 12'])
+
+
+class StaticAssetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader')
+
+    def path(self, url):
+        return os.path.join(settings.STATIC_ROOT, url[len(settings.STATIC_URL):])
+
+    def collected(self, url):
+        with open(self.path(url), 'rb') as f:
+            return f.read()
+
+    def test_hashed_assets_are_precompressed_and_cached_for_good(self):
+        url = static('js/wall.js')
+        self.assertNotEqual(url, '/static/js/wall.js')
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn('javascript', response['Content-Type'])
+        self.assertEqual(gzip.decompress(response.content), self.collected(url))
+
+        plain = self.client.get(url)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(plain.content, self.collected(url))
+
+    def test_encoding_follows_the_accept_encoding_q_values(self):
+        url = static('js/wall.js')
+        for header, encoding in [
+            ('gzip;q=0, deflate', None),
+            ('br;q=0, gzip', 'gzip'),
+            ('GZIP; Q=0.5', 'gzip'),
+            ('*;q=0.1, gzip;q=0', 'br' if os.path.isfile(self.path(url) + '.br') else None),
+            ('notgzip, brotli', None),
+            ('identity', None),
+        ]:
+            with self.subTest(header=header):
+                response = self.client.get(url, headers={'Accept-Encoding': header})
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+
+    def test_unhashed_names_are_revalidated(self):
+        response = self.client.get('/static/manifest.json')
+        self.assertEqual(response['Cache-Control'], REVALIDATE_CACHE_CONTROL)
+        self.assertEqual(json.loads(response.content)['start_url'], '/')
+        not_modified = self.client.get('/static/manifest.json', headers={'If-Modified-Since': response['Last-Modified']})
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_only_collected_files_are_served(self):
+        self.assertEqual(self.client.get('/static/../manage.py').status_code, 404)
+        self.assertEqual(self.client.get('/static/missing.css').status_code, 404)
+
+    def test_pages_link_their_assets_instead_of_inlining_them(self):
+        self.client.force_login(self.user)
+        for name, asset in [('message_list', 'js/wall.js'), ('task_list', 'js/tasks.js')]:
+            response = self.client.get(reverse(name))
+            self.assertContains(response, static(asset))
+            self.assertContains(response, static('css/base.css'))
+            self.assertNotContains(response, '<style>')
+            self.assertNotContains(response, '<script>')
+
+    def test_service_worker_precaches_the_hashed_shell(self):
+        response = self.client.get(reverse('service_worker'))
+        self.assertEqual(response['Content-Type'], 'application/javascript')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertContains(response, json.dumps(static('css/wall.css')))
+        self.assertContains(response, "const CACHE = 'messageboard-shell-")
+
+
+class RequestMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader')
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+
+    def test_records_queries_per_view(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('message_list'))
+        summary = registry.snapshot()['message_list']
+        self.assertEqual(summary['count'], 1)
+        self.assertEqual(summary['queries_sum'], len(queries))
+        self.assertGreater(summary['duration_sum'], 0)
+
+    @override_settings(MESSAGEBOARD_NPLUSONE_THRESHOLD=3)
+    def test_flags_repeated_queries(self):
+        for i in range(5):
+            Message.objects.create(text=f'message {i}', author=User.objects.create_user(f'author{i}'))
+
+        def view(request):
+            request.resolver_match = resolve(reverse('message_list'))
+            for message in Message.objects.all():
+                message.author.username
+            return HttpResponse()
+
+        with self.assertLogs('messageboard.metrics', 'WARNING'):
+            RequestMetricsMiddleware(view)(RequestFactory().get('/'))
+        summary = registry.snapshot()['message_list']
+        self.assertEqual(summary['nplusone'], 1)
+        self.assertEqual(summary['last_nplusone'][1], 5)
+
+    def test_prometheus_endpoint_needs_staff_or_token(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        with override_settings(MESSAGEBOARD_METRICS_TOKEN='s3cret'):
+            response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer s3cret'})
+        self.assertEqual(response.status_code, 200)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('metrics'))
+        self.assertContains(response, '# TYPE messageboard_request_queries summary')
+        self.assertContains(response, 'view="metrics"')
+        self.assertEqual(self.client.get(reverse('metrics_dashboard')).status_code, 200)
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_seed_data_and_run_benchmarks(self):
+        call_command('seed_data', scale='300', users=20, tasks=30, batch_size=100, stdout=StringIO())
+        self.assertEqual(Message.objects.count(), 300)
+        self.assertEqual(Task.objects.count(), 30)
+        # Counts are filled in to match the generated reactions.
+        message = Message.objects.annotate(n=Count('reaction')).order_by('-n').first()
+        self.assertEqual(sum(message.reaction_counts().values()), message.n)
+        self.assertEqual(message.reaction_total, message.n)
+        self.assertTrue(search.filter_messages(Message.objects.all(), message.text.split()[0]).exists())
+
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            output = f.name
+        self.addCleanup(os.remove, output)
+        call_command('run_benchmarks', requests=3, warmup=1, deep_page=2, output=output, stderr=StringIO())
+        with open(output) as f:
+            report = json.load(f)
+        self.assertEqual(set(report['scenarios']), set(SCENARIOS))
+        for result in report['scenarios'].values():
+            self.assertEqual(result['requests'], 3)
+            self.assertEqual(result['errors'], 0)
+            self.assertIsNotNone(result['queries']['p50'])
+
+
+class KeysetPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author')
+        now = timezone.now()
+        messages = [Message.objects.create(text=f'message {i}', author=author) for i in range(7)]
+        # Two messages share a timestamp so the id tie-breaker is exercised.
+        for i, message in enumerate(messages):
+            message.timestamp = now - timedelta(minutes=min(i, 5))
+        Message.objects.bulk_update(messages, ['timestamp'])
+
+    def setUp(self):
+        self.paginator = KeysetPaginator(Message.objects.all(), 3)
+        self.expected = list(Message.objects.order_by('-timestamp', '-id'))
+
+    def test_walk_forward_and_back(self):
+        first = self.paginator.page()
+        self.assertEqual(list(first), self.expected[:3])
+        self.assertFalse(first.has_previous())
+
+        second = self.paginator.page(first.next_cursor)
+        third = self.paginator.page(second.next_cursor)
+        self.assertEqual(list(second), self.expected[3:6])
+        self.assertEqual(list(third), self.expected[6:])
+        self.assertFalse(third.has_next())
+
+        back = self.paginator.page(third.previous_cursor)
+        self.assertEqual(list(back), self.expected[3:6])
+        self.assertEqual(list(self.paginator.page(back.previous_cursor)), self.expected[:3])
+
+    def test_invalid_cursor_returns_first_page(self):
+        self.assertEqual(list(self.paginator.get_page('not-a-cursor')), self.expected[:3])
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('counted')
+        cls.messages = [Message.objects.create(text=f'message {i}', author=author) for i in range(5)]
+        cls.messages[1].delete()
+
+    def paginator(self, queryset, exact_limit):
+        paginator = EstimatedCountPaginator(queryset.order_by('-id'), 2)
+        paginator.exact_limit = exact_limit
+        return paginator
+
+    def test_large_unfiltered_table_is_estimated_from_the_highest_id(self):
+        paginator = self.paginator(Message.objects.all(), exact_limit=3)
+        with self.assertNumQueries(1):
+            self.assertEqual(paginator.count, self.messages[-1].id)
+        self.assertEqual(len(paginator.page(paginator.num_pages)), 0)
+
+    def test_small_or_filtered_tables_are_counted(self):
+        self.assertEqual(self.paginator(Message.objects.all(), exact_limit=10).count, 4)
+        filtered = Message.objects.filter(id__gt=self.messages[2].id)
+        self.assertEqual(self.paginator(filtered, exact_limit=0).count, 2)
+
+
+class AdminChangelistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin')
+        cls.author = User.objects.create_user('author')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def create_rows(self, n):
+        for i in range(n):
+            message = Message.objects.create(text=f'message {i}', author=self.author)
+            Reply.objects.create(message=message, author=self.author, text=f'reply {i}')
+            Reaction.objects.create(user=self.author, message=message, reaction_type='like')
+
+    def test_query_count_does_not_depend_on_rows(self):
+        urls = [
+            reverse(f'admin:messaging_{model}_changelist') for model in ('message', 'reply', 'reaction')
+        ] + [reverse('admin:messaging_reaction_changelist') + '?reaction_type=like']
+        self.create_rows(1)
+        counts = {}
+        for url in urls:
+            self.client.get(url)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            counts[url] = len(queries)
+
+        self.create_rows(9)
+        for url in urls:
+            with self.assertNumQueries(counts[url]):
+                self.client.get(url)
+
+    def test_reaction_filter_lists_registered_types(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:messaging_reaction_changelist'))
+        self.assertContains(response, 'Thumbs Up')
+        self.assertFalse([q for q in queries if 'DISTINCT' in q['sql']])
+
+    def test_sorting_by_reactions_follows_the_index(self):
+        self.create_rows(3)
+        Message.objects.filter(text='message 1').update(reaction_total=2)
+        result_list = self.client.get(reverse('admin:messaging_message_changelist') + '?o=4').context['cl'].result_list
+        self.assertEqual(result_list[0].text, 'message 1')
+        self.assertEqual(result_list.query.order_by, ('-reaction_total', '-id'))
+
+
+class QueryPlanTests(TestCase):
+    def test_hot_queries_use_indexes(self):
+        results = check_plans()
+        self.assertEqual(set(results), set(HOT_QUERIES))
+        for name, (plan, problems) in results.items():
+            self.assertEqual(problems, [], f'{name}:\n{plan}')
+
+    def test_unindexed_sort_is_reported(self):
+        results = check_plans({'tasks by title': lambda: Task.objects.order_by('title')})
+        plan, problems = results['tasks by title']
+        self.assertTrue(any('TEMP B-TREE' in problem for problem in problems), plan)
+
+    def test_keyset_pages_seek_the_index(self):
+        plan, _ = check_plans({'next': HOT_QUERIES['wall next page']})['next']
+        self.assertIn('SEARCH messaging_message USING INDEX message_timestamp_idx', plan)
+
+
+class SearchIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('gardener')
+
+    def search(self, query):
+        return list(search.filter_messages(Message.objects.all(), query))
+
+    def test_index_follows_save_and_delete(self):
+        message = Message.objects.create(text='Tomatoes are ripening', author=self.author)
+        self.assertEqual(self.search('tomatoes'), [message])
+
+        message.text = 'Cucumbers instead'
+        message.save()
+        self.assertEqual(self.search('tomatoes'), [])
+        self.assertEqual(self.search('cucumbers'), [message])
+
+        message.delete()
+        self.assertEqual(self.search('cucumbers'), [])
+
+    def test_prefix_and_author_match(self):
+        message = Message.objects.create(text='Planting sunflowers', author=self.author)
+        self.assertEqual(self.search('sunfl'), [message])
+        self.assertEqual(self.search('garden'), [message])
+        self.assertEqual(search.ranked_message_ids('plant', 10), [message.id])
+
+
+class ReactTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reactor')
+        cls.message = Message.objects.create(text='React to me', author=cls.user)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def react(self, reaction_type):
+        return self.client.post(reverse('react', args=[self.message.id, reaction_type])).json()
+
+    def test_switch_and_toggle_off(self):
+        self.assertEqual(self.react('like'), {
+            'count': 1, 'active': True,
+            'counts': {'like': 1, 'laugh': 0, 'sad': 0, 'fire': 0, 'thumbs_up': 0, 'angry': 0},
+        })
+        data = self.react('fire')
+        self.assertEqual((data['counts']['like'], data['counts']['fire'], data['active']), (0, 1, True))
+
+        data = self.react('fire')
+        self.assertEqual((data['count'], data['active']), (0, False))
+        self.assertFalse(Reaction.objects.exists())
+
+    def test_only_touched_counts_are_written(self):
+        self.react('like')
+        self.react('sad')
+        with CaptureQueriesContext(connection) as queries:
+            self.react('like')
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "messaging_message')]
+        # One increment and one decrement; switching leaves the total alone.
+        self.assertEqual(len(updates), 2)
+        self.assertTrue(all(sql.startswith('UPDATE "messaging_messagereactioncount"') for sql in updates))
+        self.assertEqual(self.message.reaction_counts()['like'], 1)
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.reaction_total, 1)
+
+    def test_registered_types_need_no_schema_change(self):
+        reaction_types.register('party', 'Party', 'fa-glass-cheers')
+        self.addCleanup(reaction_types._registry.pop, 'party')
+        data = self.react('party')
+        self.assertEqual((data['count'], data['counts']['party'], data['active']), (1, 1, True))
+        response = self.client.get(reverse('message_list'))
+        self.assertContains(response, 'data-type="party" class="reaction-button active')
+        self.assertEqual(
+            self.client.post(reverse('react', args=[self.message.id, 'unknown'])).status_code, 400
+        )
+
+
+class ReconcileReactionsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create(User(username=f'reconciler{i}') for i in range(3))
+        cls.messages = []
+        for i in range(5):
+            message = Message.objects.create(text=f'drifting {i}', author=cls.users[0])
+            for user in cls.users[:2]:
+                toggle_reaction(user, message.id, 'like')
+            cls.messages.append(message)
+        # Counts drift on every other message.
+        for message in cls.messages[::2]:
+            MessageReactionCount.objects.filter(message=message).update(count=5)
+            Message.objects.filter(pk=message.pk).update(reaction_total=7)
+
+    def reconcile(self, *args, **options):
+        out = StringIO()
+        call_command('reconcile_reactions', *args, stdout=out, **options)
+        return out.getvalue()
+
+    def drifted(self):
+        drifted = []
+        for message in Message.objects.filter(pk__in=[message.pk for message in self.messages]).order_by('pk'):
+            if (message.reaction_total, message.reaction_counts()['like']) != (2, 2):
+                drifted.append(message.pk)
+        return drifted
+
+    def test_dry_run_reports_without_writing(self):
+        out = self.reconcile('--dry-run')
+        self.assertIn(f'message {self.messages[0].pk}: like 5 -> 2, reaction_total 7 -> 2', out)
+        self.assertIn('Checked 5 messages, 3 would be fixed.', out)
+        self.assertEqual(len(self.drifted()), 3)
+
+    def test_fixes_in_batches(self):
+        out = self.reconcile(batch_size=2)
+        self.assertIn('Checked 5 messages, 3 fixed.', out)
+        self.assertEqual(self.drifted(), [])
+        self.assertIn('Checked 5 messages, 0 fixed.', self.reconcile(batch_size=2))
+
+    def test_since_id_and_since_limit_the_messages(self):
+        out = self.reconcile(since_id=self.messages[1].pk)
+        self.assertIn('Checked 4 messages, 2 fixed.', out)
+        self.assertEqual(self.drifted(), [self.messages[0].pk])
+
+        Message.objects.filter(pk=self.messages[0].pk).update(timestamp=timezone.now() - timedelta(days=10))
+        out = self.reconcile(since=(timezone.now() - timedelta(days=1)).date().isoformat())
+        self.assertIn('Checked 4 messages, 0 fixed.', out)
+        self.assertEqual(self.drifted(), [self.messages[0].pk])
+        with self.assertRaises(CommandError):
+            self.reconcile(since='yesterday')
+
+    def test_reaction_type_named_total(self):
+        reaction_types.register('total', 'Total', 'fa-equals')
+        self.addCleanup(reaction_types._registry.pop, 'total')
+        message = self.messages[1]
+        toggle_reaction(self.users[2], message.id, 'total')
+        MessageReactionCount.objects.filter(message=message, reaction_type='total').update(count=4)
+        out = self.reconcile(message_ids=[message.pk])
+        self.assertIn(f'message {message.pk}: total 4 -> 1', out)
+        message.refresh_from_db()
+        self.assertEqual(message.reaction_total, 3)
+        self.assertEqual(message.reaction_counts()['total'], 1)
+
+
+@override_settings(MESSAGING_REACTION_BUFFER=True)
+class ReactionBufferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reactor')
+        cls.message = Message.objects.create(text='React to me', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        # A buffer of our own, flushed by hand rather than by the thread.
+        self.buffer = counters.ReactionBuffer()
+        self.buffer._ensure_flusher = lambda: None
+        for target in ('messaging.counters.reaction_buffer', 'messaging.reactions.reaction_buffer'):
+            patcher = mock.patch(target, self.buffer)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def toggle(self, user, reaction_type):
+        with self.captureOnCommitCallbacks(execute=True):
+            return toggle_reaction(user, self.message.id, reaction_type)
+
+    def stored_counts(self):
+        self.message.refresh_from_db()
+        return self.message.reaction_total, dict(
+            MessageReactionCount.objects.filter(message=self.message).values_list('reaction_type', 'count')
+        )
+
+    def test_clicks_are_buffered_but_visible(self):
+        _, active = self.toggle(self.user, 'like')
+        self.assertTrue(active)
+        self.assertEqual(counters.get_counts(self.message.id)['like'], 1)
+        self.assertTrue(Reaction.objects.filter(user=self.user, message=self.message).exists())
+        self.assertEqual(self.stored_counts(), (0, {}))
+        self.assertEqual(self.buffer.pending(self.message.id), {'like': 1})
+
+    def test_flush_coalesces_deltas_per_message(self):
+        users = User.objects.bulk_create(User(username=f'clicker{i}') for i in range(5))
+        for user in users:
+            self.toggle(user, 'like')
+        self.toggle(users[0], 'fire')
+        self.assertEqual(self.buffer.pending(self.message.id), {'like': 4, 'fire': 1})
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.buffer.flush(), 1)
+        # Six clicks, one write of the total.
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "messaging_message"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.stored_counts(), (5, {'like': 4, 'fire': 1}))
+        self.assertEqual(self.buffer.pending(self.message.id), {})
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_reads_merge_pending_deltas(self):
+        self.toggle(self.user, 'like')
+        self.buffer.flush()
+        other = User.objects.create_user('other')
+        self.toggle(other, 'sad')
+        self.toggle(self.user, 'like')
+
+        self.assertEqual(self.stored_counts(), (1, {'like': 1}))
+        self.assertEqual(counters.get_counts(self.message.id)['like'], 0)
+        message = Message.objects.get(pk=self.message.pk)
+        counters.attach_reaction_counts([message])
+        self.assertEqual(message.reaction_total, 1)
+        self.assertEqual((message.reaction_counts()['like'], message.reaction_counts()['sad']), (0, 1))
+
+    def test_failed_flush_puts_the_deltas_back(self):
+        self.toggle(self.user, 'like')
+        with mock.patch('messaging.counters.apply_deltas', side_effect=OperationalError('disk I/O error')):
+            with self.assertRaises(OperationalError):
+                self.buffer.flush()
+        self.assertEqual(self.stored_counts(), (0, {}))
+        self.assertEqual(self.buffer.pending(self.message.id), {'like': 1})
+
+        # Clicks made in the meantime are merged with the requeued ones.
+        self.toggle(User.objects.create_user('other'), 'like')
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.stored_counts(), (2, {'like': 2}))
+
+
+@override_settings(
+    MESSAGEBOARD_SHARED_CACHE=True,
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+)
+class SessionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('poller', password='old-password')
+
+    def setUp(self):
+        cache.clear()
+        caches['sessions'].clear()
+
+    def poll(self):
+        # Under the test client the events view answers 204, so it costs
+        # nothing beyond resolving the session and the user.
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('message_events'))
+        self.assertEqual(response.status_code, 204)
+        return [q['sql'] for q in queries]
+
+    def test_poll_reads_session_and_user_from_cache(self):
+        self.client.force_login(self.user)
+        self.assertEqual(len(self.poll()), 1)
+        self.assertEqual(self.poll(), [])
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_signed_cookie_sessions(self):
+        self.client.force_login(self.user)
+        self.poll()
+        self.assertEqual(self.poll(), [])
+        self.assertFalse(Session.objects.exists())
+
+    def test_password_change_drops_cached_user(self):
+        self.client.force_login(self.user)
+        self.poll()
+        self.user.set_password('new-password')
+        self.user.save()
+        response = self.client.get(reverse('message_events'))
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(
+        MESSAGEBOARD_SHARED_CACHE=False,
+        SESSION_ENGINE='django.contrib.sessions.backends.db',
+    )
+    def test_per_process_cache_is_not_trusted_with_the_user(self):
+        # Another worker would never see the entry being dropped.
+        self.client.force_login(self.user)
+        self.assertEqual(len(self.poll()), 2)
+        self.assertEqual(len(self.poll()), 2)
+        self.assertIsNone(cache.get(f'messaging:auth-user:{self.user.pk}'))
+
+    def test_purge_deletes_only_expired_sessions(self):
+        now = timezone.now()
+        Session.objects.bulk_create(
+            [Session(session_key=f'expired{i:03}', session_data='', expire_date=now - timedelta(days=1)) for i in range(25)]
+            + [Session(session_key='live', session_data='', expire_date=now + timedelta(days=1))]
+        )
+        out = StringIO()
+        call_command('purge_sessions', batch_size=10, stdout=out)
+        self.assertIn('Deleted 25 expired sessions', out.getvalue())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+
+
+class ArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('historian')
+        cls.reader = User.objects.create_user('reader')
+        cls.old = []
+        for i in range(5):
+            message = Message.objects.create(text=f'ancient scroll {i}', author=cls.author)
+            Message.objects.filter(pk=message.pk).update(timestamp=timezone.now() - timedelta(days=400 + i))
+            cls.old.append(message)
+        for i in range(4):
+            Reply.objects.create(message=cls.old[0], author=cls.reader, text=f'old reply {i}')
+        Message.objects.filter(pk=cls.old[0].pk).update(reply_count=4)
+        toggle_reaction(cls.reader, cls.old[0].pk, 'fire')
+        for i in range(12):
+            Message.objects.create(text=f'fresh news {i}', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def archive(self):
+        call_command('archive_messages', older_than=365, batch_size=2, stdout=StringIO())
+
+    def snapshot(self):
+        return (
+            sorted(Message.objects.values_list('id', 'text', 'timestamp', 'reaction_total', 'reply_count')),
+            sorted(Reply.objects.values_list('id', 'message_id', 'text', 'timestamp')),
+            sorted(Reaction.objects.values_list('id', 'user_id', 'message_id', 'reaction_type')),
+        )
+
+    def test_archive_and_restore_round_trip(self):
+        before = self.snapshot()
+        self.archive()
+        self.assertEqual(Message.objects.count(), 12)
+        self.assertEqual(
+            (ArchivedMessage.objects.count(), ArchivedReply.objects.count(), ArchivedReaction.objects.count()), (5, 4, 1)
+        )
+        self.assertEqual(search.filter_messages(Message.objects.all(), 'ancient').count(), 0)
+
+        out = StringIO()
+        call_command('restore_messages', all=True, batch_size=2, stdout=out)
+        self.assertIn('Restored 5 messages', out.getvalue())
+        self.assertEqual(self.snapshot(), before)
+        self.assertFalse(ArchivedMessage.objects.exists())
+        self.assertEqual(Message.objects.get(pk=self.old[0].pk).reaction_counts()['fire'], 1)
+        self.assertEqual(search.filter_messages(Message.objects.all(), 'ancient').count(), 5)
+
+    def test_wall_reads_through_into_the_archive(self):
+        self.archive()
+        first = self.client.get(reverse('message_page')).json()
+        self.assertEqual(len(first['messages']), 10)
+
+        second = self.client.get(reverse('message_page'), {'cursor': first['next']}).json()
+        ids = [card['id'] for card in second['messages']]
+        self.assertEqual(ids[2:], [message.pk for message in self.old])
+        self.assertIsNone(second['next'])
+        card = second['messages'][2]['html']
+        self.assertIn('Archived', card)
+        self.assertIn('old reply 3', card)
+        self.assertNotIn('onclick="react(', card)
+
+        previous = self.client.get(reverse('message_page'), {'cursor': second['previous']}).json()
+        self.assertEqual([card['id'] for card in previous['messages']], [card['id'] for card in first['messages']])
+
+    def test_page_of_recent_messages_skips_the_archive(self):
+        self.archive()
+        self.client.get(reverse('message_list'))
+        # Only the cached position of the newest archived message is consulted.
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('message_list'))
+        self.assertFalse([q for q in queries if 'messaging_archived' in q['sql']])
+
+    def test_earlier_replies_of_an_archived_message(self):
+        self.archive()
+        page = archive.as_messages([ArchivedMessage.objects.get(pk=self.old[0].pk)])[0]
+        self.assertEqual([reply.text for reply in page.latest_replies], ['old reply 1', 'old reply 2', 'old reply 3'])
+        data = self.client.get(
+            reverse('message_replies', args=[self.old[0].pk]), {'cursor': page.more_replies_cursor}
+        ).json()
+        self.assertEqual(len(data['replies']), 1)
+        self.assertIn('old reply 0', data['replies'][0]['html'])
+
+    def test_search_and_profile_include_archived_messages(self):
+        stats = user_stats(self.author.pk)
+        self.archive()
+        cache.clear()
+        self.assertEqual(user_stats(self.author.pk), stats)
+
+        response = self.client.get(reverse('message_list'), {'q': 'ancient scroll'})
+        self.assertEqual([message.pk for message in response.context['messages']], [m.pk for m in self.old])
+        response = self.client.get(reverse('message_list'), {'q': 'scroll', 'sort': 'relevance'})
+        self.assertEqual(len(response.context['messages']), 5)
+
+        first = self.client.get(reverse('profile', args=['historian'])).content.decode()
+        cursor = re.search(r'\?cursor=([\w-]+)', first).group(1)
+        second = self.client.get(reverse('profile', args=['historian']), {'cursor': cursor})
+        self.assertContains(second, 'ancient scroll 4')
+        self.assertContains(second, 'Archived', count=5)
+
+    def test_feed_keeps_archived_cards(self):
+        self.archive()
+        data = self.client.get(reverse('message_feed'), {'ids': f'{self.old[0].pk},999999'}).json()
+        self.assertEqual(data['deleted'], [999999])
+
+
+class RetryOnLockTests(SimpleTestCase):
+    def failing(self, failures, error='database is locked'):
+        calls = []
+
+        @retry_on_lock
+        def write():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise OperationalError(error)
+            return 'done'
+        return write, calls
+
+    @override_settings(MESSAGING_DB_RETRY_BACKOFF=0)
+    def test_retries_locked_writes(self):
+        write, calls = self.failing(2)
+        self.assertEqual(write(), 'done')
+        self.assertEqual(len(calls), 3)
+
+    @override_settings(MESSAGING_DB_RETRY_ATTEMPTS=2, MESSAGING_DB_RETRY_BACKOFF=0)
+    def test_gives_up_after_the_last_attempt(self):
+        write, calls = self.failing(5)
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 2)
+
+    def test_other_errors_are_not_retried(self):
+        write, calls = self.failing(1, error='no such table: x')
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 1)
+
+
+class ReactionSummaryMigrationTests(TransactionTestCase):
+    before = [('messaging', '0011_task_position')]
+    after = [('messaging', '0012_reaction_summary')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_counts_survive_a_round_trip(self):
+        apps = self.migrate(self.before)
+        author = apps.get_model('auth', 'User').objects.create(username='migrated')
+        Message = apps.get_model('messaging', 'Message')
+        reacted = Message.objects.create(text='reacted', author=author, like_count=3, fire_count=1, angry_count=2)
+        quiet = Message.objects.create(text='quiet', author=author)
+
+        apps = self.migrate(self.after)
+        Message = apps.get_model('messaging', 'Message')
+        counts = apps.get_model('messaging', 'MessageReactionCount').objects.order_by('reaction_type')
+        self.assertEqual(
+            list(counts.values_list('message_id', 'reaction_type', 'count')),
+            [(reacted.pk, 'angry', 2), (reacted.pk, 'fire', 1), (reacted.pk, 'like', 3)],
+        )
+        self.assertEqual(
+            dict(Message.objects.values_list('pk', 'reaction_total')), {reacted.pk: 6, quiet.pk: 0}
+        )
+
+        apps = self.migrate(self.before)
+        fields = ['like_count', 'laugh_count', 'sad_count', 'fire_count', 'thumbs_up_count', 'angry_count']
+        self.assertEqual(
+            {pk: tuple(counts) for pk, *counts in apps.get_model('messaging', 'Message').objects.values_list('pk', *fields)},
+            {reacted.pk: (3, 0, 0, 1, 0, 2), quiet.pk: (0, 0, 0, 0, 0, 0)},
+        )
+
+
+class ConcurrentReactTests(TransactionTestCase):
+    THREADS = 8
+    CLICKS_PER_THREAD = 15
+
+    # The in-memory test database refuses concurrent writers instead of
+    # waiting on the busy timeout, so lean on the lock retries.
+    @override_settings(MESSAGING_DB_RETRY_ATTEMPTS=100, MESSAGING_DB_RETRY_BACKOFF=0.002)
+    def test_parallel_reactions_match_reaction_rows(self):
+        author = User.objects.create_user('author')
+        message = Message.objects.create(text='Hot message', author=author)
+        users = [User.objects.create_user(f'user{i}') for i in range(self.THREADS)]
+        errors = []
+
+        def click(user, seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(self.CLICKS_PER_THREAD):
+                    toggle_reaction(user, message.id, rng.choice(reaction_types.names()))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=click, args=(user, i)) for i, user in enumerate(users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        message.refresh_from_db()
+        expected = dict(Reaction.objects.filter(message=message).values_list('reaction_type').annotate(n=Count('id')))
+        for reaction_type, count in message.reaction_counts().items():
+            self.assertEqual(count, expected.get(reaction_type, 0), reaction_type)
+        self.assertEqual(message.reaction_total, sum(expected.values()))
@@ -0,0 +1,61 @@
+"""Retrying write transactions that lose the race for the SQLite write lock.
+
+SQLite allows one writer at a time. With ``transaction_mode = IMMEDIATE`` a
+writer waits up to the busy timeout for the lock; if it still cannot get it
+the write fails with "database is locked". ``retry_on_lock`` runs the whole
+transaction again after a short randomized backoff.
+"""
+import functools
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ATTEMPTS = 5
+DEFAULT_BACKOFF = 0.05
+MAX_BACKOFF = 1.0
+
+
+def is_lock_error(exc):
+    message = str(exc)
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+def retry_on_lock(func):
+    """Retry ``func`` when it fails to get the database write lock.
+
+    ``func`` must run its own transaction (or single write) so a retry
+    starts from scratch. Inside an outer ``atomic`` block the error is
+    re-raised, since only the outermost transaction can be retried.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        attempts = getattr(settings, 'MESSAGING_DB_RETRY_ATTEMPTS', DEFAULT_ATTEMPTS)
+        backoff = getattr(settings, 'MESSAGING_DB_RETRY_BACKOFF', DEFAULT_BACKOFF)
+        for attempt in range(attempts):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if (not is_lock_error(exc) or attempt == attempts - 1
+                        or transaction.get_connection().in_atomic_block):
+                    raise
+                delay = min(backoff * 2 ** attempt, MAX_BACKOFF) * random.uniform(0.5, 1.5)
+                logger.info('%s hit a locked database, retrying in %.3fs', func.__qualname__, delay)
+                time.sleep(delay)
+    return wrapper
+
+
+@retry_on_lock
+def atomic_save(instance, **kwargs):
+    """Save ``instance`` together with the writes of its signal handlers."""
+    with transaction.atomic():
+        instance.save(**kwargs)
+
+
+@retry_on_lock
+def atomic_delete(instance):
+    return instance.delete()
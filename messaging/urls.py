@@ -4,8 +4,13 @@ from . import views
 
 urlpatterns = [
     path('', views.message_list, name='message_list'),
+    path('page/', views.message_page, name='message_page'),
+    path('feed/', views.message_feed, name='message_feed'),
+    path('events/', views.message_events, name='message_events'),
+    path('sw.js', views.service_worker, name='service_worker'),
     path('add/', views.add_message, name='add_message'),
     path('<int:message_id>/reply/', views.add_reply, name='add_reply'),
+    path('<int:message_id>/replies/', views.message_replies, name='message_replies'),
     path('react/<int:message_id>/<str:reaction_type>/', views.react, name='react'),
     path('<int:message_id>/delete/', views.delete_message, name='delete_message'),
     path('profile/', views.profile, name='profile'),
@@ -17,6 +22,7 @@ urlpatterns = [
     # Task URLs
     path('tasks/', views.task_list, name='task_list'),
     path('tasks/add/', views.add_task, name='add_task'),
+    path('tasks/bulk/', views.bulk_tasks, name='bulk_tasks'),
     path('tasks/<int:task_id>/edit/', views.edit_task, name='edit_task'),
     path('tasks/<int:task_id>/delete/', views.delete_task, name='delete_task'),
     path('tasks/<int:task_id>/update-status/', views.update_task_status, name='update_task_status'),
@@ -1,40 +1,183 @@
-from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
-from django.contrib.auth import login, authenticate
+import hashlib
+import json
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
+from django.templatetags.static import static
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.contrib.auth import get_user_model, login, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.db.models import Q
-from django.utils import timezone
-from .models import Message, Reaction, Task
+from django.views.decorators.http import condition, require_GET, require_POST
+from . import archive, events, reaction_types, search
+from .caching import acached_count, adjust_count, bump_version, get_version, is_shared
+from .counters import aattach_reaction_counts, attach_reaction_counts
+from .models import ArchivedMessage, Message, Reaction, Task
 from .forms import MessageForm, ReplyForm, SignUpForm, TaskForm
+from .fragments import invalidate_card, render_cards, shared_cards
+from .pagination import InvalidCursor, KeysetPage, KeysetPaginator
+from .reactions import toggle_reaction
+from .replies import reply_paginator, save_reply
+from .stats import adjust_user_stats, auser_stats
+from .tasks import TASK_ORDERING, BulkTaskError, astatus_counts, bulk_update_tasks, invalidate_task_counts
+from .transactions import atomic_delete, atomic_save
 
-@login_required
-def message_list(request):
+MESSAGES_PER_PAGE = 10
+RELEVANCE_LIMIT = 50
+
+async def _resolve_user(request):
+    # Templates read request.user through the auth context processor; a lazy
+    # user would query the database synchronously from the event loop.
+    request.user = await request.auser()
+    return request.user
+
+async def _message_page(request):
+    user = await _resolve_user(request)
     query = request.GET.get('q', '')
-    messages_list = Message.objects.all().order_by('-timestamp')
+    messages_list = Message.objects.select_related('author')
+    archived = ArchivedMessage.objects.all()
 
-    if query:
-        messages_list = messages_list.filter(
-            Q(text__icontains=query) | Q(author__username__icontains=query)
-        )
+    if query and request.GET.get('sort') == 'relevance':
+        # Best matches first; ranked results are a single page.
+        ids = await sync_to_async(search.ranked_message_ids)(query, RELEVANCE_LIMIT)
+        by_id = await messages_list.ain_bulk(ids)
+        found = [by_id[message_id] for message_id in ids if message_id in by_id]
+        if len(found) < RELEVANCE_LIMIT:
+            # The archive is not ranked; its matches follow, newest first.
+            matches = archive.filter_archived(archived, query).order_by(*archive.ARCHIVE_ORDERING)
+            found += await sync_to_async(archive.as_messages)(
+                [row async for row in matches[:RELEVANCE_LIMIT - len(found)]]
+            )
+        page = KeysetPage(found)
+    else:
+        if query:
+            messages_list = await sync_to_async(search.filter_messages)(messages_list, query)
+            archived = archive.filter_archived(archived, query)
+        paginator = archive.ReadThroughPaginator(messages_list, archived, MESSAGES_PER_PAGE)
+        page = await paginator.aget_page(request.GET.get('cursor'))
 
-    paginator = Paginator(messages_list, 10)  # Show 10 messages per page
-    page_number = request.GET.get('page')
-    messages = paginator.get_page(page_number)
+    user_reactions = {
+        message_id: reaction_type
+        async for message_id, reaction_type in Reaction.objects.filter(
+            user=user, message_id__in=[message.id for message in page]
+        ).values_list('message_id', 'reaction_type')
+    }
+    return page, query, user_reactions
+
+def _render_message_cards(request, messages, user_reactions):
+    return [
+        {'id': message.id, 'html': html}
+        for message, html in render_cards(messages, request.user, user_reactions)
+    ]
 
-    user_reactions = {}
-    for message in messages:
-        reaction = Reaction.objects.filter(user=request.user, message=message).first()
-        if reaction:
-            user_reactions[message.id] = reaction.reaction_type
+@login_required
+async def message_list(request):
+    page, query, user_reactions = await _message_page(request)
 
     return render(request, 'messaging/message_list.html', {
-        'messages': messages,
+        'messages': page,
+        # Cards missing from the cache are rendered with their replies.
+        'cards': [html for _, html in await sync_to_async(render_cards)(page, request.user, user_reactions)],
         'user_reactions': user_reactions,
-        'query': query
+        'query': query,
+        # Searches are not counted at all; the wall total is a cached
+        # approximation kept current by add/delete, archived messages included.
+        'message_total': None if query else (
+            await acached_count('messages', Message.objects.all())
+            + await acached_count('archived-messages', ArchivedMessage.objects.all())
+        ),
+    })
+
+@login_required
+async def message_page(request):
+    """JSON page of rendered cards for infinite-scroll clients."""
+    page, query, user_reactions = await _message_page(request)
+    return JsonResponse({
+        'messages': await sync_to_async(_render_message_cards)(request, page, user_reactions),
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+FEED_LIMIT = 50
+FEED_MAX_IDS = 200
+
+def _parse_ids(value):
+    ids = []
+    for part in value.split(','):
+        if part.isdigit():
+            ids.append(int(part))
+    return ids[:FEED_MAX_IDS]
+
+def _feed_etag(request):
+    # Everything the feed returns is derived from the board version, the
+    # viewer and the query string, so the ETag is computed without touching
+    # the database. Every write bumps the version, but only in the worker
+    # that made it unless the cache is shared; without one there is no ETag
+    # and every poll gets a full answer.
+    if not is_shared():
+        return None
+    digest = hashlib.md5(request.GET.urlencode().encode()).hexdigest()
+    return f'{get_version("board")}-{request.user.pk}-{digest}'
+
+@login_required
+@require_GET
+@condition(etag_func=_feed_etag)
+def message_feed(request):
+    """Return messages newer than ``since`` plus current counts for ``ids``.
+
+    New messages come oldest first, at most ``FEED_LIMIT`` of them, and
+    ``latest_id`` is the last one returned; a client that fell further
+    behind catches up over the following polls instead of skipping ahead.
+    """
+    query = request.GET.get('q', '')
+    since = request.GET.get('since', '')
+    since_id = int(since) if since.isdigit() else 0
+    held_ids = _parse_ids(request.GET.get('ids', ''))
+
+    new_messages = Message.objects.select_related('author').filter(id__gt=since_id).order_by('id')
+    if query:
+        new_messages = search.filter_messages(new_messages, query)
+    new_messages = list(new_messages[:FEED_LIMIT])
+
+    held_messages = list(Message.objects.filter(id__in=held_ids).only('id', 'reaction_total'))
+    attach_reaction_counts(held_messages)
+    reactions = {message.id: message.reaction_counts() for message in held_messages}
+    missing = set(held_ids) - set(reactions)
+    if missing:
+        # Archived cards stay on the page; their counts no longer change.
+        missing -= set(ArchivedMessage.objects.filter(id__in=missing).values_list('id', flat=True))
+    deleted = sorted(missing)
+
+    user_reactions = dict(
+        Reaction.objects.filter(user=request.user, message_id__in=[m.id for m in new_messages])
+        .values_list('message_id', 'reaction_type')
+    )
+    return JsonResponse({
+        'latest_id': new_messages[-1].id if new_messages else since_id,
+        'messages': _render_message_cards(request, new_messages, user_reactions),
+        'reactions': reactions,
+        'deleted': deleted,
     })
 
+@login_required
+async def message_events(request):
+    """Server-Sent Events stream of wall changes.
+
+    Only served under ASGI; a WSGI worker would be tied up for the lifetime of
+    the connection, so there the client is told to fall back to polling.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(events.stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @login_required
 def add_message(request):
     if request.method == 'POST':
@@ -42,7 +185,16 @@ def add_message(request):
         if form.is_valid():
             message = form.save(commit=False)
             message.author = request.user
-            message.save()
+            atomic_save(message)
+            bump_version('board')
+            adjust_count('messages', 1)
+            adjust_user_stats(request.user.pk, messages=1)
+            events.publish(
+                'message.created',
+                id=message.id,
+                author=request.user.username,
+                html=shared_cards([message])[message.id],
+            )
             messages.success(request, 'Your message has been posted successfully!')
             return redirect('message_list')
     else:
@@ -58,50 +210,102 @@ def add_reply(request, message_id):
             reply = form.save(commit=False)
             reply.message = message
             reply.author = request.user
-            reply.save()
+            save_reply(reply)
+            bump_version('board')
+            invalidate_card(message.id)
+            events.publish(
+                'reply.created',
+                id=reply.id,
+                message_id=message.id,
+                author=request.user.username,
+                text=reply.text,
+                emoji=reply.emoji,
+                html=render_to_string('messaging/includes/reply.html', {'reply': reply}),
+            )
             return redirect('message_list')
     else:
         form = ReplyForm()
     return render(request, 'messaging/add_reply.html', {'form': form, 'message': message})
 
+@login_required
+@require_GET
+def message_replies(request, message_id):
+    """JSON page of a message's older replies, newest first, for the wall's "show earlier" button."""
+    if Message.objects.filter(pk=message_id).exists():
+        paginator, replies = reply_paginator(message_id), list
+    elif ArchivedMessage.objects.filter(pk=message_id).exists():
+        paginator, replies = archive.archived_reply_paginator(message_id), archive.as_replies
+    else:
+        raise Http404('No Message matches the given query.')
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    return JsonResponse({
+        'replies': [
+            {'id': reply.id, 'html': render_to_string('messaging/includes/reply.html', {'reply': reply})}
+            for reply in replies(page.object_list)
+        ],
+        'next': page.next_cursor,
+    })
+
 @login_required
 def react(request, message_id, reaction_type):
-    valid_reactions = ['like', 'laugh', 'sad', 'fire', 'thumbs_up', 'angry']
-    if reaction_type not in valid_reactions:
+    if reaction_types.get(reaction_type) is None:
         return JsonResponse({'error': 'Invalid reaction type'}, status=400)
 
     if request.method == 'POST':
-        message = get_object_or_404(Message, id=message_id)
-        existing_reaction = Reaction.objects.filter(user=request.user, message=message).first()
-        if existing_reaction:
-            if existing_reaction.reaction_type == reaction_type:
-                # If same reaction, do nothing (or toggle off, but template doesn't support toggle)
-                return JsonResponse({'count': getattr(message, f'{reaction_type}_count')})
-            else:
-                # Change reaction: decrement old, increment new
-                old_type = existing_reaction.reaction_type
-                setattr(message, f'{old_type}_count', getattr(message, f'{old_type}_count') - 1)
-                setattr(message, f'{reaction_type}_count', getattr(message, f'{reaction_type}_count') + 1)
-                existing_reaction.reaction_type = reaction_type
-                existing_reaction.save()
-        else:
-            # New reaction
-            setattr(message, f'{reaction_type}_count', getattr(message, f'{reaction_type}_count') + 1)
-            Reaction.objects.create(user=request.user, message=message, reaction_type=reaction_type)
-        message.save()
-        return JsonResponse({'count': getattr(message, f'{reaction_type}_count')})
+        try:
+            counts, active = toggle_reaction(request.user, message_id, reaction_type)
+        except Message.DoesNotExist:
+            raise Http404('No Message matches the given query.')
+        bump_version('board')
+        invalidate_card(message_id)
+        events.publish('reaction.updated', message_id=message_id, counts=counts)
+        return JsonResponse({'count': counts[reaction_type], 'active': active, 'counts': counts})
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
 @login_required
 def delete_message(request, message_id):
     message = get_object_or_404(Message, id=message_id)
     if message.author == request.user:
-        message.delete()
+        # Read before the delete cascades to the summary rows.
+        counts = message.reaction_counts()
+        atomic_delete(message)
+        bump_version('board')
+        invalidate_card(message_id)
+        adjust_count('messages', -1)
+        adjust_user_stats(request.user.pk, messages=-1, reactions={
+            reaction_type: -count for reaction_type, count in counts.items()
+        })
+        events.publish('message.deleted', id=message_id)
         messages.success(request, 'Message deleted successfully.')
     else:
         messages.error(request, 'You can only delete your own messages.')
     return redirect('message_list')
 
+# Precached by the service worker; every page needs them or links to them.
+SHELL_ASSETS = (
+    'css/theme.css', 'css/base.css', 'css/wall.css', 'css/tasks.css', 'css/profile.css',
+    'js/base.js', 'js/wall.js', 'js/tasks.js',
+    'manifest.json', 'favicon.ico', 'images/favicon.png', 'images/logo.svg',
+)
+
+@require_GET
+def service_worker(request):
+    """The service worker script, served from the root so its scope is the whole site."""
+    shell = [static(name) for name in SHELL_ASSETS]
+    response = render(request, 'messaging/sw.js', {
+        'shell_json': json.dumps(shell),
+        # A new deploy with changed assets gets a new cache name.
+        'version': hashlib.md5('\n'.join(shell).encode()).hexdigest()[:12],
+        'static_url': settings.STATIC_URL,
+    }, content_type='application/javascript')
+    # Browsers recheck the script on navigation; no-cache keeps HTTP
+    # caches from handing them an old one.
+    response['Cache-Control'] = 'no-cache'
+    return response
+
 def signup(request):
     if request.method == 'POST':
         form = SignUpForm(request.POST)
@@ -113,18 +317,26 @@ def signup(request):
         form = SignUpForm()
     return render(request, 'messaging/signup.html', {'form': form})
 
-@login_required
-def profile(request):
-    user_messages = Message.objects.filter(author=request.user).order_by('-timestamp')
-    total_messages = user_messages.count()
-    total_reactions = sum(message.like_count + message.laugh_count + message.sad_count + message.fire_count + message.thumbs_up_count + message.angry_count for message in user_messages)
+PROFILE_MESSAGES_PER_PAGE = 10
+PROFILE_CACHE_TIMEOUT = 60 * 10
 
-    context = {
+async def _profile_context(request, profile_user):
+    paginator = archive.ReadThroughPaginator(
+        Message.objects.filter(author=profile_user),
+        ArchivedMessage.objects.filter(author_id=profile_user.pk),
+        PROFILE_MESSAGES_PER_PAGE,
+    )
+    user_messages = await paginator.aget_page(request.GET.get('cursor'))
+    await aattach_reaction_counts(user_messages.object_list)
+    stats = await auser_stats(profile_user.pk)
+    return {
+        'user_profile': profile_user,
         'user_messages': user_messages,
-        'total_messages': total_messages,
-        'total_reactions': total_reactions,
+        'stats': stats,
+        'total_messages': stats['messages'],
+        'message_count': stats['messages'],
+        'total_reactions': stats['total_reactions'],
     }
-    return render(request, 'messaging/profile.html', context)
 
 def login_view(request):
     if request.method == 'POST':
@@ -138,47 +350,88 @@ def login_view(request):
             messages.error(request, 'Invalid username or password.')
     return render(request, 'messaging/login.html')
 
-@login_required
-def profile(request, username):
-    from django.contrib.auth import get_user_model
+async def _profile_user_id(username):
+    """Resolve a username to a user id, remembering the answer in a shared cache."""
     User = get_user_model()
-    user_profile = get_object_or_404(User, username=username)
-    user_messages = Message.objects.filter(author=user_profile).order_by('-timestamp')
-    
-    # Calculate message count
-    message_count = user_messages.count()
-    
-    # Calculate total reactions on all messages
-    total_reactions = 0
-    for message in user_messages:
-        total_reactions += message.fire_count
-        total_reactions += message.laugh_count
-        total_reactions += message.like_count
-        total_reactions += message.sad_count
-        total_reactions += message.thumbs_up_count
-        total_reactions += message.angry_count
-    
+    if not is_shared():
+        return (await aget_object_or_404(User.objects.only('id'), username=username)).pk
+    key = f'messaging:user-id:{username}'
+    user_id = await cache.aget(key)
+    if user_id is None:
+        user_id = (await aget_object_or_404(User.objects.only('id'), username=username)).pk
+        await cache.aset(key, user_id, PROFILE_CACHE_TIMEOUT)
+    return user_id
+
+
+def _profile_cache_key(user_id, is_owner, cursor):
+    # The version is bumped whenever the user's messages or the reactions on
+    # them change, so old fragments simply stop being looked up.
+    version = get_version(f'profile:{user_id}')
+    digest = hashlib.md5((cursor or '').encode()).hexdigest()
+    return f'messaging:profile:{user_id}:{version}:{int(is_owner)}:{digest}'
+
+
+@login_required
+async def profile(request, username=None):
+    """Show a user's profile; ``/profile/`` shows the signed-in user's own.
+
+    With a shared cache the rendered profile body is cached per user, page
+    and viewer role, so repeat views of a profile skip the database entirely
+    until that user posts, deletes a message or receives a reaction.
+    """
+    user = await _resolve_user(request)
+    if username is None or username == user.username:
+        user_id, username = user.pk, user.username
+    else:
+        user_id = await _profile_user_id(username)
+    is_owner = user_id == user.pk
+    cursor = request.GET.get('cursor')
+
+    # The version is only bumped in the worker that handled the change, so
+    # with the per-process cache the body is rendered every time.
+    key = _profile_cache_key(user_id, is_owner, cursor) if is_shared() else None
+    profile_html = await cache.aget(key) if key else None
+    if profile_html is None:
+        User = get_user_model()
+        profile_user = user if is_owner else await aget_object_or_404(User, pk=user_id)
+        context = await _profile_context(request, profile_user)
+        context['is_owner'] = is_owner
+        profile_html = render_to_string('messaging/includes/profile_content.html', context)
+        if key:
+            await cache.aset(key, profile_html, PROFILE_CACHE_TIMEOUT)
+
     return render(request, 'messaging/profile.html', {
-        'user_profile': user_profile, 
-        'user_messages': user_messages,
-        'message_count': message_count,
-        'total_reactions': total_reactions
+        'profile_username': username,
+        'profile_html': profile_html,
     })
 
 
 # Task Management Views
+TASKS_PER_PAGE = 20
+
 @login_required
-def task_list(request):
+async def task_list(request):
+    await _resolve_user(request)
     status_filter = request.GET.get('status', '')
-    tasks = Task.objects.all().order_by('-created_at')
-    
+    query = request.GET.get('q', '').strip()
+    tasks = Task.objects.all()
+
+    if query:
+        tasks = tasks.filter(Q(title__icontains=query) | Q(description__icontains=query))
+    # Counts ignore the status filter so every status button shows its own.
+    counts = await astatus_counts(tasks if query else None)
     if status_filter:
         tasks = tasks.filter(status=status_filter)
+    page = await KeysetPaginator(tasks, TASKS_PER_PAGE, ordering=TASK_ORDERING).aget_page(request.GET.get('cursor'))
     
     context = {
-        'tasks': tasks,
+        'tasks': page,
         'status_filter': status_filter,
-        'status_choices': Task.STATUS_CHOICES
+        'query': query,
+        'status_choices': [(value, label, counts[value]) for value, label in Task.STATUS_CHOICES],
+        'task_total': sum(counts.values()),
+        # Positions are board-wide, so only a complete, unfiltered board can be reordered.
+        'reorderable': not (status_filter or query or page.has_other_pages()),
     }
     return render(request, 'messaging/task_list.html', context)
 
@@ -189,6 +442,7 @@ def add_task(request):
         form = TaskForm(request.POST)
         if form.is_valid():
             task = form.save()
+            invalidate_task_counts()
             messages.success(request, f"'{task.title}' görev başarıyla oluşturuldu!")
             return redirect('task_list')
     else:
@@ -203,6 +457,7 @@ def edit_task(request, task_id):
         form = TaskForm(request.POST, instance=task)
         if form.is_valid():
             task = form.save()
+            invalidate_task_counts()
             messages.success(request, f"'{task.title}' görev başarıyla güncellendi!")
             return redirect('task_list')
     else:
@@ -215,6 +470,7 @@ def delete_task(request, task_id):
     task = get_object_or_404(Task, id=task_id)
     task_title = task.title
     task.delete()
+    invalidate_task_counts()
     messages.success(request, f"'{task_title}' görev başarıyla silindi!")
     return redirect('task_list')
 
@@ -222,14 +478,32 @@ def delete_task(request, task_id):
 @login_required
 def update_task_status(request, task_id):
     if request.method == 'POST':
-        task = get_object_or_404(Task, id=task_id)
         new_status = request.POST.get('status')
         
         if new_status in dict(Task.STATUS_CHOICES):
-            task.status = new_status
-            if new_status == 'completed':
-                task.completed_at = timezone.now()
-            task.save()
-            return JsonResponse({'success': True, 'status': task.get_status_display()})
+            if not bulk_update_tasks([task_id], 'status', new_status):
+                raise Http404('No Task matches the given query.')
+            return JsonResponse({'success': True, 'status': dict(Task.STATUS_CHOICES)[new_status]})
     
     return JsonResponse({'success': False}, status=400)
+
+
+@login_required
+@require_POST
+def bulk_tasks(request):
+    """Apply one operation to many tasks.
+
+    The JSON body is ``{"operation": "status" | "delete" | "reorder", "ids": [...]}``
+    plus ``"status"`` for status changes; reorder takes the ids in board order.
+    """
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'The body must be JSON.'}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({'error': 'The body must be a JSON object.'}, status=400)
+    try:
+        count = bulk_update_tasks(payload.get('ids'), payload.get('operation'), payload.get('status'))
+    except BulkTaskError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'operation': payload['operation'], 'count': count})